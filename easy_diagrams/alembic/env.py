@@ -5,9 +5,9 @@ import os
 from pyramid.paster import get_appsettings
 from pyramid.paster import setup_logging
 from pyramid_auto_env import replace as replace_env_vars
-from sqlalchemy import engine_from_config
 
 from alembic import context
+from easy_diagrams.models import get_engine
 from easy_diagrams.models.meta import Base
 
 # `autoenv_settings`` for overwriting configuration by using environment
@@ -57,7 +57,7 @@ def run_migrations_online():
     and associate a connection with the context.
 
     """
-    engine = engine_from_config(get_settings(), prefix="sqlalchemy.")
+    engine = get_engine(get_settings())
 
     connection = engine.connect()
     context.configure(connection=connection, target_metadata=Base.metadata)
@@ -0,0 +1,53 @@
+"""add folder_counters table
+
+Revision ID: 2c7f9e1b4d63
+Revises: 9d4a6c1e3f58
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "2c7f9e1b4d63"
+down_revision = "9d4a6c1e3f58"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "folder_counters",
+        sa.Column("organization_id", sa.UUID(), nullable=False),
+        sa.Column("folder_id", sa.String(length=32), nullable=False),
+        sa.Column("folders", sa.Integer(), nullable=False),
+        sa.Column("diagrams", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["organization_id"],
+            ["organizations.id"],
+            name=op.f("fk_folder_counters_organization_id_organizations"),
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint(
+            "organization_id", "folder_id", name=op.f("pk_folder_counters")
+        ),
+    )
+    op.execute(
+        "INSERT INTO folder_counters (organization_id, folder_id, folders, diagrams)"
+        " SELECT organization_id, folder_id,"
+        " count(*) FILTER (WHERE kind = 'folder'),"
+        " count(*) FILTER (WHERE kind = 'diagram')"
+        " FROM ("
+        "  SELECT organization_id, coalesce(parent_id, '') AS folder_id,"
+        "  'folder' AS kind FROM folders"
+        "  UNION ALL"
+        "  SELECT organization_id, coalesce(folder_id, ''), 'diagram' FROM diagrams"
+        " ) AS items"
+        " GROUP BY organization_id, folder_id"
+    )
+
+
+def downgrade():
+    op.drop_table("folder_counters")
@@ -0,0 +1,49 @@
+"""add diagram_renders table for renders in non-default formats
+
+Revision ID: 5b8e2f4c7a10
+Revises: a3c1e7d90b21
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5b8e2f4c7a10"
+down_revision = "a3c1e7d90b21"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 76af1c6ef833 recreated diagrams.id without its primary key, which the
+    # foreign keys of the renders, and of the symbols later on, reference
+    if not sa.inspect(op.get_bind()).get_pk_constraint("diagrams")[
+        "constrained_columns"
+    ]:
+        op.create_primary_key(op.f("pk_diagrams"), "diagrams", ["id"])
+    op.create_table(
+        "diagram_renders",
+        sa.Column("diagram_id", sa.String(length=32), nullable=False),
+        sa.Column("format", sa.String(length=8), nullable=False),
+        sa.Column("version", sa.BigInteger(), nullable=False),
+        sa.Column("image", postgresql.BYTEA(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["diagram_id"],
+            ["diagrams.id"],
+            name=op.f("fk_diagram_renders_diagram_id_diagrams"),
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint(
+            "diagram_id", "format", "version", name=op.f("pk_diagram_renders")
+        ),
+    )
+    op.execute("ALTER TABLE diagram_renders ALTER COLUMN image SET COMPRESSION lz4")
+
+
+def downgrade():
+    op.drop_table("diagram_renders")
@@ -0,0 +1,85 @@
+"""add composite listing indexes of diagrams and folders
+
+Revision ID: 7e3a5d2c9f14
+Revises: 2c7f9e1b4d63
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "7e3a5d2c9f14"
+down_revision = "2c7f9e1b4d63"
+branch_labels = None
+depends_on = None
+
+LISTING_INDEXES = {
+    "ix_diagrams_listing": (
+        "ON diagrams (organization_id, folder_id, updated_at DESC, id DESC)"
+        " INCLUDE (title, is_public, created_at)"
+    ),
+    "ix_diagrams_listing_root": (
+        "ON diagrams (organization_id, updated_at DESC, id DESC)"
+        " INCLUDE (title, is_public, created_at) WHERE folder_id IS NULL"
+    ),
+    "ix_folders_listing": (
+        "ON folders (organization_id, parent_id, name, id)"
+        " INCLUDE (created_at, updated_at)"
+    ),
+    "ix_folders_listing_root": (
+        "ON folders (organization_id, name, id)"
+        " INCLUDE (created_at, updated_at) WHERE parent_id IS NULL"
+    ),
+}
+
+#: Indexes covered by the listing indexes. The ones on ``diagrams.folder_id``
+#: and ``folders.parent_id`` are kept for the foreign key lookups.
+REDUNDANT_INDEXES = {
+    "ix_diagrams_organization_id": "ON diagrams (organization_id)",
+    "ix_diagrams_updated_at": "ON diagrams (updated_at)",
+    "ix_folders_organization_id": "ON folders (organization_id)",
+    "ix_folders_name": "ON folders (name)",
+}
+
+
+def _invalid_indexes(connection, names):
+    return connection.scalars(
+        sa.text(
+            "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid"
+            " WHERE c.relname = ANY(:names) AND NOT (i.indisvalid AND i.indisready)"
+        ),
+        {"names": list(names)},
+    ).all()
+
+
+def _create_concurrently(connection, indexes):
+    # a failed concurrent build leaves an invalid index behind, which is
+    # dropped so that running the migration again rebuilds it
+    for name in _invalid_indexes(connection, indexes):
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    for name, definition in indexes.items():
+        op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}")
+    invalid = _invalid_indexes(connection, indexes)
+    if invalid:
+        raise RuntimeError(f"Indexes {', '.join(invalid)} were not built")
+
+
+def upgrade():
+    connection = op.get_bind()
+    # building without locking the tables for writes, which is only possible
+    # outside of a transaction
+    with op.get_context().autocommit_block():
+        _create_concurrently(connection, LISTING_INDEXES)
+        for name in REDUNDANT_INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def downgrade():
+    connection = op.get_bind()
+    with op.get_context().autocommit_block():
+        _create_concurrently(connection, REDUNDANT_INDEXES)
+        for name in LISTING_INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
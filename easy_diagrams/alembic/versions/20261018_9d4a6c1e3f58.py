@@ -0,0 +1,85 @@
+"""move diagram images to the diagram_renders table
+
+The primary key of diagram_renders changes from (diagram_id, format, version)
+to (diagram_id, format). Only the render of the newest code version of a
+format is served, and the older ones were deleted on every store already, so
+a single row per format is kept and replaced by newer versions, see
+``store_render`` in ``easy_diagrams.services.diagram_repo``.
+
+Revision ID: 9d4a6c1e3f58
+Revises: 5b8e2f4c7a10
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9d4a6c1e3f58"
+down_revision = "5b8e2f4c7a10"
+branch_labels = None
+depends_on = None
+
+#: Number of diagrams copied per transaction
+BATCH_SIZE = 500
+
+
+def upgrade():
+    # keeping a single render per diagram and format
+    op.execute(
+        "DELETE FROM diagram_renders r USING diagram_renders n"
+        " WHERE n.diagram_id = r.diagram_id AND n.format = r.format"
+        " AND n.version > r.version"
+    )
+    op.drop_constraint("pk_diagram_renders", "diagram_renders", type_="primary")
+    op.create_primary_key(
+        "pk_diagram_renders", "diagram_renders", ["diagram_id", "format"]
+    )
+
+    # copying the images in batches, each committed separately, so that the
+    # table isn't locked for the whole copy and an interrupted backfill can be
+    # resumed by running the migration again
+    connection = op.get_bind()
+    with op.get_context().autocommit_block():
+        last_id = ""
+        while True:
+            ids = connection.scalars(
+                sa.text(
+                    "SELECT id FROM diagrams WHERE id > :last_id"
+                    " ORDER BY id LIMIT :batch_size"
+                ),
+                {"last_id": last_id, "batch_size": BATCH_SIZE},
+            ).all()
+            if not ids:
+                break
+            connection.execute(
+                sa.text(
+                    "INSERT INTO diagram_renders"
+                    " (diagram_id, format, version, image, created_at)"
+                    " SELECT id, 'png', image_version, image, updated_at"
+                    " FROM diagrams WHERE id = ANY(:ids)"
+                    " AND image IS NOT NULL AND image_version IS NOT NULL"
+                    " ON CONFLICT (diagram_id, format) DO NOTHING"
+                ),
+                {"ids": ids},
+            )
+            last_id = ids[-1]
+
+    op.drop_column("diagrams", "image")
+
+
+def downgrade():
+    op.add_column("diagrams", sa.Column("image", postgresql.BYTEA(), nullable=True))
+    op.execute("ALTER TABLE diagrams ALTER COLUMN image SET COMPRESSION lz4")
+    op.execute(
+        "UPDATE diagrams SET image = r.image FROM diagram_renders r"
+        " WHERE r.diagram_id = diagrams.id AND r.format = 'png'"
+    )
+    op.execute("DELETE FROM diagram_renders WHERE format = 'png'")
+    op.drop_constraint("pk_diagram_renders", "diagram_renders", type_="primary")
+    op.create_primary_key(
+        "pk_diagram_renders", "diagram_renders", ["diagram_id", "format", "version"]
+    )
@@ -0,0 +1,32 @@
+"""add partial index of diagrams waiting for a render
+
+Revision ID: a3c1e7d90b21
+Revises: 164500
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "a3c1e7d90b21"
+down_revision = "164500"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_diagrams_pending_render",
+        "diagrams",
+        ["updated_at"],
+        postgresql_where=sa.text(
+            "code_version IS NOT NULL AND image_version IS DISTINCT FROM code_version"
+        ),
+    )
+
+
+def downgrade():
+    op.drop_index("ix_diagrams_pending_render", table_name="diagrams")
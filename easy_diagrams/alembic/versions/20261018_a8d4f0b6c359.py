@@ -0,0 +1,86 @@
+"""add the trash of diagrams
+
+Revision ID: a8d4f0b6c359
+Revises: f7c3e9a5b248
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "a8d4f0b6c359"
+down_revision = "f7c3e9a5b248"
+branch_labels = None
+depends_on = None
+
+LISTING_INDEXES = {
+    "ix_diagrams_listing": (
+        "ON diagrams (organization_id, folder_id, updated_at DESC, id DESC)"
+        " INCLUDE (title, is_public, created_at)"
+    ),
+    "ix_diagrams_listing_root": (
+        "ON diagrams (organization_id, updated_at DESC, id DESC)"
+        " INCLUDE (title, is_public, created_at) WHERE folder_id IS NULL"
+    ),
+    "ix_diagrams_kind": (
+        "ON diagrams (organization_id, kind, updated_at DESC, id DESC)"
+        " WHERE kind IS NOT NULL"
+    ),
+}
+LIVE_LISTING_INDEXES = {
+    "ix_diagrams_listing": (
+        "ON diagrams (organization_id, folder_id, updated_at DESC, id DESC)"
+        " INCLUDE (title, is_public, created_at) WHERE deleted_at IS NULL"
+    ),
+    "ix_diagrams_listing_root": (
+        "ON diagrams (organization_id, updated_at DESC, id DESC)"
+        " INCLUDE (title, is_public, created_at)"
+        " WHERE folder_id IS NULL AND deleted_at IS NULL"
+    ),
+    "ix_diagrams_kind": (
+        "ON diagrams (organization_id, kind, updated_at DESC, id DESC)"
+        " WHERE kind IS NOT NULL AND deleted_at IS NULL"
+    ),
+}
+TRASH_INDEXES = {
+    "ix_diagrams_trash": (
+        "ON diagrams (organization_id, deleted_at DESC, id DESC)"
+        " INCLUDE (title) WHERE deleted_at IS NOT NULL"
+    ),
+    "ix_diagrams_deleted_at": "ON diagrams (deleted_at) WHERE deleted_at IS NOT NULL",
+}
+
+
+def _replace_concurrently(indexes):
+    # building the new index next to the old one, without locking the table
+    # for writes; a failed build leaves an invalid index behind, which is
+    # dropped so that running the migration again rebuilds it
+    for name, definition in indexes.items():
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}_new")
+        op.execute(f"CREATE INDEX CONCURRENTLY {name}_new {definition}")
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        op.execute(f"ALTER INDEX {name}_new RENAME TO {name}")
+
+
+def upgrade():
+    op.add_column("diagrams", sa.Column("deleted_at", sa.DateTime(), nullable=True))
+
+    # the listings skip the trashed diagrams, the trash and its purge are
+    # served by their own indexes
+    with op.get_context().autocommit_block():
+        _replace_concurrently(LIVE_LISTING_INDEXES)
+        for name, definition in TRASH_INDEXES.items():
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            op.execute(f"CREATE INDEX CONCURRENTLY {name} {definition}")
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name in TRASH_INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        _replace_concurrently(LISTING_INDEXES)
+    # the trashed diagrams reappear, `reconcile_counters` counts them again
+    op.drop_column("diagrams", "deleted_at")
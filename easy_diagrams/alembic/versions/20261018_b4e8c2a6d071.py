@@ -0,0 +1,71 @@
+"""add materialized path of folders
+
+Revision ID: b4e8c2a6d071
+Revises: 7e3a5d2c9f14
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b4e8c2a6d071"
+down_revision = "7e3a5d2c9f14"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "folders",
+        sa.Column("path", sa.String(collation="C"), nullable=False, server_default="/"),
+    )
+    # folders in cycles aren't reachable from the root, they are moved there
+    op.execute(
+        "WITH RECURSIVE tree (id) AS ("
+        "  SELECT id FROM folders WHERE parent_id IS NULL"
+        "  UNION ALL"
+        "  SELECT f.id FROM folders f JOIN tree t ON f.parent_id = t.id"
+        "), walk (start, id, seen) AS ("
+        "  SELECT id, parent_id, ARRAY[id]::text[] FROM folders"
+        "  WHERE id NOT IN (SELECT id FROM tree)"
+        "  UNION ALL"
+        "  SELECT w.start, f.parent_id, w.seen || f.id::text FROM walk w"
+        "  JOIN folders f ON f.id = w.id WHERE f.id <> ALL(w.seen)"
+        "), cycles AS ("
+        "  SELECT f.id, f.organization_id, f.parent_id FROM folders f"
+        "  WHERE f.id IN (SELECT start FROM walk WHERE id = start)"
+        "), moved AS ("
+        "  UPDATE folders SET parent_id = NULL FROM cycles"
+        "  WHERE folders.id = cycles.id RETURNING folders.id"
+        "), counted AS ("
+        "  UPDATE folder_counters c SET folders = c.folders - n.count"
+        "  FROM (SELECT organization_id, parent_id, count(*) FROM cycles"
+        "   GROUP BY organization_id, parent_id) n"
+        "  WHERE c.organization_id = n.organization_id AND c.folder_id = n.parent_id"
+        ")"
+        " INSERT INTO folder_counters (organization_id, folder_id, folders, diagrams)"
+        " SELECT organization_id, '', count(*), 0 FROM cycles GROUP BY organization_id"
+        " ON CONFLICT (organization_id, folder_id)"
+        " DO UPDATE SET folders = folder_counters.folders + excluded.folders"
+    )
+    op.execute(
+        "WITH RECURSIVE tree (id, path) AS ("
+        "  SELECT id, '/' COLLATE \"C\" FROM folders WHERE parent_id IS NULL"
+        "  UNION ALL"
+        "  SELECT f.id, t.path || t.id || '/' FROM folders f"
+        "  JOIN tree t ON f.parent_id = t.id"
+        ")"
+        " UPDATE folders SET path = tree.path FROM tree"
+        " WHERE folders.id = tree.id AND tree.path <> '/'"
+    )
+    op.create_index(
+        "ix_folders_path", "folders", ["organization_id", "path"], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index("ix_folders_path", table_name="folders")
+    op.drop_column("folders", "path")
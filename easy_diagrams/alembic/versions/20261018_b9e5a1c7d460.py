@@ -0,0 +1,63 @@
+"""include the listed parent columns in the root listing indexes
+
+Revision ID: b9e5a1c7d460
+Revises: a8d4f0b6c359
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b9e5a1c7d460"
+down_revision = "a8d4f0b6c359"
+branch_labels = None
+depends_on = None
+
+ROOT_INDEXES = {
+    "ix_diagrams_listing_root": (
+        "ON diagrams (organization_id, updated_at DESC, id DESC)"
+        " INCLUDE (title, is_public, created_at)"
+        " WHERE folder_id IS NULL AND deleted_at IS NULL"
+    ),
+    "ix_folders_listing_root": (
+        "ON folders (organization_id, name, id)"
+        " INCLUDE (created_at, updated_at)"
+        " WHERE parent_id IS NULL AND deleted_at IS NULL"
+    ),
+}
+COVERING_ROOT_INDEXES = {
+    "ix_diagrams_listing_root": (
+        "ON diagrams (organization_id, updated_at DESC, id DESC)"
+        " INCLUDE (title, is_public, created_at, folder_id)"
+        " WHERE folder_id IS NULL AND deleted_at IS NULL"
+    ),
+    "ix_folders_listing_root": (
+        "ON folders (organization_id, name, id)"
+        " INCLUDE (created_at, updated_at, parent_id)"
+        " WHERE parent_id IS NULL AND deleted_at IS NULL"
+    ),
+}
+
+
+def _replace_concurrently(indexes):
+    # building the new index next to the old one, without locking the table
+    # for writes; a failed build leaves an invalid index behind, which is
+    # dropped so that running the migration again rebuilds it
+    for name, definition in indexes.items():
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}_new")
+        op.execute(f"CREATE INDEX CONCURRENTLY {name}_new {definition}")
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        op.execute(f"ALTER INDEX {name}_new RENAME TO {name}")
+
+
+def upgrade():
+    # the listings select the folder and the parent, which index-only scans
+    # don't read from the index predicate
+    with op.get_context().autocommit_block():
+        _replace_concurrently(COVERING_ROOT_INDEXES)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        _replace_concurrently(ROOT_INDEXES)
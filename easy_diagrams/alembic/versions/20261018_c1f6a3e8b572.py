@@ -0,0 +1,28 @@
+"""add the render claims of diagrams
+
+Revision ID: c1f6a3e8b572
+Revises: b9e5a1c7d460
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c1f6a3e8b572"
+down_revision = "b9e5a1c7d460"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # a nullable column without a default doesn't rewrite the table
+    op.add_column(
+        "diagrams", sa.Column("render_claimed_at", sa.DateTime(), nullable=True)
+    )
+
+
+def downgrade():
+    op.drop_column("diagrams", "render_claimed_at")
@@ -0,0 +1,93 @@
+"""add full-text and trigram search of diagrams
+
+Revision ID: d5a1f7c3e829
+Revises: b4e8c2a6d071
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d5a1f7c3e829"
+down_revision = "b4e8c2a6d071"
+branch_labels = None
+depends_on = None
+
+#: Full-text search and, for identifiers, substring search by trigrams
+SEARCH_INDEXES = (
+    ("ix_diagrams_search_vector", "search_vector", None),
+    ("ix_diagrams_title_trgm", "title", "gin_trgm_ops"),
+    ("ix_diagrams_code_trgm", "code", "gin_trgm_ops"),
+)
+
+
+def upgrade():
+    # the generated column is computed for every row, rewriting the table
+    # under a lock which no concurrent build avoids
+    op.add_column(
+        "diagrams",
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed(
+                "setweight(to_tsvector('simple', coalesce(title, '')), 'A')"
+                " || setweight(to_tsvector('simple', coalesce(code, '')), 'B')",
+                persisted=True,
+            ),
+            nullable=True,
+        ),
+    )
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # building the indexes without locking the table for writes; a failed
+    # build leaves an invalid index behind, which is dropped so that running
+    # the migration again rebuilds it
+    with op.get_context().autocommit_block():
+        for name, column, ops in SEARCH_INDEXES:
+            op.drop_index(
+                name,
+                table_name="diagrams",
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
+            op.create_index(
+                name,
+                "diagrams",
+                [column],
+                unique=False,
+                postgresql_using="gin",
+                postgresql_ops={column: ops} if ops else {},
+                postgresql_concurrently=True,
+            )
+        # the trigram indexes replace the b-tree index of the title, which
+        # served no query
+        op.drop_index(
+            "ix_diagrams_title",
+            table_name="diagrams",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_diagrams_title",
+            "diagrams",
+            ["title"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        for name, _, _ in reversed(SEARCH_INDEXES):
+            op.drop_index(
+                name,
+                table_name="diagrams",
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
+    op.drop_column("diagrams", "search_vector")
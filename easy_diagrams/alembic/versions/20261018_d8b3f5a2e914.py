@@ -0,0 +1,50 @@
+"""render the missing svg of diagrams in the render worker
+
+Revision ID: d8b3f5a2e914
+Revises: c1f6a3e8b572
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d8b3f5a2e914"
+down_revision = "c1f6a3e8b572"
+branch_labels = None
+depends_on = None
+
+# diagrams rendered before the worker rendered every format, their SVG was
+# rendered on request; marked as pending, the PNG is served until the worker
+# renders both again
+MARK_PENDING = sa.text(
+    """
+    UPDATE diagrams SET image_version = NULL
+    WHERE id IN (
+        SELECT d.id FROM diagrams d
+        WHERE d.image_version IS NOT NULL
+          AND d.deleted_at IS NULL
+          AND NOT EXISTS (
+            SELECT 1 FROM diagram_renders r
+            WHERE r.diagram_id = d.id
+              AND r.format = 'svg'
+              AND r.version = d.image_version
+          )
+        LIMIT :batch_size
+    )
+    """
+)
+
+
+def upgrade():
+    # in short batches, not to lock many diagrams for the whole migration
+    with op.get_context().autocommit_block():
+        while op.get_bind().execute(MARK_PENDING, {"batch_size": 1000}).rowcount:
+            pass
+
+
+def downgrade():
+    # the SVG rendered by the worker are served as they are
+    pass
@@ -0,0 +1,84 @@
+"""add diagram kinds and the diagram_symbols table
+
+The kinds and symbols of the existing diagrams are extracted by the
+``reindex_symbols`` script after the upgrade.
+
+Revision ID: e6b2d8f4a137
+Revises: d5a1f7c3e829
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e6b2d8f4a137"
+down_revision = "d5a1f7c3e829"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("diagrams", sa.Column("kind", sa.String(length=32), nullable=True))
+    op.create_table(
+        "diagram_symbols",
+        sa.Column("diagram_id", sa.String(length=32), nullable=False),
+        sa.Column("type", sa.String(length=16), nullable=False),
+        sa.Column("name", sa.String(length=300), nullable=False),
+        sa.Column("organization_id", sa.UUID(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["diagram_id"],
+            ["diagrams.id"],
+            name=op.f("fk_diagram_symbols_diagram_id_diagrams"),
+            ondelete="CASCADE",
+        ),
+        sa.ForeignKeyConstraint(
+            ["organization_id"],
+            ["organizations.id"],
+            name=op.f("fk_diagram_symbols_organization_id_organizations"),
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint(
+            "diagram_id", "type", "name", name=op.f("pk_diagram_symbols")
+        ),
+    )
+    op.create_index(
+        "ix_diagram_symbols_name",
+        "diagram_symbols",
+        ["organization_id", sa.text("lower(name)")],
+        unique=False,
+    )
+
+    # building the index without locking the table for writes; a failed build
+    # leaves an invalid index behind, which is dropped so that running the
+    # migration again rebuilds it
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_diagrams_kind",
+            table_name="diagrams",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.create_index(
+            "ix_diagrams_kind",
+            "diagrams",
+            ["organization_id", "kind", sa.text("updated_at DESC"), sa.text("id DESC")],
+            unique=False,
+            postgresql_where=sa.text("kind IS NOT NULL"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_diagrams_kind",
+            table_name="diagrams",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_index("ix_diagram_symbols_name", table_name="diagram_symbols")
+    op.drop_table("diagram_symbols")
+    op.drop_column("diagrams", "kind")
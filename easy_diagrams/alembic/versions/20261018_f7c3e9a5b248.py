@@ -0,0 +1,91 @@
+"""add deletion jobs and the tombstones of organizations and folders
+
+Revision ID: f7c3e9a5b248
+Revises: e6b2d8f4a137
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "f7c3e9a5b248"
+down_revision = "e6b2d8f4a137"
+branch_labels = None
+depends_on = None
+
+LISTING_INDEXES = {
+    "ix_folders_listing": (
+        "ON folders (organization_id, parent_id, name, id)"
+        " INCLUDE (created_at, updated_at)"
+    ),
+    "ix_folders_listing_root": (
+        "ON folders (organization_id, name, id)"
+        " INCLUDE (created_at, updated_at) WHERE parent_id IS NULL"
+    ),
+}
+LIVE_LISTING_INDEXES = {
+    "ix_folders_listing": (
+        "ON folders (organization_id, parent_id, name, id)"
+        " INCLUDE (created_at, updated_at) WHERE deleted_at IS NULL"
+    ),
+    "ix_folders_listing_root": (
+        "ON folders (organization_id, name, id)"
+        " INCLUDE (created_at, updated_at)"
+        " WHERE parent_id IS NULL AND deleted_at IS NULL"
+    ),
+}
+
+
+def _replace_concurrently(indexes):
+    # building the new index next to the old one, without locking the table
+    # for writes; a failed build leaves an invalid index behind, which is
+    # dropped so that running the migration again rebuilds it
+    for name, definition in indexes.items():
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}_new")
+        op.execute(f"CREATE INDEX CONCURRENTLY {name}_new {definition}")
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        op.execute(f"ALTER INDEX {name}_new RENAME TO {name}")
+
+
+def upgrade():
+    op.create_table(
+        "deletion_jobs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("organization_id", sa.UUID(), nullable=False),
+        sa.Column("folder_id", sa.String(length=32), nullable=True),
+        sa.Column("subtree_path", sa.String(collation="C"), nullable=True),
+        sa.Column("diagrams", sa.Integer(), nullable=False),
+        sa.Column("folders", sa.Integer(), nullable=False),
+        sa.Column("members", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_deletion_jobs")),
+    )
+    op.create_index(
+        "ix_deletion_jobs_pending",
+        "deletion_jobs",
+        ["id"],
+        unique=False,
+        postgresql_where=sa.text("finished_at IS NULL"),
+    )
+    op.add_column(
+        "organizations", sa.Column("deleted_at", sa.DateTime(), nullable=True)
+    )
+    op.add_column("folders", sa.Column("deleted_at", sa.DateTime(), nullable=True))
+
+    # the listings skip the deleted folders
+    with op.get_context().autocommit_block():
+        _replace_concurrently(LIVE_LISTING_INDEXES)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        _replace_concurrently(LISTING_INDEXES)
+    op.drop_column("folders", "deleted_at")
+    op.drop_column("organizations", "deleted_at")
+    op.drop_index("ix_deletion_jobs_pending", table_name="deletion_jobs")
+    op.drop_table("deletion_jobs")
@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+from typing import Callable
+from typing import Hashable
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with optional TTL.
+
+    The cache is bounded by ``maxsize`` which is the total weight of the
+    stored values, by default each value weighs 1 so ``maxsize`` is the number
+    of entries. Pass ``weigh=len`` to bound the cache by the size of the
+    stored bytes instead.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float | None = None,
+        weigh: Callable[[Any], int] | None = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.weigh = weigh or (lambda value: 1)
+        self.hits = 0
+        self.misses = 0
+        self.weight = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: Hashable):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self.ttl is not None:
+                if entry[2] < time.monotonic():
+                    self._pop(key)
+                    entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value):
+        weight = self.weigh(value)
+        if weight > self.maxsize:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._pop(key)
+            self._data[key] = (value, weight, expires_at)
+            self.weight += weight
+            while self.weight > self.maxsize:
+                self._pop(next(iter(self._data)))
+
+    def pop(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._pop(key)
+        return default if entry is None else entry[0]
+
+    def discard_where(self, predicate: Callable[[Hashable], bool]):
+        """Remove all entries which keys match the predicate."""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def _pop(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.weight -= entry[1]
+        return entry
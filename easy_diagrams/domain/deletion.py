@@ -0,0 +1,20 @@
+from uuid import UUID
+
+from pydantic import ConfigDict
+from pydantic.dataclasses import dataclass
+
+from easy_diagrams.domain.folder import FolderID
+
+
+@dataclass(frozen=True, config=ConfigDict(extra="forbid"))
+class DeletionJob:
+    """Deletion of an organization, or of a folder when ``folder_id`` is set,
+    and the number of rows purged so far."""
+
+    id: int
+    organization_id: UUID
+    folder_id: FolderID | None = None
+    diagrams: int = 0
+    folders: int = 0
+    members: int = 0
+    finished: bool = False
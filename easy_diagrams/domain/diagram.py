@@ -9,11 +9,20 @@ from pydantic.dataclasses import dataclass
 
 DiagramID = NewType("DiagramID", str)
 
+#: Formats diagrams can be rendered to, mapped to their content types
+RENDER_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+#: Format of the editor previews, every format is rendered on code changes
+DEFAULT_RENDER_FORMAT = "png"
+#: Types of the symbols of the diagram code: declared participants, classes
+#: and components, their aliases and the undeclared names their arrows connect
+SYMBOL_TYPES = ("participant", "class", "component", "alias", "reference")
+
 
 @dataclass(frozen=True, config=ConfigDict(extra="forbid"))
 class DiagramRender:
-    image: bytes
     version: int
+    #: The image is loaded only on request, see :meth:`IDiagramRepo.get`
+    image: bytes | None = None
 
 
 @dataclass(frozen=True, config=ConfigDict(extra="forbid"))
@@ -26,6 +35,27 @@ class Diagram:
     code_version: int | None = None
     render: DiagramRender | None = None
     folder_id: str | None = None
+    #: The image is older than the code and waits for the render worker
+    render_pending: bool = False
+    updated_at: datetime | None = None
+
+
+@dataclass(frozen=True, config=ConfigDict(extra="forbid"))
+class RenderInfo:
+    """Metadata of a render, enough to answer conditional requests."""
+
+    version: int
+    is_public: bool
+    rendered_at: datetime | None = None
+
+
+@dataclass(frozen=True, config=ConfigDict(extra="forbid"))
+class PendingRender:
+    """Diagram which image is older than its code."""
+
+    id: DiagramID
+    code: str
+    code_version: int
 
 
 @dataclass(frozen=True, config=ConfigDict(extra="forbid"))
@@ -48,3 +78,41 @@ class DiagramListItem:
     @property
     def short_id(self):
         return self.id[:6]
+
+    @property
+    def key(self) -> tuple:
+        """Sort key of the listing, used to paginate by keyset."""
+        return (self.updated_at, self.id)
+
+
+@dataclass(frozen=True, config=ConfigDict(extra="forbid"))
+class DiagramSearchItem(DiagramListItem):
+    #: Relevance of the diagram, substring matches rank lowest
+    rank: float = 0.0
+
+    @property
+    def key(self) -> tuple:
+        """Sort key of the search results, used to paginate by keyset."""
+        return (self.rank, self.updated_at, self.id)
+
+
+@dataclass(frozen=True, config=ConfigDict(extra="forbid"))
+class DiagramTrashItem(DiagramListItem):
+    #: When the diagram was moved to the trash
+    deleted_at: datetime | None = None
+
+    @property
+    def key(self) -> tuple:
+        """Sort key of the trash, used to paginate by keyset."""
+        return (self.deleted_at, self.id)
+
+
+@dataclass(frozen=True, config=ConfigDict(extra="forbid"))
+class DiagramSymbols:
+    """Kind and declared symbols of a diagram code, see
+    :mod:`easy_diagrams.services.diagram_symbols`."""
+
+    #: Kind of the diagram, e.g. ``uml`` for ``@startuml``
+    kind: str | None = None
+    #: ``(type, name)`` pairs, see :data:`SYMBOL_TYPES`
+    symbols: frozenset[tuple[str, str]] = frozenset()
@@ -28,6 +28,11 @@ class FolderListItem:
     def short_id(self):
         return self.id[:6]
 
+    @property
+    def key(self) -> tuple:
+        """Sort key of the listing, used to paginate by keyset."""
+        return (self.name, self.id)
+
 
 @dataclass(frozen=True, config=ConfigDict(extra="forbid"))
 class FolderEdit:
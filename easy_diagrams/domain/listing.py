@@ -0,0 +1,40 @@
+from typing import Literal
+
+from pydantic import ConfigDict
+from pydantic.dataclasses import dataclass
+
+from easy_diagrams.domain.diagram import DiagramListItem
+from easy_diagrams.domain.folder import Folder
+from easy_diagrams.domain.folder import FolderListItem
+
+#: Kind of a listing item, folders are listed before diagrams
+ListingKind = Literal["folder", "diagram"]
+
+
+@dataclass(frozen=True, config=ConfigDict(extra="forbid"))
+class ListingPage:
+    """Page of a folder listing: subfolders followed by diagrams."""
+
+    folders: tuple[FolderListItem, ...]
+    diagrams: tuple[DiagramListItem, ...]
+    #: Number of subfolders and diagrams in the folder
+    total: int
+    current_folder: Folder | None = None
+    #: Ancestors of the current folder, from the root
+    ancestors: tuple[Folder, ...] = ()
+
+    @property
+    def first(self) -> tuple[ListingKind, tuple] | None:
+        if self.folders:
+            return "folder", self.folders[0].key
+        if self.diagrams:
+            return "diagram", self.diagrams[0].key
+        return None
+
+    @property
+    def last(self) -> tuple[ListingKind, tuple] | None:
+        if self.diagrams:
+            return "diagram", self.diagrams[-1].key
+        if self.folders:
+            return "folder", self.folders[-1].key
+        return None
@@ -30,3 +30,12 @@ class OrganizationListItem:
 
     id: OrganizationID
     name: str
+
+
+@dataclass
+class MemberImport:
+    """Emails added to an organization in bulk, by outcome."""
+
+    added: tuple[str, ...] = ()
+    existing: tuple[str, ...] = ()
+    invalid: tuple[str, ...] = ()
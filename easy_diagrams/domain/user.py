@@ -0,0 +1,12 @@
+from uuid import UUID
+
+from pydantic import ConfigDict
+from pydantic.dataclasses import dataclass
+
+
+@dataclass(frozen=True, config=ConfigDict(extra="forbid"))
+class Identity:
+    """The authenticated user, as much of it as requests need."""
+
+    id: UUID
+    enabled: bool = True
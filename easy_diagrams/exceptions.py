@@ -12,3 +12,11 @@ class SocialLoginError(LoginError):
 
 class DiagramNotFoundError(EasyDiagramsError):
     """Exception raised when the diagram is not found."""
+
+
+class RenderSupersededError(EasyDiagramsError):
+    """Exception raised when a render is cancelled by a render of newer code."""
+
+
+class FolderCycleError(EasyDiagramsError):
+    """Exception raised when a folder would be moved into its own subtree."""
@@ -7,10 +7,15 @@ if TYPE_CHECKING:
     from easy_diagrams.domain.diagram import DiagramEdit
     from easy_diagrams.domain.diagram import DiagramID
     from easy_diagrams.domain.diagram import DiagramListItem
+    from easy_diagrams.domain.diagram import DiagramSearchItem
+    from easy_diagrams.domain.diagram import DiagramTrashItem
+    from easy_diagrams.domain.diagram import RenderInfo
     from easy_diagrams.domain.folder import Folder
     from easy_diagrams.domain.folder import FolderEdit
     from easy_diagrams.domain.folder import FolderID
     from easy_diagrams.domain.folder import FolderListItem
+    from easy_diagrams.domain.listing import ListingPage
+    from easy_diagrams.domain.organization import MemberImport
     from easy_diagrams.domain.organization import Organization
     from easy_diagrams.domain.organization import OrganizationEdit
     from easy_diagrams.domain.organization import OrganizationID
@@ -30,7 +35,7 @@ class ISocialLoginProvider(Interface):
 class IDiagramRenderer(Interface):
     """Interface for social login provider."""
 
-    def render(diagram):
+    def render(diagram, file_format: str = "png"):
         """ "Render the provided diagram."""
 
 
@@ -43,25 +48,62 @@ class IDiagramRepo(Interface):
     def create(folder_id: "FolderID" = None) -> "DiagramID":
         """Create new diagram and return its ID."""
 
-    def get(diagram_id: "DiagramID") -> "Diagram":
-        """Get diagram by its ID."""
+    def get(diagram_id: "DiagramID", with_image: bool = False) -> "Diagram":
+        """Get diagram by its ID, its image is loaded only if requested."""
 
     def delete(diagram_id: "DiagramID") -> None:
-        """Delete diagram by its ID."""
+        """Move diagram to the trash by its ID."""
+
+    def restore(diagram_id: "DiagramID") -> None:
+        """Restore diagram from the trash by its ID."""
+
+    def list_deleted(
+        limit: int = 100, after: tuple = None
+    ) -> tuple["DiagramTrashItem", ...]:
+        """Diagrams in the trash, the most recently trashed first, paginated
+        by the ``(deleted_at, id)`` key of the previous item."""
 
     def list(
-        offset: int, limit: int, folder_id: "FolderID" = None
+        offset: int,
+        limit: int,
+        folder_id: "FolderID" = None,
+        after: tuple = None,
+        before: tuple = None,
+        recursive: bool = False,
     ) -> list["DiagramListItem"]:
-        """Paginated diagrams list."""
+        """Paginated diagrams list, by offset or by the ``(updated_at, id)``
+        key of the neighbouring item, ``recursive`` includes subfolders."""
 
-    def edit(diagram_id: "DiagramID", changes: "DiagramEdit") -> None:
-        """Edit diagram by its ID."""
+    def edit(diagram_id: "DiagramID", changes: "DiagramEdit") -> "Diagram":
+        """Edit diagram by its ID and return it, the code is stored but not
+        rendered."""
 
-    def get_image_render(diagram_id: "DiagramID") -> bytes:
+    def get_image_render(diagram_id: "DiagramID", file_format: str = "png") -> bytes:
         """Get diagram image render as bytes by its ID."""
 
-    def count(folder_id: "FolderID" = None) -> int:
-        """Get total count of diagrams."""
+    def get_image_info(
+        diagram_id: "DiagramID", file_format: str = "png"
+    ) -> "RenderInfo":
+        """Get metadata of the diagram image render without the image itself."""
+
+    def search(
+        text: str, limit: int = 20, after: tuple = None
+    ) -> tuple["DiagramSearchItem", ...]:
+        """Diagrams matching the text, the most relevant first, paginated by
+        the ``(rank, updated_at, id)`` key of the previous item."""
+
+    def list_referencing(
+        symbol: str, limit: int = 100, after: tuple = None
+    ) -> tuple["DiagramListItem", ...]:
+        """Diagrams declaring or referencing the symbol of their code."""
+
+    def list_by_kind(
+        kind: str, limit: int = 100, after: tuple = None
+    ) -> tuple["DiagramListItem", ...]:
+        """Diagrams of the kind, e.g. ``uml`` for ``@startuml``."""
+
+    def count(folder_id: "FolderID" = None, recursive: bool = False) -> int:
+        """Get total count of diagrams, ``recursive`` includes subfolders."""
 
 
 class IFolderRepo(Interface):
@@ -76,11 +118,34 @@ class IFolderRepo(Interface):
     def delete(folder_id: "FolderID") -> None:
         """Delete folder by its ID."""
 
-    def list(parent_id: "FolderID" = None) -> list["FolderListItem"]:
-        """List folders by parent ID."""
+    def list(
+        parent_id: "FolderID" = None,
+        offset: int = 0,
+        limit: int = None,
+        after: tuple = None,
+        before: tuple = None,
+    ) -> list["FolderListItem"]:
+        """List folders by parent ID, paginated by offset or by the
+        ``(name, id)`` key of the neighbouring item."""
+
+    def ancestors(folder_id: "FolderID") -> tuple["Folder", ...]:
+        """The folder and its ancestors, from the root to the folder."""
 
     def edit(folder_id: "FolderID", changes: "FolderEdit") -> "Folder":
-        """Edit folder by its ID."""
+        """Edit folder by its ID, moving a folder into its own subtree raises
+        :class:`easy_diagrams.exceptions.FolderCycleError`."""
+
+
+class IListingQuery(Interface):
+    def page(
+        folder_id: "FolderID" = None,
+        limit: int = 10,
+        after: tuple = None,
+        before: tuple = None,
+    ) -> "ListingPage":
+        """Page of subfolders followed by diagrams of the folder, with their
+        total and the folder itself, after or before the ``(kind, key)`` of
+        a listed item."""
 
 
 class IOrganizationRepo(Interface):
@@ -95,6 +160,9 @@ class IOrganizationRepo(Interface):
     def delete(organization_id: "OrganizationID") -> None:
         """Delete organization by its ID."""
 
+    def get_role(organization_id: "OrganizationID") -> str | None:
+        """Get the role of the user in the organization, None if not a member."""
+
     def list(offset: int = 0, limit: int = 20) -> list["OrganizationListItem"]:
         """List user's organizations with pagination."""
 
@@ -113,6 +181,12 @@ class IOrganizationRepo(Interface):
     ) -> None:
         """Add user to organization by email. Creates user if doesn't exist."""
 
+    def add_users(
+        organization_id: "OrganizationID", emails: "list[str]", is_owner: bool = False
+    ) -> "MemberImport":
+        """Add users to organization by emails in bulk. Creates users who
+        don't exist."""
+
     def remove_user(organization_id: "OrganizationID", user_id: str) -> None:
         """Remove user from organization."""
 
@@ -1,26 +1,83 @@
+from logging import getLogger
+
 import zope.sqlalchemy
+from pyramid.settings import asbool
+from pyramid.settings import aslist
 from sqlalchemy import engine_from_config
 from sqlalchemy.orm import configure_mappers
 from sqlalchemy.orm import sessionmaker
 
 # Import or define all models here to ensure they are attached to the
 # ``Base.metadata`` prior to any initialization routines.
+from .deletion import DeletionJobTable  # noqa
+from .diagram import DiagramRenderTable  # noqa
+from .diagram import DiagramSymbolTable  # noqa
 from .diagram import DiagramTable  # noqa
+from .folder import FolderCounterTable  # noqa
 from .folder import FolderTable  # noqa
+from .metrics import MeteredQueuePool
+from .metrics import query_count
 from .organization import OrganizationTable  # noqa
+from .routing import RoutingSession
+from .routing import is_read_only
 from .user import User  # noqa
 
+logger = getLogger(__name__)
+
 # Run ``configure_mappers`` after defining all of the models to ensure
 # all relationships can be setup.
 configure_mappers()
 
 
-def get_engine(settings, prefix="sqlalchemy."):
-    return engine_from_config(settings, prefix)
+#: Pool settings under the ``sqlalchemy.`` prefix and their types, the
+#: settings are passed to :func:`sqlalchemy.create_engine`
+POOL_SETTINGS = {
+    "pool_size": int,
+    "max_overflow": int,
+    "pool_timeout": float,
+    "pool_recycle": int,
+    "pool_pre_ping": asbool,
+    "pool_use_lifo": asbool,
+}
 
 
-def get_session_factory(engine):
-    factory = sessionmaker()
+def get_engine(settings, prefix="sqlalchemy."):
+    """Create the engine from the settings under the prefix.
+
+    Besides the :func:`sqlalchemy.engine_from_config` settings, the pool is
+    configured by the :data:`POOL_SETTINGS`. ``prepare_threshold`` is the
+    number of executions of a statement after which psycopg prepares it on the
+    server, and ``pgbouncer = true`` disables prepared statements, which a
+    PgBouncer in transaction pooling mode doesn't support. The usage of the
+    pool is collected in ``engine.pool.metrics``, see
+    :class:`easy_diagrams.models.metrics.PoolMetrics`.
+    """
+    options = {
+        key[len(prefix) :]: value
+        for key, value in settings.items()
+        if key.startswith(prefix)
+    }
+    kwargs = {
+        name: convert(options.pop(name))
+        for name, convert in POOL_SETTINGS.items()
+        if name in options
+    }
+    prepare_threshold = options.pop("prepare_threshold", None)
+    if asbool(options.pop("pgbouncer", False)):
+        kwargs["connect_args"] = {"prepare_threshold": None}
+    elif prepare_threshold is not None:
+        kwargs["connect_args"] = {"prepare_threshold": int(prepare_threshold)}
+    return engine_from_config(options, prefix="", poolclass=MeteredQueuePool, **kwargs)
+
+
+def get_session_factory(engine, replicas=(), stickiness=0):
+    """Factory of sessions bound to the primary ``engine``, reading from the
+    ``replicas`` engines when the session is read only, see
+    :mod:`easy_diagrams.models.routing`."""
+    factory = sessionmaker(
+        class_=RoutingSession,
+        info={"replicas": tuple(replicas), "stickiness": stickiness},
+    )
     factory.configure(bind=engine)
     return factory
 
@@ -80,7 +137,11 @@ def get_tm_session(session_factory, transaction_manager, request=None):
           dbsession = sa_inspect(dbObject).session
           request = dbsession.info["request"]
     """
-    dbsession = session_factory(info={"request": request})
+    # without replicas the web session isn't read for the routing
+    replicas = session_factory.kw.get("info", {}).get("replicas")
+    dbsession = session_factory(
+        info={"request": request, "read_only": bool(replicas) and is_read_only(request)}
+    )
     zope.sqlalchemy.register(dbsession, transaction_manager=transaction_manager)
     return dbsession
 
@@ -111,7 +172,14 @@ def includeme(config):
     if not dbengine:
         dbengine = get_engine(settings)
 
-    session_factory = get_session_factory(dbengine)
+    # optional read replicas, configured like the primary
+    replicas = [
+        get_engine({**settings, "sqlalchemy.url": url})
+        for url in aslist(settings.get("replicas.urls", ""))
+    ]
+    session_factory = get_session_factory(
+        dbengine, replicas, float(settings.get("replicas.stickiness", 5))
+    )
     config.registry["dbsession_factory"] = session_factory
 
     # make request.dbsession available for use in Pyramid
@@ -121,6 +189,24 @@ def includeme(config):
         if dbsession is None:
             # request.tm is the transaction manager used by pyramid_tm
             dbsession = get_tm_session(session_factory, request.tm, request=request)
+        # the session is shared between requests in testing
+        request.environ["app.query_count_offset"] = query_count(dbsession)
+        request.add_finished_callback(log_query_count)
         return dbsession
 
     config.add_request_method(dbsession, reify=True)
+    config.add_request_method(request_query_count, "query_count", property=True)
+
+
+def request_query_count(request) -> int:
+    """Number of SQL statements executed by the request so far."""
+    if "dbsession" not in request.__dict__:
+        return 0
+    offset = request.environ.get("app.query_count_offset", 0)
+    return query_count(request.dbsession) - offset
+
+
+def log_query_count(request):
+    logger.debug(
+        "%s %s executed %d queries", request.method, request.path, request.query_count
+    )
@@ -0,0 +1,57 @@
+from datetime import datetime
+
+from sqlalchemy import Column
+from sqlalchemy import DateTime
+from sqlalchemy import Index
+from sqlalchemy import Integer
+from sqlalchemy import String
+from sqlalchemy.dialects.postgresql import UUID
+
+from .meta import Base
+
+
+class DeletionJobTable(Base):
+    """Deletion of an organization or a folder with all of its content.
+
+    The organization or the folder, with its subfolders, is tombstoned by its
+    ``deleted_at`` when the job is created, so that it disappears at once.
+    The ``purge_deletions`` script then deletes its diagrams, subfolders and
+    members in batches, see :mod:`easy_diagrams.services.deletions`. Each batch
+    is a transaction which also counts the purged rows, so that the job shows
+    its progress and resumes where it stopped after a crash.
+    """
+
+    __tablename__ = "deletion_jobs"
+
+    id = Column(Integer, primary_key=True)
+
+    #: Deleted organization, or organization of the deleted folder. Not a
+    #: foreign key, as the job outlives the deleted organization.
+    organization_id = Column(UUID(as_uuid=True), nullable=False)
+
+    #: Deleted folder, ``None`` when the organization is deleted
+    folder_id = Column(String(32), nullable=True)
+
+    #: Path of the subfolders of the deleted folder, see
+    #: :attr:`FolderTable.subtree_path`
+    subtree_path = Column(String(collation="C"), nullable=True)
+
+    #: Number of purged diagrams, folders and members so far
+    diagrams = Column(Integer, nullable=False, default=0)
+    folders = Column(Integer, nullable=False, default=0)
+    members = Column(Integer, nullable=False, default=0)
+
+    created_at = Column(DateTime, default=datetime.now)
+
+    updated_at = Column(DateTime, onupdate=datetime.now)
+
+    #: When everything was purged
+    finished_at = Column(DateTime, nullable=True)
+
+
+# jobs left to the purge script, in the order of creation
+Index(
+    "ix_deletion_jobs_pending",
+    DeletionJobTable.id,
+    postgresql_where=DeletionJobTable.finished_at.is_(None),
+)
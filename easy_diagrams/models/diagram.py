@@ -6,11 +6,18 @@ from datetime import datetime
 from sqlalchemy import BigInteger
 from sqlalchemy import Boolean
 from sqlalchemy import Column
+from sqlalchemy import Computed
 from sqlalchemy import DateTime
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
 from sqlalchemy import String
+from sqlalchemy import and_
+from sqlalchemy import func
+from sqlalchemy import text
 from sqlalchemy.dialects.postgresql import BYTEA
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import deferred
 from sqlalchemy.orm import mapped_column
 from sqlalchemy.orm import relationship
 
@@ -39,11 +46,23 @@ class DiagramTable(Base):
     """
 
     __tablename__ = "diagrams"
+    __table_args__ = (
+        # diagrams waiting for the background render worker
+        Index(
+            "ix_diagrams_pending_render",
+            "updated_at",
+            postgresql_where=text(
+                "code_version IS NOT NULL"
+                " AND image_version IS DISTINCT FROM code_version"
+            ),
+        ),
+    )
+
     #: Unique publicly exposed identifier for the diagram
     id = Column(String(32), default=_gen_diagram_id, primary_key=True)
 
     #: Title of the diagram
-    title = Column(String(300), index=True, nullable=True)
+    title = Column(String(300), nullable=True)
 
     #: Whatever the diagram is public
     is_public = Column(Boolean, nullable=False, default=False)
@@ -52,17 +71,17 @@ class DiagramTable(Base):
     created_at = Column(DateTime, index=True, default=datetime.now)
 
     #: When the user data was updated last time
-    updated_at = Column(
-        DateTime, index=True, onupdate=datetime.now, default=datetime.now
-    )
+    updated_at = Column(DateTime, onupdate=datetime.now, default=datetime.now)
 
     #: Organization relationship
-    organization_id = mapped_column(
-        ForeignKey("organizations.id"), nullable=False, index=True
-    )
+    organization_id = mapped_column(ForeignKey("organizations.id"), nullable=False)
     organization = relationship("OrganizationTable")
 
-    #: Folder relationship
+    #: When the diagram was moved to the trash, trashed diagrams are hidden and
+    #: purged after the retention, see :mod:`easy_diagrams.services.trash`
+    deleted_at = Column(DateTime, nullable=True)
+
+    #: Folder relationship, indexed on its own for the lookups of deleted folders
     folder_id = mapped_column(ForeignKey("folders.id"), nullable=True, index=True)
     folder = relationship("FolderTable", back_populates="diagrams")
 
@@ -70,9 +89,51 @@ class DiagramTable(Base):
     _code_version = Column("code_version", BigInteger, nullable=True)
     _code = Column("code", String(10_240), nullable=True)  # 10K characters limit
 
-    #: Rendered UML image
+    #: Kind of the diagram read from its code, e.g. ``uml`` or ``mindmap``,
+    #: see :mod:`easy_diagrams.services.diagram_symbols`
+    kind = Column(String(32), nullable=True)
+
+    #: Full-text search document of the title and the code, the title words
+    #: weigh more in the ranking. The "simple" configuration keeps identifiers
+    #: of the code as they are instead of stemming them as English words.
+    search_vector = deferred(
+        Column(
+            TSVECTOR,
+            Computed(
+                "setweight(to_tsvector('simple', coalesce(title, '')), 'A')"
+                " || setweight(to_tsvector('simple', coalesce(code, '')), 'B')",
+                persisted=True,
+            ),
+        )
+    )
+
+    #: Version of the rendered UML image, the image itself is stored in
+    #: :class:`DiagramRenderTable` to keep this row small
     _image_version = Column("image_version", BigInteger, nullable=True)
-    _image = Column("image", BYTEA, nullable=True)
+
+    #: When a render worker claimed the render of the code, other workers skip
+    #: the diagram until the claim expires, see :class:`RenderWorker
+    #: <easy_diagrams.services.render_worker.RenderWorker>`
+    render_claimed_at = Column(DateTime, nullable=True)
+
+    #: Renders in all formats
+    renders = relationship(
+        "DiagramRenderTable",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        overlaps="_default_render",
+    )
+
+    #: Render in the default format, see :func:`set_image`
+    _default_render = relationship(
+        "DiagramRenderTable",
+        primaryjoin="and_(DiagramTable.id == DiagramRenderTable.diagram_id,"
+        " DiagramRenderTable.format == 'png')",
+        uselist=False,
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        overlaps="renders",
+    )
 
     @hybrid_property
     def code(self):
@@ -83,16 +144,20 @@ class DiagramTable(Base):
     def _code_setter(self, value):
         self._code = value
         self._code_version = _gen_code_version()
+        # the new code waits for a render, whatever worker renders the old one
+        self.render_claimed_at = None
 
     @hybrid_property
     def code_version(self):
         """The version of the code of the diagram. This is generated when the code is set and can't be set manually."""
         return self._code_version
 
-    @hybrid_property
+    @property
     def image(self):
-        """The image of the diagram. For setting the image see :function:`set_image`."""
-        return self._image
+        """The image of the diagram. For setting the image see :function:`set_image`.
+        The image is loaded from the ``diagram_renders`` table on first access."""
+        render = self._default_render
+        return render.image if render is not None else None
 
     @hybrid_property
     def image_version(self):
@@ -103,5 +168,134 @@ class DiagramTable(Base):
         """Set the image of the diagram and its version based on the :property:`code_version`.
         Function also sets the :property:`code_is_valid` to `True`.
         """
-        self._image = image
+        render = self._default_render
+        if render is None:
+            self._default_render = DiagramRenderTable(
+                format="png", version=version, image=image
+            )
+        else:
+            render.version = version
+            render.image = image
         self._image_version = version
+
+
+#: Columns of the diagram listings, included in the listing indexes so that
+#: listings are served by index-only scans
+LISTING_COLUMNS = ("title", "is_public", "created_at")
+
+# diagrams of a folder and of the organization root, in the order of the
+# listing keyset, see :meth:`DiagramRepository.list`, trashed diagrams are
+# left out
+Index(
+    "ix_diagrams_listing",
+    DiagramTable.organization_id,
+    DiagramTable.folder_id,
+    DiagramTable.updated_at.desc(),
+    DiagramTable.id.desc(),
+    postgresql_include=LISTING_COLUMNS,
+    postgresql_where=DiagramTable.deleted_at.is_(None),
+)
+Index(
+    "ix_diagrams_listing_root",
+    DiagramTable.organization_id,
+    DiagramTable.updated_at.desc(),
+    DiagramTable.id.desc(),
+    # the folder isn't read from the predicate by index-only scans
+    postgresql_include=LISTING_COLUMNS + ("folder_id",),
+    postgresql_where=and_(
+        DiagramTable.folder_id.is_(None), DiagramTable.deleted_at.is_(None)
+    ),
+)
+# trash of an organization, the most recently trashed first
+Index(
+    "ix_diagrams_trash",
+    DiagramTable.organization_id,
+    DiagramTable.deleted_at.desc(),
+    DiagramTable.id.desc(),
+    postgresql_include=("title",),
+    postgresql_where=DiagramTable.deleted_at.is_not(None),
+)
+# trashed diagrams past the retention, see :func:`easy_diagrams.services.trash.purge`
+Index(
+    "ix_diagrams_deleted_at",
+    DiagramTable.deleted_at,
+    postgresql_where=DiagramTable.deleted_at.is_not(None),
+)
+# full-text search, the substring search is served by the pg_trgm indexes
+# ix_diagrams_title_trgm and ix_diagrams_code_trgm; the migrations install the
+# extension and require it on the server, they are left out of the models so
+# that ``create_all`` (the ``--db-migration`` test option) works without it
+Index("ix_diagrams_search_vector", DiagramTable.search_vector, postgresql_using="gin")
+# diagrams by kind, in the order of the listings
+Index(
+    "ix_diagrams_kind",
+    DiagramTable.organization_id,
+    DiagramTable.kind,
+    DiagramTable.updated_at.desc(),
+    DiagramTable.id.desc(),
+    postgresql_where=and_(
+        DiagramTable.kind.is_not(None), DiagramTable.deleted_at.is_(None)
+    ),
+)
+
+
+class DiagramRenderTable(Base):
+    """Render of a diagram, one row per diagram and format.
+
+    The render worker renders every format on code changes, image requests
+    only read the stored renders. Only the render of the newest code version
+    is kept, so the version isn't part of the key: the row is replaced when a
+    render of a newer version is stored, and never by an older one.
+    """
+
+    __tablename__ = "diagram_renders"
+
+    diagram_id = mapped_column(
+        ForeignKey("diagrams.id", ondelete="CASCADE"), primary_key=True
+    )
+
+    #: Format of the image, see :data:`easy_diagrams.domain.diagram.RENDER_FORMATS`
+    format = Column(String(8), primary_key=True)
+
+    #: The code version the image was rendered from
+    version = Column(BigInteger, nullable=False)
+
+    #: Rendered image
+    image = Column(BYTEA, nullable=False)
+
+    #: When the image was rendered
+    created_at = Column(DateTime, default=datetime.now)
+
+
+class DiagramSymbolTable(Base):
+    """Symbol declared or referenced by the code of a diagram, e.g. a
+    participant, a class or a component, one row per diagram, type and name.
+
+    The rows of a diagram are replaced whenever its code changes, see
+    :func:`easy_diagrams.services.diagram_symbols.store`.
+    """
+
+    __tablename__ = "diagram_symbols"
+
+    diagram_id = mapped_column(
+        ForeignKey("diagrams.id", ondelete="CASCADE"), primary_key=True
+    )
+
+    #: Type of the symbol, see :data:`easy_diagrams.domain.diagram.SYMBOL_TYPES`
+    type = Column(String(16), primary_key=True)
+
+    #: Name of the symbol as written in the code, without quotes or brackets
+    name = Column(String(300), primary_key=True)
+
+    #: Organization of the diagram, to look symbols up within it
+    organization_id = mapped_column(
+        ForeignKey("organizations.id", ondelete="CASCADE"), nullable=False
+    )
+
+
+# diagrams referencing a symbol, names are matched case-insensitively
+Index(
+    "ix_diagram_symbols_name",
+    DiagramSymbolTable.organization_id,
+    func.lower(DiagramSymbolTable.name),
+)
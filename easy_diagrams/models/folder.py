@@ -5,12 +5,20 @@ from datetime import datetime
 from sqlalchemy import Column
 from sqlalchemy import DateTime
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
+from sqlalchemy import Integer
 from sqlalchemy import String
+from sqlalchemy import and_
+from sqlalchemy import func
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import mapped_column
 from sqlalchemy.orm import relationship
 
 from .meta import Base
 
+#: Path of the folders in the organization root
+ROOT_PATH = "/"
+
 
 def _gen_folder_id() -> str:
     """Generate a unique identifier for the folder."""
@@ -26,7 +34,7 @@ class FolderTable(Base):
     id = Column(String(32), default=_gen_folder_id, primary_key=True)
 
     #: Name of the folder
-    name = Column(String(255), nullable=False, index=True)
+    name = Column(String(255), nullable=False)
 
     #: When this folder was created
     created_at = Column(DateTime, index=True, default=datetime.now)
@@ -37,15 +45,99 @@ class FolderTable(Base):
     )
 
     #: Organization relationship
-    organization_id = mapped_column(
-        ForeignKey("organizations.id"), nullable=False, index=True
-    )
+    organization_id = mapped_column(ForeignKey("organizations.id"), nullable=False)
     organization = relationship("OrganizationTable")
 
-    #: Parent folder relationship (for nested folders)
+    #: Parent folder relationship (for nested folders), indexed on its own for
+    #: the lookups of deleted folders
     parent_id = mapped_column(ForeignKey("folders.id"), nullable=True, index=True)
     parent = relationship("FolderTable", remote_side=[id], back_populates="children")
     children = relationship("FolderTable", back_populates="parent")
 
+    #: Ids of the ancestors from the root, each followed by ``/``, e.g.
+    #: ``/<grandparent id>/<parent id>/``. The "C" collation orders the paths
+    #: bytewise, so that a subtree is a range of the path index, see
+    #: :meth:`in_subtree`.
+    path = Column(
+        String(collation="C"), nullable=False, default=ROOT_PATH, server_default="/"
+    )
+
+    #: When the folder, or its ancestor, was deleted, see
+    #: :class:`easy_diagrams.models.deletion.DeletionJobTable`
+    deleted_at = Column(DateTime, nullable=True)
+
     #: Diagrams in this folder
     diagrams = relationship("DiagramTable", back_populates="folder")
+
+    @hybrid_property
+    def subtree_path(self):
+        """Path of the children, the prefix of the paths in the subtree."""
+        return self.path + self.id + "/"
+
+    @subtree_path.inplace.expression
+    @classmethod
+    def _subtree_path_expression(cls):
+        return (cls.path + cls.id + "/").self_group().collate("C")
+
+    @classmethod
+    def in_subtree(cls, subtree_path):
+        """Condition matching the folders under the subtree path. As ``0``
+        follows the ``/`` ending the path, it is an index range scan."""
+        if isinstance(subtree_path, str):
+            upper = subtree_path[:-1] + "0"
+        else:
+            upper = func.left(subtree_path, -1) + "0"
+        return and_(cls.path >= subtree_path, cls.path < upper)
+
+
+# subfolders of a folder and of the organization root, in the order of the
+# listing keyset, see :meth:`FolderRepository.list`, deleted folders aren't
+# listed
+Index(
+    "ix_folders_listing",
+    FolderTable.organization_id,
+    FolderTable.parent_id,
+    FolderTable.name,
+    FolderTable.id,
+    postgresql_include=("created_at", "updated_at"),
+    postgresql_where=FolderTable.deleted_at.is_(None),
+)
+Index(
+    "ix_folders_listing_root",
+    FolderTable.organization_id,
+    FolderTable.name,
+    FolderTable.id,
+    # the parent isn't read from the predicate by index-only scans
+    postgresql_include=("created_at", "updated_at", "parent_id"),
+    postgresql_where=and_(
+        FolderTable.parent_id.is_(None), FolderTable.deleted_at.is_(None)
+    ),
+)
+# subtrees, see :meth:`FolderTable.in_subtree`
+Index("ix_folders_path", FolderTable.organization_id, FolderTable.path)
+
+
+#: Folder key of the counters of the organization root
+ROOT_FOLDER = ""
+
+
+class FolderCounterTable(Base):
+    """Number of subfolders and diagrams in a folder.
+
+    Counters are updated in the same transaction as the folders and diagrams
+    they count, so that listings don't need to count rows. They can be
+    recomputed with the ``reconcile_counters`` script.
+    """
+
+    __tablename__ = "folder_counters"
+
+    organization_id = mapped_column(
+        ForeignKey("organizations.id", ondelete="CASCADE"), primary_key=True
+    )
+
+    #: Counted folder, :data:`ROOT_FOLDER` for the organization root
+    folder_id = Column(String(32), primary_key=True)
+
+    folders = Column(Integer, nullable=False, default=0)
+
+    diagrams = Column(Integer, nullable=False, default=0)
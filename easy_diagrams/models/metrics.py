@@ -0,0 +1,155 @@
+"""Counting of the SQL statements executed by database sessions and usage of
+the connection pool.
+
+Every statement executed on a connection used by a session increments
+``session.info["query_count"]``, including the statements of the flush.
+"""
+
+import threading
+import time
+from logging import getLogger
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import Pool
+from sqlalchemy.pool import QueuePool
+
+logger = getLogger(__name__)
+
+
+@event.listens_for(Session, "after_begin")
+def _track_connection(session, transaction, connection):
+    session.info.setdefault("query_count", 0)
+    connection.info["session_info"] = session.info
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    session_info = conn.info.get("session_info")
+    if session_info is not None:
+        session_info["query_count"] += 1
+
+
+@event.listens_for(Pool, "checkin")  # codespell:ignore
+def _untrack_connection(dbapi_connection, connection_record):
+    connection_record.info.pop("session_info", None)
+
+
+def query_count(dbsession) -> int:
+    return dbsession.info.get("query_count", 0)
+
+
+class PoolMetrics:
+    """Usage of a connection pool, collected by the pool events and by
+    :class:`MeteredQueuePool`.
+
+    A checkout is counted as saturated when all connections of the pool,
+    including the overflow ones, were checked out when it was requested, so
+    that it had to wait for a connection to be returned. Saturated checkouts
+    show up before the checkouts start timing out.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.invalidations = 0
+        self.checkouts = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.saturated = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def attach(self, target):
+        """Listen to the events of the pool or of the pool of the engine."""
+        event.listen(target, "connect", self._on_connect)
+        event.listen(target, "checkout", self._on_checkout)
+        event.listen(target, "checkin", self._on_checkin)  # codespell:ignore
+        event.listen(target, "invalidate", self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checked_out -= 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def observe_wait(self, seconds: float, saturated: bool, timed_out: bool):
+        with self._lock:
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+            self.saturated += saturated
+            self.timeouts += timed_out
+
+    @property
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "checkouts": self.checkouts,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "saturated": self.saturated,
+                "timeouts": self.timeouts,
+                "wait_seconds": self.wait_seconds,
+                "max_wait_seconds": self.max_wait_seconds,
+            }
+
+
+class MeteredQueuePool(QueuePool):
+    """Queue pool measuring the time waited for a connection, see
+    :class:`PoolMetrics`."""
+
+    # logging like the pool it extends, under the ``sqlalchemy.pool`` loggers
+    _sqla_logger_namespace = "sqlalchemy.pool.impl.QueuePool"
+
+    def __init__(self, creator, pool_size=5, max_overflow=10, **kwargs):
+        super().__init__(
+            creator, pool_size=pool_size, max_overflow=max_overflow, **kwargs
+        )
+        #: Connections the pool can hand out, unlimited when negative
+        self.capacity = pool_size + max_overflow if max_overflow >= 0 else -1
+        # a recreated pool inherits the event listeners, and with them the
+        # metrics, of the disposed one, see :meth:`recreate`
+        if "_dispatch" not in kwargs:
+            self.metrics = PoolMetrics()
+            self.metrics.attach(self)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def connect(self):
+        saturated = 0 <= self.capacity <= self.checkedout()
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super().connect()
+        except TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            wait = time.perf_counter() - start
+            self.metrics.observe_wait(wait, saturated, timed_out)
+            if saturated:
+                logger.warning(
+                    "Waited %.3fs for a database connection, the pool is exhausted: %s",
+                    wait,
+                    self.status(),
+                )
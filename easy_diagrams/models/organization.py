@@ -36,7 +36,9 @@ class OrganizationTable(Base):
     - Each organization must have at least one owner
     - Users can be added by email (creates user if doesn't exist)
     - Owners have full control over the organization
-    - Deleting an organization removes all user associations
+    - Deleting an organization tombstones it, its content and user associations
+      are purged in the background, see
+      :class:`easy_diagrams.models.deletion.DeletionJobTable`
     - Organizations are isolated - users can only access organizations they belong to
     """
 
@@ -54,6 +56,9 @@ class OrganizationTable(Base):
     #: When the organization data was updated last time
     updated_at = Column(DateTime, onupdate=datetime.now)
 
+    #: When the organization was deleted
+    deleted_at = Column(DateTime, nullable=True)
+
     #: Organization's users
     users = relationship(
         "User", secondary=organization_user_association, back_populates="organizations"
@@ -0,0 +1,96 @@
+"""Routing of the read-only requests to the read replicas of the database.
+
+The replicas are configured by the ``replicas.urls`` setting. The sessions of
+the GET requests of :data:`READ_ONLY_ROUTES` read from a replica, everything
+else goes to the primary. A session which writes, or reads while flushing,
+sticks to the primary for the rest of its lifetime, so that it reads what it
+wrote. So that users read their own writes in the following requests too,
+which replicas may not have received yet, the requests of a user are routed
+to the primary for ``replicas.stickiness`` seconds after the user wrote.
+
+The web session is used only when replicas are configured, and never by the
+image requests, so that their cacheable responses don't set its cookie.
+"""
+
+import random
+import time
+
+from sqlalchemy import Select
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+#: Routes of images cached by shared caches, served by a replica regardless
+#: of the writes of the user
+CACHEABLE_ROUTES = frozenset(("diagram_view_image_png", "diagram_view_image_svg"))
+#: Routes which only read, the GET requests of them are served by a replica
+READ_ONLY_ROUTES = CACHEABLE_ROUTES | frozenset(
+    (
+        "diagram_view_json",
+        "diagrams",
+        "diagrams_search",
+        "diagrams_trash",
+        "organizations",
+    )
+)
+READ_ONLY_METHODS = frozenset(("GET", "HEAD"))
+
+#: Key of the web session storing until when the user reads from the primary
+PRIMARY_UNTIL_KEY = "db.primary_until"
+
+
+class RoutingSession(Session):
+    """Session reading from a replica when ``info["read_only"]`` is set and
+    the session hasn't written yet.
+
+    The replica engines are given by ``info["replicas"]``, a session picks one
+    of them and keeps it.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        replicas = self.info.get("replicas")
+        if (
+            replicas
+            and self.info.get("read_only")
+            and not self.info.get("wrote")
+            and not self._flushing
+            and isinstance(clause, Select)
+        ):
+            if "replica" not in self.info:
+                self.info["replica"] = random.choice(replicas)
+            return self.info["replica"]
+        if clause is not None and not isinstance(clause, Select):
+            written(self)
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _after_flush(session, flush_context):
+    written(session)
+
+
+def written(session):
+    """Route the session, and the requests of its user for a while, to the
+    primary."""
+    session.info["wrote"] = True
+    stickiness = session.info.get("stickiness")
+    request = session.info.get("request")
+    # only the changes requested by the user stick, reads never set the cookie
+    if (
+        stickiness
+        and session.info.get("replicas")
+        and request is not None
+        and request.method not in READ_ONLY_METHODS
+    ):
+        request.session[PRIMARY_UNTIL_KEY] = time.time() + stickiness
+
+
+def is_read_only(request) -> bool:
+    """Whether the request can be served by a replica."""
+    if request is None or request.method not in READ_ONLY_METHODS:
+        return False
+    route = request.matched_route
+    if route is None or route.name not in READ_ONLY_ROUTES:
+        return False
+    if route.name in CACHEABLE_ROUTES:
+        return True
+    return request.session.get(PRIMARY_UNTIL_KEY, 0) < time.time()
@@ -34,12 +34,15 @@ def includeme(config: Configurator):
     config.add_route("select_organization", "/select-organization")
     # diagrams
     config.add_route("diagrams", "/diagrams")
+    config.add_route("diagrams_search", "/diagrams/search")
+    config.add_route("diagrams_trash", "/diagrams/trash")
     config.add_route("diagram_entity", "/diagrams/{diagram_id}")
     config.add_route("diagram_view_editor", "/diagrams/{diagram_id}/editor")
     config.add_route("diagram_view_builtin", "/diagrams/{diagram_id}/builtin")
     config.add_route("diagram_view_json", "/diagrams/{diagram_id}/json")
+    config.add_route("diagram_view_preview", "/diagrams/{diagram_id}/preview")
     config.add_route("diagram_view_image_png", "/diagrams/{diagram_id}/image.png")
-    # SVG is old deprecated format, now using PNG, but keeping it for compatibility
+    # PNG is rendered on every change, SVG is rendered on the first request
     config.add_route("diagram_view_image_svg", "/diagrams/{diagram_id}/image.svg")
     # organizations
     config.add_route("organizations", "/organizations")
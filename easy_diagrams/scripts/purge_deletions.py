@@ -0,0 +1,66 @@
+"""Background worker purging deleted organizations and folders in batches, see
+:mod:`easy_diagrams.services.deletions`.
+
+Usage::
+
+    purge_deletions easy_diagrams/config/production.ini DATABASE_URL=...
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+from pyramid.paster import bootstrap
+from pyramid.paster import setup_logging
+
+from easy_diagrams.services import deletions
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "config_uri",
+        help="Configuration file, e.g., easy_diagrams/config/development.ini",
+    )
+    parser.add_argument(
+        "config_vars",
+        nargs="*",
+        default=(),
+        help="Variables required by the config file, e.g. DATABASE_URL=...",
+    )
+    parser.add_argument(
+        "--once", action="store_true", help="Exit when there is nothing to purge"
+    )
+    return parser.parse_args(argv[1:])
+
+
+def run(request, once=False) -> int:
+    settings = request.registry.settings
+    batch_size = int(settings.get("purge_deletions.batch_size", 500))
+    pause = float(settings.get("purge_deletions.pause", 0.1))
+    poll_interval = float(settings.get("purge_deletions.poll_interval", 5))
+    finished = 0
+    while True:
+        # a transaction per batch, so that a crash loses one batch at most
+        with request.tm:
+            job = deletions.purge(request.dbsession, batch_size)
+        if job is None:
+            if once:
+                return finished
+            time.sleep(poll_interval)
+        elif job.finished:
+            finished += 1
+        else:
+            # leaving room for the requests between the batches
+            time.sleep(pause)
+
+
+def main(argv=sys.argv):
+    args = parse_args(argv)
+    options = dict(var.split("=", 1) for var in args.config_vars)
+    setup_logging(args.config_uri)
+    with bootstrap(args.config_uri, options=options) as env:
+        run(env["request"], once=args.once)
@@ -0,0 +1,68 @@
+"""Background worker purging the diagrams in the trash past the retention in
+batches, see :mod:`easy_diagrams.services.trash`.
+
+Usage::
+
+    purge_trash easy_diagrams/config/production.ini DATABASE_URL=...
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+from pyramid.paster import bootstrap
+from pyramid.paster import setup_logging
+
+from easy_diagrams.services import trash
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "config_uri",
+        help="Configuration file, e.g., easy_diagrams/config/development.ini",
+    )
+    parser.add_argument(
+        "config_vars",
+        nargs="*",
+        default=(),
+        help="Variables required by the config file, e.g. DATABASE_URL=...",
+    )
+    parser.add_argument(
+        "--once", action="store_true", help="Exit when there is nothing to purge"
+    )
+    return parser.parse_args(argv[1:])
+
+
+def run(request, once=False) -> int:
+    settings = request.registry.settings
+    retention_days = int(
+        settings.get("diagrams.trash.retention_days", trash.DEFAULT_RETENTION_DAYS)
+    )
+    batch_size = int(settings.get("purge_trash.batch_size", 500))
+    pause = float(settings.get("purge_trash.pause", 0.1))
+    poll_interval = float(settings.get("purge_trash.poll_interval", 60))
+    purged = 0
+    while True:
+        # a transaction per batch, so that a crash loses one batch at most
+        with request.tm:
+            batch = trash.purge(request.dbsession, retention_days, batch_size)
+        purged += batch
+        if batch < batch_size:
+            if once:
+                return purged
+            time.sleep(poll_interval)
+        else:
+            # leaving room for the requests between the batches
+            time.sleep(pause)
+
+
+def main(argv=sys.argv):
+    args = parse_args(argv)
+    options = dict(var.split("=", 1) for var in args.config_vars)
+    setup_logging(args.config_uri)
+    with bootstrap(args.config_uri, options=options) as env:
+        run(env["request"], once=args.once)
@@ -0,0 +1,59 @@
+"""Recount the folders and diagrams of every folder and correct the folder
+counters which drifted.
+
+Usage::
+
+    reconcile_counters easy_diagrams/config/production.ini DATABASE_URL=...
+"""
+
+import argparse
+import logging
+import sys
+
+from pyramid.paster import bootstrap
+from pyramid.paster import setup_logging
+from sqlalchemy import select
+
+from easy_diagrams.models.organization import OrganizationTable
+from easy_diagrams.services import folder_counters
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "config_uri",
+        help="Configuration file, e.g., easy_diagrams/config/development.ini",
+    )
+    parser.add_argument(
+        "config_vars",
+        nargs="*",
+        default=(),
+        help="Variables required by the config file, e.g. DATABASE_URL=...",
+    )
+    return parser.parse_args(argv[1:])
+
+
+def run(request) -> int:
+    with request.tm:
+        organization_ids = request.dbsession.scalars(
+            select(OrganizationTable.id).order_by(OrganizationTable.id)
+        ).all()
+    corrected = 0
+    for organization_id in organization_ids:
+        # a transaction per organization to hold the counters lock briefly
+        with request.tm:
+            corrected += folder_counters.reconcile(request.dbsession, organization_id)
+    logger.info(
+        "Corrected %d counters of %d organizations", corrected, len(organization_ids)
+    )
+    return corrected
+
+
+def main(argv=sys.argv):
+    args = parse_args(argv)
+    options = dict(var.split("=", 1) for var in args.config_vars)
+    setup_logging(args.config_uri)
+    with bootstrap(args.config_uri, options=options) as env:
+        run(env["request"])
@@ -0,0 +1,81 @@
+"""Extract the kind and the symbols of every diagram code again, e.g. after
+the scanner learned new declarations.
+
+Usage::
+
+    reindex_symbols easy_diagrams/config/production.ini DATABASE_URL=...
+"""
+
+import argparse
+import logging
+import sys
+
+from pyramid.paster import bootstrap
+from pyramid.paster import setup_logging
+from sqlalchemy import select
+from sqlalchemy import update
+
+from easy_diagrams.models.diagram import DiagramTable
+from easy_diagrams.services import diagram_symbols
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "config_uri",
+        help="Configuration file, e.g., easy_diagrams/config/development.ini",
+    )
+    parser.add_argument(
+        "config_vars",
+        nargs="*",
+        default=(),
+        help="Variables required by the config file, e.g. DATABASE_URL=...",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=500,
+        help="Number of diagrams reindexed per transaction",
+    )
+    return parser.parse_args(argv[1:])
+
+
+def run(request, batch_size=500) -> int:
+    reindexed = 0
+    last_id = ""
+    while True:
+        # a transaction per batch to not hold the locks of the whole table
+        with request.tm:
+            diagrams = request.dbsession.execute(
+                select(DiagramTable.id, DiagramTable.organization_id, DiagramTable.code)
+                .filter(DiagramTable.id > last_id)
+                .order_by(DiagramTable.id)
+                .limit(batch_size)
+                .with_for_update()
+            ).all()
+            for diagram in diagrams:
+                symbols = diagram_symbols.scan(diagram.code)
+                request.dbsession.execute(
+                    update(DiagramTable).filter_by(id=diagram.id)
+                    # reindexing is not an edit of the diagram
+                    .values(kind=symbols.kind, updated_at=DiagramTable.updated_at)
+                )
+                diagram_symbols.store(
+                    request.dbsession, diagram.organization_id, diagram.id, symbols
+                )
+        if not diagrams:
+            break
+        reindexed += len(diagrams)
+        last_id = diagrams[-1].id
+    logger.info("Reindexed the symbols of %d diagrams", reindexed)
+    return reindexed
+
+
+def main(argv=sys.argv):
+    args = parse_args(argv)
+    options = dict(var.split("=", 1) for var in args.config_vars)
+    setup_logging(args.config_uri)
+    with bootstrap(args.config_uri, options=options) as env:
+        run(env["request"], args.batch_size)
@@ -0,0 +1,88 @@
+"""Background worker rendering the edited diagrams.
+
+Usage::
+
+    render_worker easy_diagrams/config/production.ini DATABASE_URL=...
+"""
+
+import argparse
+import logging
+import sys
+import time
+from datetime import timedelta
+
+from pyramid.paster import bootstrap
+from pyramid.paster import setup_logging
+
+from easy_diagrams import interfaces
+from easy_diagrams.exceptions import RenderSupersededError
+from easy_diagrams.services.render_worker import RenderWorker
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "config_uri",
+        help="Configuration file, e.g., easy_diagrams/config/development.ini",
+    )
+    parser.add_argument(
+        "config_vars",
+        nargs="*",
+        default=(),
+        help="Variables required by the config file, e.g. DATABASE_URL=...",
+    )
+    parser.add_argument(
+        "--once", action="store_true", help="Render a single batch and exit"
+    )
+    return parser.parse_args(argv[1:])
+
+
+def run(request, once=False):
+    settings = request.registry.settings
+    batch_size = int(settings.get("render_worker.batch_size", 10))
+    poll_interval = float(settings.get("render_worker.poll_interval", 0.5))
+    worker = RenderWorker(
+        request.dbsession,
+        request.find_service(interfaces.IDiagramRenderer),
+        lease=timedelta(seconds=float(settings.get("render_worker.lease", 60))),
+    )
+    while True:
+        with request.tm:
+            jobs = worker.claim(batch_size)
+        stored = 0
+        for job in jobs:
+            # rendering outside of the transaction to not hold a connection;
+            # failed renders are not stored, the diagram is claimed again once
+            # its claim expires
+            try:
+                images = worker.render(job)
+            except RenderSupersededError:
+                continue
+            except Exception:
+                logger.exception("Failed to render diagram %s", job.id)
+                continue
+            if not all(images.values()):
+                logger.warning("PlantUML failed to render diagram %s", job.id)
+                continue
+            try:
+                with request.tm:
+                    if worker.apply(job, images):
+                        stored += 1
+                    else:
+                        logger.debug("Discarded stale render of diagram %s", job.id)
+            except Exception:
+                logger.exception("Failed to store the render of diagram %s", job.id)
+        if once:
+            return
+        if not stored:
+            time.sleep(poll_interval)
+
+
+def main(argv=sys.argv):
+    args = parse_args(argv)
+    options = dict(var.split("=", 1) for var in args.config_vars)
+    setup_logging(args.config_uri)
+    with bootstrap(args.config_uri, options=options) as env:
+        run(env["request"], once=args.once)
@@ -1,3 +1,6 @@
+import time
+import weakref
+
 from pyramid.authentication import AuthTktCookieHelper
 from pyramid.authorization import ACLHelper
 from pyramid.authorization import Authenticated
@@ -5,26 +8,81 @@ from pyramid.authorization import Everyone
 from pyramid.config import Configurator
 from pyramid.csrf import CookieCSRFStoragePolicy
 from pyramid.request import RequestLocalCache
+from pyramid.settings import asbool
+from sqlalchemy import event
+from sqlalchemy import inspect
+from sqlalchemy import select
 
 from easy_diagrams import models
+from easy_diagrams.caching import LRUCache
+from easy_diagrams.domain.user import Identity
 
 
 class SecurityPolicy:
-    def __init__(self, secret):
+    """Authenticates users by a signed ticket cookie.
+
+    The identities of the users are cached by the process for ``ttl``
+    seconds, so that requests don't look the user up. A user disabled by this
+    process is forgotten right away, see :meth:`invalidate`, the other
+    processes forget the user once the cached identity expires.
+
+    With ``trust_ticket``, the ticket is trusted to identify an enabled user
+    for ``ttl`` seconds after it was issued, without looking the user up even
+    on a cache miss. Older tickets are reissued once the user is looked up.
+    """
+
+    def __init__(self, secret, ttl=60, maxsize=10_000, trust_ticket=False):
+        self.ttl = ttl
+        self.trust_ticket = trust_ticket
         self.authtkt = AuthTktCookieHelper(
-            secret, samesite="None", secure=True, max_age=15552000
+            secret,
+            samesite="None",
+            secure=True,
+            max_age=15552000,
+            reissue_time=ttl if trust_ticket else None,
         )
         self.identity_cache = RequestLocalCache(self.load_identity)
+        self.identities = LRUCache(maxsize, ttl=ttl)
         self.acl = ACLHelper()
+        _policies.add(self)
+
+    def load_identity(self, request) -> Identity | None:
+        ticket = self.authtkt.identify(request)
+        if ticket is None:
+            return None
 
-    def load_identity(self, request):
-        identity = self.authtkt.identify(request)
-        if identity is None:
+        userid = ticket["userid"]
+        if self.trust_ticket and time.time() - ticket["timestamp"] < self.ttl:
+            # identities disabled by this process are cached as such
+            identity = self.identities.get(userid) or Identity(id=userid)
+        else:
+            identity = self.identities.get(userid)
+            if identity is None:
+                identity = self._lookup(request, userid)
+                self.identities.set(userid, identity)
+        if not identity.enabled:
+            if self.trust_ticket:
+                # overriding the ticket reissued by ``identify``
+                request.add_response_callback(
+                    lambda request, response: response.headerlist.extend(
+                        self.forget(request)
+                    )
+                )
             return None
+        return identity
 
-        userid = identity["userid"]
-        user = request.dbsession.query(models.User).get(userid)
-        return user
+    def _lookup(self, request, userid) -> Identity:
+        user = request.dbsession.execute(
+            select(models.User.id, models.User.enabled).filter_by(id=userid)
+        ).one_or_none()
+        if user is None:
+            return Identity(id=userid, enabled=False)
+        # users are enabled unless disabled explicitly
+        return Identity(id=user.id, enabled=user.enabled is not False)
+
+    def invalidate(self, userid):
+        """Forget the cached identity of the user, e.g. once disabled."""
+        self.identities.pop(str(userid), None)
 
     def identity(self, request):
         return self.identity_cache.get_or_create(request)
@@ -62,4 +120,23 @@ def includeme(config: Configurator):
         CookieCSRFStoragePolicy(samesite="None", secure=True)
     )
     config.set_default_csrf_options(require_csrf=True)
-    config.set_security_policy(SecurityPolicy(settings["auth.secret"]))
+    policy = SecurityPolicy(
+        settings["auth.secret"],
+        ttl=float(settings.get("auth.identity_cache.ttl", 60)),
+        maxsize=int(settings.get("auth.identity_cache.size", 10_000)),
+        trust_ticket=asbool(settings.get("auth.trust_ticket", False)),
+    )
+    config.set_security_policy(policy)
+
+
+#: Policies of the apps of the process, which cache identities
+_policies: "weakref.WeakSet[SecurityPolicy]" = weakref.WeakSet()
+
+
+@event.listens_for(models.User, "after_update")
+def _invalidate_identity(mapper, connection, user):
+    # registered once for the process, the policies of apps which are gone
+    # are dropped from the weak set
+    if inspect(user).attrs.enabled.history.has_changes():
+        for policy in list(_policies):
+            policy.invalidate(user.id)
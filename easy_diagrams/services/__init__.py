@@ -3,4 +3,5 @@ def includeme(config):
     config.include(".diagram_renderer")
     config.include(".diagram_repo")
     config.include(".folder_repo")
+    config.include(".listing_query")
     config.include(".organization_repo")
@@ -0,0 +1,173 @@
+"""Background deletion of organizations and folders with their content, see
+:class:`easy_diagrams.models.deletion.DeletionJobTable`.
+
+Deleting a large organization or folder at once would hold the locks of its
+diagrams, images and folders for as long as it takes, or fail on their
+foreign keys. Instead, the organization or folder is tombstoned and a job is
+scheduled, which :func:`purge` works off in bounded batches: the diagrams
+with their images and symbols first, then the folders from the deepest ones,
+the members of an organization and finally the organization itself.
+"""
+
+from collections import Counter
+from datetime import datetime
+from logging import getLogger
+from uuid import UUID
+
+from sqlalchemy import and_
+from sqlalchemy import delete
+from sqlalchemy import func
+from sqlalchemy import insert
+from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy import true
+
+from easy_diagrams.domain.deletion import DeletionJob
+from easy_diagrams.models.deletion import DeletionJobTable
+from easy_diagrams.models.diagram import DiagramTable
+from easy_diagrams.models.folder import FolderCounterTable
+from easy_diagrams.models.folder import FolderTable
+from easy_diagrams.models.organization import OrganizationTable
+from easy_diagrams.models.organization import organization_user_association
+from easy_diagrams.services import folder_counters
+
+logger = getLogger(__name__)
+
+
+def schedule(
+    dbsession, organization_id: UUID, folder_id=None, subtree_path=None
+) -> int:
+    """Schedule the deletion of the tombstoned organization, or of its folder
+    and the folders under the subtree path. Returns the id of the job."""
+    return dbsession.execute(
+        insert(DeletionJobTable)
+        .values(
+            organization_id=organization_id,
+            folder_id=folder_id,
+            subtree_path=subtree_path,
+        )
+        .returning(DeletionJobTable.id)
+    ).scalar_one()
+
+
+def purge(dbsession, batch_size: int = 500) -> DeletionJob | None:
+    """Purge a batch of the oldest pending deletion, ``None`` when there is
+    none. Jobs are locked, so that concurrent purges work on different jobs."""
+    job = dbsession.scalars(
+        select(DeletionJobTable)
+        .filter(DeletionJobTable.finished_at.is_(None))
+        .order_by(DeletionJobTable.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).first()
+    if job is None:
+        return None
+
+    if diagrams := _purge_diagrams(dbsession, job, batch_size):
+        job.diagrams += diagrams
+    elif folders := _purge_folders(dbsession, job, batch_size):
+        job.folders += folders
+    elif job.folder_id is None and (
+        members := _purge_members(dbsession, job, batch_size)
+    ):
+        job.members += members
+    else:
+        if job.folder_id is None:
+            dbsession.execute(
+                delete(OrganizationTable).filter_by(id=job.organization_id)
+            )
+        job.finished_at = datetime.now()
+    logger.info(
+        "Deletion %s of %s purged %d diagrams, %d folders and %d members%s",
+        job.id,
+        f"folder {job.folder_id}" if job.folder_id else "organization",
+        job.diagrams,
+        job.folders,
+        job.members,
+        ", finished" if job.finished_at else "",
+    )
+    return DeletionJob(
+        id=job.id,
+        organization_id=job.organization_id,
+        folder_id=job.folder_id,
+        diagrams=job.diagrams,
+        folders=job.folders,
+        members=job.members,
+        finished=job.finished_at is not None,
+    )
+
+
+def _folders(job: DeletionJobTable):
+    """Condition matching the folders deleted by the job."""
+    if job.folder_id is None:
+        return FolderTable.organization_id == job.organization_id
+    return and_(
+        FolderTable.organization_id == job.organization_id,
+        or_(FolderTable.id == job.folder_id, FolderTable.in_subtree(job.subtree_path)),
+    )
+
+
+def _purge_diagrams(dbsession, job: DeletionJobTable, batch_size: int) -> int:
+    """Delete a batch of diagrams, their images and symbols are deleted by
+    cascade. The counters of their folders are updated, but for the diagrams
+    in the trash which were uncounted already."""
+    in_folders = (
+        DiagramTable.folder_id.in_(select(FolderTable.id).filter(_folders(job)))
+        if job.folder_id is not None
+        else true()
+    )
+    batch = (
+        select(DiagramTable.id)
+        .filter(DiagramTable.organization_id == job.organization_id, in_folders)
+        .limit(batch_size)
+    )
+    rows = dbsession.execute(
+        delete(DiagramTable)
+        .filter(DiagramTable.id.in_(batch.scalar_subquery()))
+        .returning(DiagramTable.folder_id, DiagramTable.deleted_at)
+    ).all()
+    counted = Counter(row.folder_id for row in rows if row.deleted_at is None)
+    for folder_id, count in counted.items():
+        folder_counters.bump(dbsession, job.organization_id, folder_id, diagrams=-count)
+    return len(rows)
+
+
+def _purge_folders(dbsession, job: DeletionJobTable, batch_size: int) -> int:
+    """Delete a batch of folders, once their diagrams are deleted. The deepest
+    folders come first, so that a folder is deleted with its subfolders, or
+    after them."""
+    batch = (
+        select(FolderTable.id)
+        .filter(_folders(job))
+        .order_by(func.length(FolderTable.path).desc(), FolderTable.id)
+        .limit(batch_size)
+    )
+    folder_ids = dbsession.scalars(
+        delete(FolderTable)
+        .filter(FolderTable.id.in_(batch.scalar_subquery()))
+        .returning(FolderTable.id)
+    ).all()
+    if folder_ids:
+        dbsession.execute(
+            delete(FolderCounterTable).filter(
+                FolderCounterTable.organization_id == job.organization_id,
+                FolderCounterTable.folder_id.in_(folder_ids),
+            )
+        )
+    return len(folder_ids)
+
+
+def _purge_members(dbsession, job: DeletionJobTable, batch_size: int) -> int:
+    """Remove a batch of the members of the deleted organization."""
+    members = organization_user_association.c
+    batch = (
+        select(members.user_id)
+        .filter(members.organization_id == job.organization_id)
+        .limit(batch_size)
+    )
+    return dbsession.execute(
+        organization_user_association.delete().where(
+            members.organization_id == job.organization_id,
+            members.user_id.in_(batch.scalar_subquery()),
+        )
+    ).rowcount
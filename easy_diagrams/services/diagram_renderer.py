@@ -1,51 +1,479 @@
+import atexit
+import functools
+import os
+import queue
+import select
+import threading
+import time
+import uuid
+from concurrent.futures import Future
 from logging import getLogger
+from subprocess import DEVNULL
 from subprocess import PIPE
 from subprocess import Popen
+from subprocess import TimeoutExpired
+from subprocess import run
+from typing import Callable
+from typing import Hashable
 
 from pyramid.request import Request
 
 from easy_diagrams import interfaces
 from easy_diagrams.domain.diagram import Diagram
+from easy_diagrams.exceptions import RenderSupersededError
+from easy_diagrams.services.render_cache import RenderCache
 
 logger = getLogger(__name__)
 
+PLANTUML_ENV = {"PLANTUML_LIMIT_SIZE": "8192", "PLANTUML_SECURITY_PROFILE": "SANDBOX"}
+
 
 class PlantUMLRendererService:
 
-    def __init__(self, settings):
+    def __init__(
+        self,
+        settings,
+        pool: "PlantUMLPool | None" = None,
+        cache: RenderCache | None = None,
+        slots: "RenderSlots | None" = None,
+    ):
         self.settings = settings
+        self.pool = pool
+        self.cache = cache
+        self.slots = slots
+
+    def render(self, diagram: Diagram, file_format: str = "png") -> bytes:
+        """Render the diagram.
+
+        Raises :class:`RenderSupersededError` if a render of newer code of the
+        same diagram was started meanwhile.
+        """
+        if self.cache is None:
+            return self._coalesced_render(diagram, file_format)
+        key = self.cache.key(diagram.code, file_format)
+        image = self.cache.get(key)
+        if image is None:
+            image = self._coalesced_render(diagram, file_format)
+            if image:
+                self.cache.set(key, image)
+        return image
+
+    def _coalesced_render(self, diagram: Diagram, file_format: str) -> bytes:
+        if self.slots is None:
+            return self._render(diagram.code, file_format)
+        return self.slots.render(
+            (diagram.id, file_format),
+            diagram.code_version,
+            lambda slot: self._render(diagram.code, file_format, slot),
+        )
 
-    def render(self, diagram: Diagram) -> bytes:
+    def _render(
+        self, code: str, file_format: str, slot: "RenderSlot | None" = None
+    ) -> bytes:
+        if self.pool is not None:
+            return self.pool.render(code, file_format, slot)
         return convert(
-            diagram.code,
+            code,
             use_local_plantuml=self.settings.get("use_local_plantuml") == "true",
+            file_format=file_format,
+            slot=slot,
         )
 
 
-def convert(puml, use_local_plantuml=False) -> bytes:
+class RenderSlot:
+    """A render of one version of a diagram, which can be cancelled.
+
+    A slot cancelled before :meth:`started` never starts rendering. A one-shot
+    process registered with :meth:`started` is killed by cancelling the slot,
+    while a render in a pooled process is let finish and its result is thrown
+    away, as killing the warm JVM would cost a cold start of a new one.
+    """
+
+    def __init__(self, version: int | None):
+        self.version = version
+        self.future = Future()
+        self.cancelled = threading.Event()
+        self._proc = None
+        self._lock = threading.Lock()
+
+    def started(self, proc: Popen | None = None) -> bool:
+        """Mark the slot as rendering, `False` if it's cancelled.
+
+        The one-shot ``proc`` doing the render is killed on cancelling.
+        """
+        with self._lock:
+            if self.cancelled.is_set():
+                return False
+            self._proc = proc
+            return True
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled.set()
+            if self._proc is not None and self._proc.poll() is None:
+                self._proc.kill()
+
+
+class RenderSlots:
+    """Per-diagram render slots shared by all requests of the process.
+
+    A render of a newer code version of a diagram cancels the render of an
+    older one, and concurrent renders of the same version share a single
+    result. So a fast typist leaves at most one render of a diagram running
+    instead of a render per keystroke.
+    """
+
+    def __init__(self):
+        self._slots: dict[Hashable, RenderSlot] = {}
+        self._lock = threading.Lock()
+
+    def render(
+        self,
+        diagram_id: Hashable,
+        version: int | None,
+        render: Callable[[RenderSlot], bytes],
+    ) -> bytes:
+        with self._lock:
+            slot = self._slots.get(diagram_id)
+            if slot is not None and slot.version == version:
+                owner = False
+            elif slot is not None and _is_newer(slot.version, version):
+                raise RenderSupersededError(
+                    f"Diagram {diagram_id} version {version} is outdated."
+                )
+            else:
+                if slot is not None:
+                    slot.cancel()
+                slot = self._slots[diagram_id] = RenderSlot(version)
+                owner = True
+        if not owner:
+            return slot.future.result()
+        try:
+            image = render(slot)
+            if slot.cancelled.is_set():
+                raise RenderSupersededError(
+                    f"Diagram {diagram_id} version {version} was superseded."
+                )
+        except BaseException as e:
+            slot.future.set_exception(e)
+            raise
+        else:
+            slot.future.set_result(image)
+            return image
+        finally:
+            with self._lock:
+                if self._slots.get(diagram_id) is slot:
+                    del self._slots[diagram_id]
 
+
+def _is_newer(version: int | None, than: int | None) -> bool:
+    return version is not None and than is not None and version > than
+
+
+def plantuml_command(use_local_plantuml=False) -> list[str]:
     if use_local_plantuml:
-        cmd = ["plantuml", "-tpng", "-p"]
-    else:
-        cmd = ["java", "-jar", "/plantuml/plantuml.jar", "-tpng", "-p"]
+        return ["plantuml"]
+    return ["java", "-jar", "/plantuml/plantuml.jar"]
+
+
+@functools.cache
+def plantuml_version(use_local_plantuml=False) -> str:
+    """Version of the installed PlantUML, for example ``1.2025.3``."""
+    try:
+        proc = run(
+            plantuml_command(use_local_plantuml) + ["-version"],
+            capture_output=True,
+            env=PLANTUML_ENV,
+            cwd="/tmp/",
+            timeout=60,
+        )
+        # the first line looks like "PlantUML version 1.2025.3 (Sun Mar 09 ...)"
+        return proc.stdout.decode().split()[2]
+    except (OSError, IndexError, TimeoutExpired) as e:
+        logger.warning("Failed to detect PlantUML version: %s", e)
+        return "unknown"
+
+
+def convert(
+    puml,
+    use_local_plantuml=False,
+    file_format="png",
+    slot: RenderSlot | None = None,
+) -> bytes:
+    cmd = plantuml_command(use_local_plantuml) + [f"-t{file_format}", "-p"]
 
     proc = Popen(
         cmd,
         stdout=PIPE,
         stdin=PIPE,
         stderr=PIPE,
-        env={"PLANTUML_LIMIT_SIZE": "8192", "PLANTUML_SECURITY_PROFILE": "SANDBOX"},
+        env=PLANTUML_ENV,
         cwd="/tmp/",
     )
+    if slot is not None and not slot.started(proc):
+        proc.kill()
     stdout_data, stderrs = proc.communicate(input=puml.encode())
     if proc.returncode != 0:
         logger.warning("PlantUML error detected: %s", stderrs)
     return stdout_data
 
 
+def pipe_source(puml: str) -> str:
+    """Prepare the code for a long-lived PlantUML process in the pipe mode.
+
+    In the pipe mode PlantUML reads stdin until a line starting with ``@end``
+    and renders everything read so far, so the source must contain exactly one
+    such line at its end, otherwise the process would wait for more input or
+    render the remaining part as a separate image.
+    """
+    lines = []
+    for line in puml.splitlines():
+        lines.append(line)
+        if line.strip().startswith("@end"):
+            break
+    else:
+        lines.append("@enduml")
+    return "\n".join(lines) + "\n"
+
+
+class PlantUMLProcess:
+    """A single PlantUML JVM running in the pipe mode.
+
+    Every diagram written to stdin is answered with the image followed by the
+    delimiter line on stdout. The process is started with ``-tpng``, other
+    formats are requested with the ``@@@format`` header of the diagram.
+    """
+
+    def __init__(self, cmd: list[str], env: dict | None = None, cwd: str = "/tmp/"):
+        self.delimiter = f"--easy-diagrams-{uuid.uuid4().hex}--"
+        self.cmd = cmd + [
+            "-tpng",
+            "-pipe",
+            "-pipedelimitor",
+            self.delimiter,
+        ]
+        self.env = PLANTUML_ENV if env is None else env
+        self.cwd = cwd
+        self.renders = 0
+        self.proc = Popen(
+            self.cmd,
+            stdout=PIPE,
+            stdin=PIPE,
+            # nothing reads the stderr of the long-lived process, a full pipe
+            # would block the JVM and every render after it; the syntax errors
+            # are written there, so that stdout holds only the (error) image
+            stderr=DEVNULL,
+            env=self.env,
+            cwd=self.cwd,
+        )
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def rss(self) -> int | None:
+        """Resident memory of the process in bytes, `None` if unknown."""
+        try:
+            with open(f"/proc/{self.proc.pid}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError, IndexError):
+            pass
+        return None
+
+    def render(self, puml: str, timeout: float, file_format: str = "png") -> bytes:
+        # the format is sticky in the pipe mode, so it's set for every diagram
+        source = f"@@@format {file_format}\n" + pipe_source(puml)
+        self.proc.stdin.write(source.encode())
+        self.proc.stdin.flush()
+        self.renders += 1
+        terminator = f"{self.delimiter}\n".encode()
+        deadline = time.monotonic() + timeout
+        fd = self.proc.stdout.fileno()
+        output = bytearray()
+        while not output.endswith(terminator):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"PlantUML did not respond in {timeout}s")
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise EOFError("PlantUML process exited unexpectedly")
+            output += chunk
+        return bytes(output[: -len(terminator)])
+
+    def kill(self):
+        if self.alive:
+            self.proc.kill()
+        self.proc.wait()
+        for stream in (self.proc.stdin, self.proc.stdout):
+            stream.close()
+
+
+class PlantUMLPool:
+    """Pool of long-lived PlantUML processes.
+
+    Processes are spawned lazily on first use and recycled after
+    ``max_renders`` renders, when their resident memory exceeds ``max_memory``
+    bytes, or when they die, time out or fail to render.
+    """
+
+    def __init__(
+        self,
+        cmd: list[str],
+        size: int = 1,
+        max_renders: int = 1000,
+        max_memory: int | None = None,
+        timeout: float = 30,
+        env: dict | None = None,
+    ):
+        self.cmd = cmd
+        self.size = size
+        self.max_renders = max_renders
+        self.max_memory = max_memory
+        self.timeout = timeout
+        self.env = env
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # processes are not shared with forked children (e.g. gunicorn workers)
+        self._pid = os.getpid()
+        self._processes = []
+        self._idle = queue.LifoQueue()
+        for _ in range(self.size):
+            self._idle.put(None)
+
+    def _spawn(self) -> PlantUMLProcess:
+        process = PlantUMLProcess(self.cmd, env=self.env)
+        with self._lock:
+            self._processes.append(process)
+        logger.info("Spawned PlantUML process %s", process.proc.pid)
+        return process
+
+    def _retire(self, process: PlantUMLProcess, reason: str):
+        logger.info("Recycling PlantUML process %s: %s", process.proc.pid, reason)
+        process.kill()
+        with self._lock:
+            if process in self._processes:
+                self._processes.remove(process)
+
+    def is_healthy(self, process: PlantUMLProcess) -> bool:
+        if not process.alive:
+            return False
+        if process.renders >= self.max_renders:
+            return False
+        if self.max_memory is not None:
+            rss = process.rss()
+            if rss is not None and rss > self.max_memory:
+                return False
+        return True
+
+    def _wait_idle(self, slot: RenderSlot | None) -> PlantUMLProcess | None:
+        if slot is None:
+            return self._idle.get()
+        # polling, so that a job cancelled while queued leaves the queue
+        while not slot.cancelled.is_set():
+            try:
+                return self._idle.get(timeout=0.05)
+            except queue.Empty:
+                continue
+        raise RenderSupersededError("Render was cancelled while queued.")
+
+    def _acquire(self, slot: RenderSlot | None = None) -> PlantUMLProcess:
+        if self._pid != os.getpid():
+            self._reset()
+        process = self._wait_idle(slot)
+        if process is not None and not self.is_healthy(process):
+            self._retire(process, "health check failed")
+            process = None
+        if process is None:
+            try:
+                process = self._spawn()
+            except Exception:
+                self._idle.put(None)
+                raise
+        return process
+
+    def _release(self, process: PlantUMLProcess | None):
+        if process is not None and not self.is_healthy(process):
+            self._retire(process, "health check failed")
+            process = None
+        self._idle.put(process)
+
+    def render(
+        self, puml: str, file_format: str = "png", slot: RenderSlot | None = None
+    ) -> bytes:
+        process = self._acquire(slot)
+        try:
+            # a render started already is not interrupted, the process stays
+            # warm and the superseded result is dropped by `RenderSlots`
+            if slot is not None and not slot.started():
+                raise RenderSupersededError("Render was cancelled while queued.")
+            return process.render(puml, self.timeout, file_format)
+        except (OSError, TimeoutError, EOFError) as e:
+            logger.warning("PlantUML process %s failed: %s", process.proc.pid, e)
+            self._retire(process, "render failed")
+            process = None
+            return b""
+        finally:
+            self._release(process)
+
+    def close(self):
+        with self._lock:
+            processes, self._processes = self._processes, []
+        for process in processes:
+            process.kill()
+
+
+def pool_from_settings(settings) -> PlantUMLPool | None:
+    size = int(settings.get("plantuml.pool.size", 0))
+    if size <= 0:
+        return None
+    max_memory_mb = settings.get("plantuml.pool.max_memory_mb")
+    pool = PlantUMLPool(
+        plantuml_command(settings.get("use_local_plantuml") == "true"),
+        size=size,
+        max_renders=int(settings.get("plantuml.pool.max_renders", 1000)),
+        max_memory=int(max_memory_mb) * 1024 * 1024 if max_memory_mb else None,
+        timeout=float(settings.get("plantuml.pool.timeout", 30)),
+    )
+    atexit.register(pool.close)
+    return pool
+
+
+def cache_from_settings(settings) -> RenderCache | None:
+    memory_mb = int(settings.get("plantuml.cache.memory_mb", 0))
+    directory = settings.get("plantuml.cache.dir") or None
+    if memory_mb <= 0 and directory is None:
+        return None
+    # detecting the version lazily, as it requires starting a JVM
+    version = settings.get("plantuml.version") or functools.partial(
+        plantuml_version, settings.get("use_local_plantuml") == "true"
+    )
+    return RenderCache(
+        version,
+        max_memory_bytes=memory_mb * 1024 * 1024,
+        directory=directory,
+        max_disk_bytes=int(settings.get("plantuml.cache.disk_mb", 1024)) * 1024 * 1024,
+    )
+
+
 def renderer_factory(context, request: Request):
-    return PlantUMLRendererService(request.registry.settings)
+    return PlantUMLRendererService(
+        request.registry.settings,
+        request.registry.get("plantuml_pool"),
+        request.registry.get("render_cache"),
+        request.registry.get("render_slots"),
+    )
 
 
 def includeme(config):
+    settings = config.get_settings()
+    config.registry["plantuml_pool"] = pool_from_settings(settings)
+    config.registry["render_cache"] = cache_from_settings(settings)
+    config.registry["render_slots"] = RenderSlots()
     config.register_service_factory(renderer_factory, interfaces.IDiagramRenderer)
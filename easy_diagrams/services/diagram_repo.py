@@ -1,17 +1,40 @@
 from dataclasses import dataclass
+from dataclasses import field
+from datetime import datetime
 from uuid import UUID
 
 from pyramid.request import Request
+from sqlalchemy import REAL
+from sqlalchemy import and_
+from sqlalchemy import case
+from sqlalchemy import cast
 from sqlalchemy import exc as sqlalchemy_exc
+from sqlalchemy import func
+from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy import tuple_
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import aliased
 
 from easy_diagrams import interfaces
+from easy_diagrams.domain.diagram import DEFAULT_RENDER_FORMAT
 from easy_diagrams.domain.diagram import Diagram
 from easy_diagrams.domain.diagram import DiagramEdit
 from easy_diagrams.domain.diagram import DiagramID
 from easy_diagrams.domain.diagram import DiagramListItem
 from easy_diagrams.domain.diagram import DiagramRender
+from easy_diagrams.domain.diagram import DiagramSearchItem
+from easy_diagrams.domain.diagram import DiagramTrashItem
+from easy_diagrams.domain.diagram import RenderInfo
 from easy_diagrams.exceptions import DiagramNotFoundError
+from easy_diagrams.models.diagram import DiagramRenderTable
+from easy_diagrams.models.diagram import DiagramSymbolTable
 from easy_diagrams.models.diagram import DiagramTable
+from easy_diagrams.models.folder import FolderTable
+from easy_diagrams.models.organization import OrganizationTable
+from easy_diagrams.services import diagram_symbols
+from easy_diagrams.services import folder_counters
 
 
 @dataclass
@@ -26,6 +49,8 @@ class DiagramRepository:
     dbsession: object
     diagram_renderer: interfaces.IDiagramRenderer
     organization_id: str
+    #: Diagrams read during the request, by id and whether the image is loaded
+    _cache: dict = field(default_factory=dict, init=False, repr=False)
 
     def create(self, folder_id=None) -> DiagramID:
         if self.organization_id is None:
@@ -35,6 +60,9 @@ class DiagramRepository:
         )
         self.dbsession.add(diagram)
         self.dbsession.flush()
+        folder_counters.bump(
+            self.dbsession, UUID(self.organization_id), folder_id, diagrams=1
+        )
         return DiagramID(diagram.id)
 
     def _get(self, diagram_id) -> DiagramTable:
@@ -44,14 +72,67 @@ class DiagramRepository:
             diagram = (
                 self.dbsession.query(DiagramTable)
                 .filter_by(id=diagram_id, organization_id=UUID(self.organization_id))
+                .filter(self._visible())
                 .one()
             )
         except sqlalchemy_exc.NoResultFound:
             raise DiagramNotFoundError(f"Diagram {diagram_id} not found.")
         return diagram
 
-    def get(self, diagram_id) -> Diagram:
-        diagram = self._get(diagram_id)
+    def get(self, diagram_id, with_image=False) -> Diagram:
+        """Get the diagram, its rendered image is loaded only ``with_image``.
+
+        Diagrams are cached for the lifetime of the repository, which is a
+        single request.
+        """
+        for key in ((diagram_id, True), (diagram_id, with_image)):
+            if key in self._cache:
+                return self._cache[key]
+        self._cache[(diagram_id, with_image)] = diagram = self._load(
+            diagram_id, with_image
+        )
+        return diagram
+
+    def _invalidate(self, diagram_id):
+        self._cache.pop((diagram_id, True), None)
+        self._cache.pop((diagram_id, False), None)
+
+    def _load(self, diagram_id, with_image) -> Diagram:
+        if self.organization_id is None:
+            raise ValueError("organization_id is required for accessing diagrams")
+        query = (
+            select(
+                DiagramTable.id,
+                DiagramTable.organization_id,
+                DiagramTable.title,
+                DiagramTable.is_public,
+                DiagramTable.code,
+                DiagramTable.code_version,
+                DiagramTable.image_version,
+                DiagramTable.folder_id,
+                DiagramTable.updated_at,
+                DiagramRenderTable.version.label("render_version"),
+                # failed renders used to be stored as empty images
+                (func.octet_length(DiagramRenderTable.image) > 0).label("has_image"),
+            )
+            .outerjoin(
+                DiagramRenderTable,
+                and_(
+                    DiagramRenderTable.diagram_id == DiagramTable.id,
+                    DiagramRenderTable.format == DEFAULT_RENDER_FORMAT,
+                ),
+            )
+            .filter(
+                DiagramTable.id == diagram_id,
+                DiagramTable.organization_id == UUID(self.organization_id),
+                self._visible(),
+            )
+        )
+        if with_image:
+            query = query.add_columns(DiagramRenderTable.image)
+        diagram = self.dbsession.execute(query).one_or_none()
+        if diagram is None:
+            raise DiagramNotFoundError(f"Diagram {diagram_id} not found.")
         return Diagram(
             id=DiagramID(diagram.id),
             organization_id=diagram.organization_id,
@@ -60,18 +141,127 @@ class DiagramRepository:
             code=diagram.code,
             code_version=diagram.code_version,
             render=(
-                DiagramRender(image=diagram.image, version=diagram.image_version)
-                if diagram.image
+                DiagramRender(
+                    image=diagram.image if with_image else None,
+                    version=diagram.render_version,
+                )
+                if diagram.has_image
                 else None
             ),
             folder_id=diagram.folder_id,
+            updated_at=diagram.updated_at,
+            render_pending=bool(diagram.code)
+            and diagram.image_version != diagram.code_version,
         )
 
     def delete(self, diagram_id):
-        diagram = self._get(diagram_id)
-        self.dbsession.delete(diagram)
+        """Move the diagram to the trash, it is hidden at once and purged with
+        its images after the retention, see :mod:`easy_diagrams.services.trash`.
+        """
+        if self.organization_id is None:
+            raise ValueError("organization_id is required for accessing diagrams")
+        self._invalidate(diagram_id)
+        folder_id = self.dbsession.execute(
+            update(DiagramTable)
+            .filter_by(
+                id=diagram_id,
+                organization_id=UUID(self.organization_id),
+                deleted_at=None,
+            )
+            # trashing is not an edit, the diagram keeps its place in listings
+            .values(deleted_at=datetime.now(), updated_at=DiagramTable.updated_at)
+            .returning(DiagramTable.folder_id)
+        ).one_or_none()
+        if folder_id is None:
+            raise DiagramNotFoundError(f"Diagram {diagram_id} not found.")
+        folder_counters.bump(
+            self.dbsession, UUID(self.organization_id), folder_id[0], diagrams=-1
+        )
+
+    def restore(self, diagram_id):
+        """Restore the diagram from the trash, into the root folder when its
+        folder was deleted meanwhile."""
+        if self.organization_id is None:
+            raise ValueError("organization_id is required for accessing diagrams")
+        self._invalidate(diagram_id)
+        live_folder = (
+            select(FolderTable.id)
+            .filter(
+                FolderTable.id == DiagramTable.folder_id,
+                FolderTable.deleted_at.is_(None),
+            )
+            .exists()
+        )
+        folder_id = self.dbsession.execute(
+            update(DiagramTable)
+            .filter(
+                DiagramTable.id == diagram_id,
+                DiagramTable.organization_id == UUID(self.organization_id),
+                DiagramTable.deleted_at.is_not(None),
+            )
+            .values(
+                deleted_at=None,
+                folder_id=case((live_folder, DiagramTable.folder_id), else_=None),
+                updated_at=DiagramTable.updated_at,
+            )
+            .returning(DiagramTable.folder_id)
+        ).one_or_none()
+        if folder_id is None:
+            raise DiagramNotFoundError(f"Diagram {diagram_id} not found in trash.")
+        folder_counters.bump(
+            self.dbsession, UUID(self.organization_id), folder_id[0], diagrams=1
+        )
+
+    def list_deleted(self, limit=100, after=None) -> tuple[DiagramTrashItem, ...]:
+        """List the diagrams in the trash, the most recently trashed first.
+
+        Pages are selected by the ``(deleted_at, id)`` key of the last item of
+        the previous page, see :attr:`DiagramTrashItem.key`.
+        """
+        if self.organization_id is None:
+            raise ValueError("organization_id is required for listing diagrams")
+        query = (
+            select(
+                DiagramTable.id,
+                DiagramTable.title,
+                DiagramTable.is_public,
+                DiagramTable.created_at,
+                DiagramTable.updated_at,
+                DiagramTable.folder_id,
+                DiagramTable.deleted_at,
+            )
+            .filter(
+                DiagramTable.organization_id == UUID(self.organization_id),
+                DiagramTable.deleted_at.is_not(None),
+            )
+            .order_by(DiagramTable.deleted_at.desc(), DiagramTable.id.desc())
+        )
+        if after is not None:
+            query = query.filter(
+                tuple_(DiagramTable.deleted_at, DiagramTable.id) < tuple_(*after)
+            )
+        return tuple(
+            DiagramTrashItem(**row._asdict())
+            for row in self.dbsession.execute(query.limit(limit))
+        )
+
+    def list(
+        self,
+        offset=0,
+        limit=100,
+        folder_id=None,
+        after=None,
+        before=None,
+        recursive=False,
+    ) -> list[DiagramListItem]:
+        """List diagrams, most recently updated first.
 
-    def list(self, offset=0, limit=100, folder_id=None) -> list[DiagramListItem]:
+        Pages can be selected by ``offset`` or, so that deep pages are as cheap
+        as the first one, by the ``(updated_at, id)`` key of the last item of
+        the previous page (``after``) or of the first item of the next page
+        (``before``), see :attr:`DiagramListItem.key`. The diagrams of the
+        subfolders are listed too when ``recursive``.
+        """
         if self.organization_id is None:
             raise ValueError("organization_id is required for listing diagrams")
         query = self.dbsession.query(
@@ -80,51 +270,266 @@ class DiagramRepository:
             DiagramTable.is_public,
             DiagramTable.created_at,
             DiagramTable.updated_at,
-        ).filter_by(organization_id=UUID(self.organization_id))
+        ).filter_by(organization_id=UUID(self.organization_id), deleted_at=None)
 
-        if folder_id is not None:
-            query = query.filter_by(folder_id=folder_id)
+        query = query.filter(self._in_folder(folder_id, recursive))
+
+        key = tuple_(DiagramTable.updated_at, DiagramTable.id)
+        if after is not None:
+            query = query.filter(key < tuple_(*after))
+        if before is not None:
+            # walking backwards from the key, the page is reversed below
+            query = query.filter(key > tuple_(*before)).order_by(
+                DiagramTable.updated_at, DiagramTable.id
+            )
         else:
-            query = query.filter(DiagramTable.folder_id.is_(None))
+            query = query.order_by(
+                DiagramTable.updated_at.desc(), DiagramTable.id.desc()
+            )
 
-        return tuple(
+        items = [
             DiagramListItem(**diagram._asdict())
             for diagram in query.add_columns(DiagramTable.folder_id)
-            .order_by(DiagramTable.updated_at.desc())
             .limit(limit)
             .offset(offset)
             .all()
+        ]
+        if before is not None:
+            items.reverse()
+        return tuple(items)
+
+    def search(self, text: str, limit=20, after=None) -> tuple[DiagramSearchItem, ...]:
+        """Search diagrams by the words of their title and code, or by a
+        substring of them, the most relevant first.
+
+        Pages are selected by the ``(rank, updated_at, id)`` key of the last
+        item of the previous page (``after``), see
+        :attr:`DiagramSearchItem.key`.
+        """
+        if self.organization_id is None:
+            raise ValueError("organization_id is required for searching diagrams")
+        text = text.strip()
+        if not text:
+            return ()
+        words = func.websearch_to_tsquery("simple", text)
+        pattern = "%" + escape_like(text) + "%"
+        matches = (
+            select(
+                DiagramTable.id,
+                DiagramTable.title,
+                DiagramTable.is_public,
+                DiagramTable.created_at,
+                DiagramTable.updated_at,
+                DiagramTable.folder_id,
+                func.ts_rank(DiagramTable.search_vector, words).label("rank"),
+            )
+            .filter(
+                DiagramTable.organization_id == UUID(self.organization_id),
+                self._visible(),
+                or_(
+                    DiagramTable.search_vector.op("@@")(words),
+                    DiagramTable.title.ilike(pattern, escape="\\"),
+                    DiagramTable.code.ilike(pattern, escape="\\"),
+                ),
+            )
+            .subquery("matches")
+        )
+        query = select(matches).order_by(
+            matches.c.rank.desc(), matches.c.updated_at.desc(), matches.c.id.desc()
+        )
+        if after is not None:
+            rank, updated_at, diagram_id = after
+            # the rank is a real, compared as such to not lose the precision
+            query = query.filter(
+                tuple_(matches.c.rank, matches.c.updated_at, matches.c.id)
+                < tuple_(cast(rank, REAL), updated_at, diagram_id)
+            )
+        return tuple(
+            DiagramSearchItem(**row._asdict())
+            for row in self.dbsession.execute(query.limit(limit))
+        )
+
+    def list_referencing(
+        self, symbol: str, limit=100, after=None
+    ) -> tuple[DiagramListItem, ...]:
+        """List diagrams declaring or referencing the symbol, e.g. a
+        participant, a class or an alias, most recently updated first.
+
+        Names are matched case-insensitively. Pages are selected by the
+        ``(updated_at, id)`` key of the last item of the previous page.
+        """
+        return self._list_where(
+            DiagramTable.id.in_(
+                select(DiagramSymbolTable.diagram_id).filter(
+                    DiagramSymbolTable.organization_id == UUID(self.organization_id),
+                    func.lower(DiagramSymbolTable.name) == symbol.lower(),
+                )
+            ),
+            limit,
+            after,
+        )
+
+    def list_by_kind(
+        self, kind: str, limit=100, after=None
+    ) -> tuple[DiagramListItem, ...]:
+        """List diagrams of the kind, e.g. ``uml`` or ``mindmap``, most
+        recently updated first, paginated like :meth:`list_referencing`."""
+        return self._list_where(DiagramTable.kind == kind.lower(), limit, after)
+
+    def _list_where(self, condition, limit, after) -> tuple[DiagramListItem, ...]:
+        if self.organization_id is None:
+            raise ValueError("organization_id is required for listing diagrams")
+        query = (
+            select(
+                DiagramTable.id,
+                DiagramTable.title,
+                DiagramTable.is_public,
+                DiagramTable.created_at,
+                DiagramTable.updated_at,
+                DiagramTable.folder_id,
+            )
+            .filter(
+                DiagramTable.organization_id == UUID(self.organization_id),
+                self._visible(),
+                condition,
+            )
+            .order_by(DiagramTable.updated_at.desc(), DiagramTable.id.desc())
+        )
+        if after is not None:
+            query = query.filter(
+                tuple_(DiagramTable.updated_at, DiagramTable.id) < tuple_(*after)
+            )
+        return tuple(
+            DiagramListItem(**row._asdict())
+            for row in self.dbsession.execute(query.limit(limit))
         )
 
-    def count(self, folder_id=None) -> int:
+    def count(self, folder_id=None, recursive=False) -> int:
         if self.organization_id is None:
             raise ValueError("organization_id is required for counting diagrams")
-        query = self.dbsession.query(DiagramTable).filter_by(
-            organization_id=UUID(self.organization_id)
+        if recursive:
+            return self.dbsession.scalar(
+                select(func.count()).filter(
+                    DiagramTable.organization_id == UUID(self.organization_id),
+                    DiagramTable.deleted_at.is_(None),
+                    self._in_folder(folder_id, recursive),
+                )
+            )
+        _, diagrams = folder_counters.get(
+            self.dbsession, UUID(self.organization_id), folder_id
         )
+        return diagrams
 
-        if folder_id is not None:
-            query = query.filter_by(folder_id=folder_id)
-        else:
-            query = query.filter(DiagramTable.folder_id.is_(None))
-        return query.count()
+    def _visible(self):
+        """Condition matching the diagrams which are neither in the trash nor
+        in a deleted folder or organization, which are hidden until their
+        deletion job purges them, see :mod:`easy_diagrams.services.deletions`.
+        """
+        folder = aliased(FolderTable)
+        return and_(
+            DiagramTable.deleted_at.is_(None),
+            or_(
+                DiagramTable.folder_id.is_(None),
+                select(folder.id)
+                .filter(
+                    folder.id == DiagramTable.folder_id, folder.deleted_at.is_(None)
+                )
+                .exists(),
+            ),
+            select(OrganizationTable.id)
+            .filter(
+                OrganizationTable.id == DiagramTable.organization_id,
+                OrganizationTable.deleted_at.is_(None),
+            )
+            .exists(),
+        )
+
+    def _in_folder(self, folder_id, recursive=False):
+        """Condition matching the diagrams of the folder, ``None`` being the
+        root, and with ``recursive`` the diagrams of its subfolders. The
+        diagrams of deleted folders are left out."""
+        folder = aliased(FolderTable)
+        if not recursive:
+            if folder_id is None:
+                return DiagramTable.folder_id.is_(None)
+            return and_(
+                DiagramTable.folder_id == folder_id,
+                select(folder.id)
+                .filter(folder.id == folder_id, folder.deleted_at.is_(None))
+                .exists(),
+            )
+        if folder_id is None:
+            return or_(
+                DiagramTable.folder_id.is_(None),
+                DiagramTable.folder_id.in_(
+                    select(FolderTable.id).filter(
+                        FolderTable.organization_id == UUID(self.organization_id),
+                        FolderTable.deleted_at.is_(None),
+                    )
+                ),
+            )
+        subtree_path = (
+            select(folder.subtree_path)
+            .filter(
+                folder.id == folder_id,
+                folder.organization_id == UUID(self.organization_id),
+            )
+            .scalar_subquery()
+        )
+        return DiagramTable.folder_id.in_(
+            select(FolderTable.id).filter(
+                FolderTable.organization_id == UUID(self.organization_id),
+                FolderTable.deleted_at.is_(None),
+                or_(
+                    FolderTable.id == folder_id,
+                    FolderTable.in_subtree(subtree_path),
+                ),
+            )
+        )
 
-    def edit(self, diagram_id, changes: DiagramEdit) -> None:
+    def edit(self, diagram_id, changes: DiagramEdit) -> Diagram:
+        self._invalidate(diagram_id)
         diagram = self._get(diagram_id)
         if changes.title is not None:
             diagram.title = changes.title
         if changes.is_public is not None:
             diagram.is_public = changes.is_public
-        if changes.code is not None:
+        if changes.code is not None and changes.code != diagram.code:
             diagram.code = changes.code
-            image = self.diagram_renderer.render(diagram)
-            diagram.set_image(image, diagram.code_version)
+            # the symbols are extracted on save, only when the code changes
+            symbols = diagram_symbols.scan(diagram.code)
+            diagram.kind = symbols.kind
+            diagram_symbols.store(
+                self.dbsession, diagram.organization_id, diagram.id, symbols
+            )
         return self.get(diagram_id)
 
-    def get_image_render(self, diagram_id) -> bytes:
-        try:
-            diagram = self.dbsession.query(DiagramTable).filter_by(id=diagram_id).one()
-        except sqlalchemy_exc.NoResultFound:
+    def _get_image_row(self, diagram_id, file_format, with_image):
+        query = (
+            select(
+                DiagramTable.id,
+                DiagramTable.organization_id,
+                DiagramTable.is_public,
+                DiagramTable.code,
+                DiagramTable.code_version,
+                DiagramRenderTable.version.label("render_version"),
+                DiagramRenderTable.created_at.label("rendered_at"),
+                # failed renders used to be stored as empty images
+                (func.octet_length(DiagramRenderTable.image) > 0).label("has_image"),
+            )
+            .outerjoin(
+                DiagramRenderTable,
+                and_(
+                    DiagramRenderTable.diagram_id == DiagramTable.id,
+                    DiagramRenderTable.format == file_format,
+                ),
+            )
+            .filter(DiagramTable.id == diagram_id, self._visible())
+        )
+        if with_image:
+            query = query.add_columns(DiagramRenderTable.image)
+        diagram = self.dbsession.execute(query).one_or_none()
+        if diagram is None:
             raise DiagramNotFoundError(f"Diagram {diagram_id} not found.")
 
         # Check access permissions
@@ -139,15 +544,78 @@ class DiagramRepository:
                 and not diagram.is_public
             ):
                 raise DiagramNotFoundError(f"Diagram {diagram_id} not found.")
+        return diagram
+
+    def get_image_info(
+        self, diagram_id, file_format=DEFAULT_RENDER_FORMAT
+    ) -> RenderInfo:
+        """Get the metadata of the image served by :meth:`get_image_render`
+        without loading the image itself."""
+        diagram = self._get_image_row(diagram_id, file_format, with_image=False)
+        if not diagram.has_image:
+            raise DiagramNotFoundError(f"Diagram {diagram_id} has no image.")
+        return RenderInfo(
+            version=diagram.render_version,
+            is_public=diagram.is_public,
+            rendered_at=diagram.rendered_at,
+        )
 
+    def get_image_render(self, diagram_id, file_format=DEFAULT_RENDER_FORMAT) -> bytes:
+        """Get the image in the format, rendered by the render worker."""
+        diagram = self._get_image_row(diagram_id, file_format, with_image=True)
         if not diagram.image:
             raise DiagramNotFoundError(f"Diagram {diagram_id} has no image.")
         return diagram.image
 
 
+def escape_like(text: str) -> str:
+    """Escape the LIKE wildcards, with ``\\`` as the escape character."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def apply_render(dbsession, diagram_id, version, images: dict[str, bytes]) -> bool:
+    """Store the images of the code version, by format, with a compare-and-set
+    on the code version of the diagram, so that a render of outdated code never
+    overwrites the images of newer code. Returns `False` if the render is
+    stale."""
+    result = dbsession.execute(
+        update(DiagramTable)
+        .where(DiagramTable.id == diagram_id, DiagramTable._code_version == version)
+        .values(_image_version=version, render_claimed_at=None)
+        .execution_options(synchronize_session="fetch")
+    )
+    if result.rowcount != 1:
+        return False
+    for file_format, image in images.items():
+        store_render(dbsession, diagram_id, file_format, version, image)
+    return True
+
+
+def store_render(dbsession, diagram_id, file_format, version, image):
+    """Store the render unless a render of a newer version is already stored."""
+    stmt = insert(DiagramRenderTable).values(
+        diagram_id=diagram_id,
+        format=file_format,
+        version=version,
+        image=image,
+        created_at=datetime.now(),
+    )
+    dbsession.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[DiagramRenderTable.diagram_id, DiagramRenderTable.format],
+            set_={
+                "version": stmt.excluded.version,
+                "image": stmt.excluded.image,
+                "created_at": stmt.excluded.created_at,
+            },
+            where=DiagramRenderTable.version < stmt.excluded.version,
+        )
+    )
+
+
 def factory(context, request: Request):
     diagram_renderer = request.find_service(interfaces.IDiagramRenderer)
-    organization_id = request.session.get("selected_organization_id")
+    organization_id = request.selected_organization_id
     if not organization_id:
         # For public image access, we can use None as organization_id
         # The get_image_render method handles public diagrams specially
@@ -0,0 +1,162 @@
+"""Symbol index of the diagram codes, see
+:class:`easy_diagrams.models.diagram.DiagramSymbolTable`.
+
+The code is scanned line by line for the ``@start...`` tag, the declarations
+of participants, classes and components with their aliases, and the names
+connected by arrows. The scanner doesn't parse PlantUML, it's meant to be
+cheap enough to run on every save and good enough to find the diagrams which
+mention a name.
+"""
+
+import re
+from uuid import UUID
+
+from sqlalchemy import delete
+from sqlalchemy import insert
+
+from easy_diagrams.domain.diagram import DiagramSymbols
+from easy_diagrams.models.diagram import DiagramSymbolTable
+
+#: Declaration keywords by the type of the symbol they declare
+DECLARATIONS = {
+    "participant": (
+        "participant",
+        "actor",
+        "boundary",
+        "control",
+        "entity",
+        "database",
+        "collections",
+        "queue",
+        "person",
+    ),
+    "class": (
+        "abstract class",
+        "abstract",
+        "class",
+        "interface",
+        "enum",
+        "annotation",
+        "struct",
+        "protocol",
+        "exception",
+        "metaclass",
+        "object",
+        "map",
+        "json",
+    ),
+    "component": (
+        "component",
+        "node",
+        "package",
+        "namespace",
+        "rectangle",
+        "artifact",
+        "cloud",
+        "frame",
+        "folder",
+        "storage",
+        "card",
+        "agent",
+        "file",
+        "stack",
+        "hexagon",
+        "usecase",
+        "state",
+    ),
+}
+SYMBOL_TYPE = {
+    keyword: symbol_type
+    for symbol_type, keywords in DECLARATIONS.items()
+    for keyword in keywords
+}
+
+# quoted, ``[component]``, ``(use case)``, ``:actor:`` or identifier names
+NAME = r'"[^"]+"|\[[^\]]+\]|\([^)]+\)|:[^:]+:|\w[\w.$]*(?:::\w[\w.$]*)*'
+START = re.compile(r"^\s*@start(\w+)", re.MULTILINE)
+BLOCK_COMMENT = re.compile(r"/'.*?'/", re.DOTALL)
+DECLARATION = re.compile(
+    r"^(?P<keyword>{keywords})\s+(?P<name>{name})(?:\s+as\s+(?P<alias>{name}))?".format(
+        keywords="|".join(
+            keyword.replace(" ", r"\s+")
+            # the longer keywords first so that they win over their prefixes
+            for keyword in sorted(SYMBOL_TYPE, key=len, reverse=True)
+        ),
+        name=NAME,
+    ),
+)
+# ``A -> B``, ``[A] ..> [B]``, ``Foo "1" *-- "many" Bar``, ``A -[#red]> B``
+ARROW = re.compile(
+    r"^(?P<left>{name})(?:\s+\"[^\"]*\")?\s*"
+    r"(?:[ox](?=[-.=]))?[<*#}}|\\/]*[-.=~]+(?:\[[^\]]*\]|[a-z]+(?=[-.]))?[-.=~]*"
+    r"[>*#{{|\\/]*(?:[ox](?![\w\"]))?"
+    r"\s*(?:\"[^\"]*\"\s+)?(?P<right>{name})".format(name=NAME)
+)
+NOTE = re.compile(r"^[rh]?note\b", re.IGNORECASE)
+NOTE_END = re.compile(r"^end\s*[rh]?note\b", re.IGNORECASE)
+
+
+def _name(token: str) -> str | None:
+    """The name without its quotes, brackets or colons."""
+    if token[0] + token[-1] in ('""', "[]", "()", "::") and len(token) > 1:
+        token = token[1:-1]
+    name = " ".join(token.split())
+    if not name or len(name) > DiagramSymbolTable.name.type.length:
+        return None
+    return name
+
+
+def scan(code: str | None) -> DiagramSymbols:
+    """Read the kind and the symbols of the diagram code."""
+    if not code:
+        return DiagramSymbols()
+    start = START.search(code)
+    kind = start.group(1).lower() if start else None
+
+    declared = set()
+    referenced = set()
+    in_note = False
+    for line in BLOCK_COMMENT.sub("", code).splitlines():
+        line = line.strip()
+        if not line or line.startswith(("'", "@", "!", "skinparam")):
+            continue
+        if in_note:
+            in_note = not NOTE_END.match(line)
+            continue
+        if NOTE.match(line):
+            # single line notes have their text after the colon
+            in_note = ":" not in line
+            continue
+        if declaration := DECLARATION.match(line):
+            symbol_type = SYMBOL_TYPE[" ".join(declaration["keyword"].split())]
+            if name := _name(declaration["name"]):
+                declared.add((symbol_type, name))
+            if declaration["alias"] and (alias := _name(declaration["alias"])):
+                declared.add(("alias", alias))
+            continue
+        if arrow := ARROW.match(line):
+            for token in (arrow["left"], arrow["right"]):
+                if name := _name(token):
+                    referenced.add(name)
+
+    declared_names = {name for _, name in declared}
+    symbols = declared | {("reference", name) for name in referenced - declared_names}
+    return DiagramSymbols(kind=kind, symbols=frozenset(symbols))
+
+
+def store(dbsession, organization_id: UUID, diagram_id, symbols: DiagramSymbols):
+    """Replace the symbols of the diagram."""
+    dbsession.execute(delete(DiagramSymbolTable).filter_by(diagram_id=diagram_id))
+    if symbols.symbols:
+        dbsession.execute(
+            insert(DiagramSymbolTable),
+            [
+                {
+                    "diagram_id": diagram_id,
+                    "organization_id": organization_id,
+                    "type": symbol_type,
+                    "name": name,
+                }
+                for symbol_type, name in sorted(symbols.symbols)
+            ],
+        )
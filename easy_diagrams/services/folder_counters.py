@@ -0,0 +1,132 @@
+"""Per folder counters of subfolders and diagrams, see
+:class:`easy_diagrams.models.folder.FolderCounterTable`."""
+
+from logging import getLogger
+from uuid import UUID
+
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+
+from easy_diagrams.models.diagram import DiagramTable
+from easy_diagrams.models.folder import ROOT_FOLDER
+from easy_diagrams.models.folder import FolderCounterTable
+from easy_diagrams.models.folder import FolderTable
+
+logger = getLogger(__name__)
+
+
+def folder_key(folder_id):
+    return ROOT_FOLDER if folder_id is None else folder_id
+
+
+def bump(dbsession, organization_id: UUID, folder_id, folders=0, diagrams=0):
+    """Add to the counters of the folder, ``None`` being the root."""
+    if not folders and not diagrams:
+        return
+    stmt = insert(FolderCounterTable).values(
+        organization_id=organization_id,
+        folder_id=folder_key(folder_id),
+        folders=folders,
+        diagrams=diagrams,
+    )
+    dbsession.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[
+                FolderCounterTable.organization_id,
+                FolderCounterTable.folder_id,
+            ],
+            set_={
+                "folders": FolderCounterTable.folders + stmt.excluded.folders,
+                "diagrams": FolderCounterTable.diagrams + stmt.excluded.diagrams,
+            },
+        )
+    )
+
+
+def get(dbsession, organization_id: UUID, folder_id) -> tuple[int, int]:
+    """Number of subfolders and diagrams in the folder."""
+    row = dbsession.execute(
+        select(FolderCounterTable.folders, FolderCounterTable.diagrams).filter_by(
+            organization_id=organization_id, folder_id=folder_key(folder_id)
+        )
+    ).one_or_none()
+    return (row.folders, row.diagrams) if row else (0, 0)
+
+
+def reconcile(dbsession, organization_id: UUID) -> int:
+    """Recount the folders and diagrams of the organization and correct the
+    counters which drifted. Returns the number of corrected counters."""
+    # blocking counter updates until the transaction ends, so that none of
+    # them is lost between counting and correcting
+    dbsession.execute(text("LOCK TABLE folder_counters IN EXCLUSIVE MODE"))
+    # deleted folders are uncounted when they are tombstoned, and their own
+    # counters are dropped when they are purged, trashed diagrams are uncounted
+    # when they are trashed
+    deleted = set(
+        dbsession.scalars(
+            select(FolderTable.id).filter(
+                FolderTable.organization_id == organization_id,
+                FolderTable.deleted_at.is_not(None),
+            )
+        )
+    )
+    actual = {}
+    for column, table, parent_id, live in (
+        (
+            "folders",
+            FolderTable,
+            FolderTable.parent_id,
+            FolderTable.deleted_at.is_(None),
+        ),
+        (
+            "diagrams",
+            DiagramTable,
+            DiagramTable.folder_id,
+            DiagramTable.deleted_at.is_(None),
+        ),
+    ):
+        for folder_id, count in dbsession.execute(
+            select(func.coalesce(parent_id, ROOT_FOLDER), func.count())
+            .filter(table.organization_id == organization_id, live)
+            .group_by(parent_id)
+        ):
+            actual.setdefault(folder_id, {"folders": 0, "diagrams": 0})[column] = count
+    stored = {
+        row.folder_id: {"folders": row.folders, "diagrams": row.diagrams}
+        for row in dbsession.execute(
+            select(
+                FolderCounterTable.folder_id,
+                FolderCounterTable.folders,
+                FolderCounterTable.diagrams,
+            ).filter_by(organization_id=organization_id)
+        )
+    }
+
+    corrected = 0
+    for folder_id in (stored.keys() | actual.keys()) - deleted:
+        counts = actual.get(folder_id, {"folders": 0, "diagrams": 0})
+        if stored.get(folder_id) == counts:
+            continue
+        logger.warning(
+            "Correcting counters of folder %r of organization %s from %s to %s",
+            folder_id,
+            organization_id,
+            stored.get(folder_id),
+            counts,
+        )
+        corrected += 1
+        stmt = insert(FolderCounterTable).values(
+            organization_id=organization_id, folder_id=folder_id, **counts
+        )
+        dbsession.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[
+                    FolderCounterTable.organization_id,
+                    FolderCounterTable.folder_id,
+                ],
+                set_=counts,
+            )
+        )
+    return corrected
@@ -1,8 +1,16 @@
 from dataclasses import dataclass
+from datetime import datetime
 from uuid import UUID
 
 from pyramid.request import Request
+from sqlalchemy import any_
 from sqlalchemy import exc as sqlalchemy_exc
+from sqlalchemy import func
+from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy import tuple_
+from sqlalchemy import update
+from sqlalchemy.orm import aliased
 
 from easy_diagrams import interfaces
 from easy_diagrams.domain.folder import Folder
@@ -10,7 +18,11 @@ from easy_diagrams.domain.folder import FolderEdit
 from easy_diagrams.domain.folder import FolderID
 from easy_diagrams.domain.folder import FolderListItem
 from easy_diagrams.exceptions import DiagramNotFoundError
+from easy_diagrams.exceptions import FolderCycleError
+from easy_diagrams.models.folder import ROOT_PATH
 from easy_diagrams.models.folder import FolderTable
+from easy_diagrams.services import deletions
+from easy_diagrams.services import folder_counters
 
 
 @dataclass
@@ -21,24 +33,71 @@ class FolderRepository:
     organization_id: str
 
     def create(self, name: str, parent_id: FolderID = None) -> FolderID:
+        path = ROOT_PATH
+        if parent_id is not None:
+            path = self._get(parent_id).subtree_path
         folder = FolderTable(
-            organization_id=UUID(self.organization_id), name=name, parent_id=parent_id
+            organization_id=UUID(self.organization_id),
+            name=name,
+            parent_id=parent_id,
+            path=path,
         )
         self.dbsession.add(folder)
         self.dbsession.flush()
+        folder_counters.bump(
+            self.dbsession, UUID(self.organization_id), parent_id, folders=1
+        )
         return FolderID(folder.id)
 
     def _get(self, folder_id: FolderID) -> FolderTable:
         try:
             folder = (
                 self.dbsession.query(FolderTable)
-                .filter_by(id=folder_id, organization_id=UUID(self.organization_id))
+                .filter_by(
+                    id=folder_id,
+                    organization_id=UUID(self.organization_id),
+                    deleted_at=None,
+                )
                 .one()
             )
         except sqlalchemy_exc.NoResultFound:
             raise DiagramNotFoundError(f"Folder {folder_id} not found.")
         return folder
 
+    def _lock(self, *folder_ids: FolderID) -> dict[FolderID, FolderTable]:
+        """Lock the folders for the rest of the transaction and load their
+        current state. Locking in the order of ids avoids deadlocks."""
+        folders = {
+            folder.id: folder
+            for folder in self.dbsession.query(FolderTable)
+            .filter(
+                FolderTable.id.in_(folder_ids),
+                FolderTable.organization_id == UUID(self.organization_id),
+                FolderTable.deleted_at.is_(None),
+            )
+            .order_by(FolderTable.id)
+            .with_for_update()
+            .populate_existing()
+        }
+        for folder_id in folder_ids:
+            if folder_id not in folders:
+                raise DiagramNotFoundError(f"Folder {folder_id} not found.")
+        return folders
+
+    def _move_subtree(self, subtree_path: str, new_subtree_path: str):
+        """Rewrite the paths of the folders under the subtree path."""
+        self.dbsession.execute(
+            update(FolderTable)
+            .filter(
+                FolderTable.organization_id == UUID(self.organization_id),
+                FolderTable.in_subtree(subtree_path),
+            )
+            .values(
+                path=new_subtree_path
+                + func.substr(FolderTable.path, len(subtree_path) + 1)
+            )
+        )
+
     def get(self, folder_id: FolderID) -> Folder:
         folder = self._get(folder_id)
         return Folder(
@@ -49,55 +108,143 @@ class FolderRepository:
         )
 
     def delete(self, folder_id: FolderID):
+        """Delete the folder with its subfolders and diagrams.
+
+        The folder and its subfolders are tombstoned at once, their content
+        is purged in the background, see :mod:`easy_diagrams.services.deletions`.
+        """
         folder = self._get(folder_id)
-        self.dbsession.delete(folder)
+        organization_id = UUID(self.organization_id)
+        self.dbsession.execute(
+            update(FolderTable)
+            .filter(
+                FolderTable.organization_id == organization_id,
+                or_(
+                    FolderTable.id == folder_id,
+                    FolderTable.in_subtree(folder.subtree_path),
+                ),
+            )
+            .values(deleted_at=datetime.now())
+        )
+        folder_counters.bump(
+            self.dbsession, organization_id, folder.parent_id, folders=-1
+        )
+        deletions.schedule(
+            self.dbsession, organization_id, folder.id, folder.subtree_path
+        )
+
+    def ancestors(self, folder_id: FolderID) -> tuple[Folder, ...]:
+        """The folder and its ancestors, from the root to the folder."""
+        folder = aliased(FolderTable)
+        path = (
+            select(folder.path + folder.id)
+            .filter(
+                folder.id == folder_id,
+                folder.organization_id == UUID(self.organization_id),
+                folder.deleted_at.is_(None),
+            )
+            .scalar_subquery()
+        )
+        folders = tuple(
+            Folder(
+                id=FolderID(folder.id),
+                organization_id=folder.organization_id,
+                name=folder.name,
+                parent_id=folder.parent_id,
+            )
+            for folder in self.dbsession.query(FolderTable)
+            .filter(
+                FolderTable.organization_id == UUID(self.organization_id),
+                FolderTable.id == any_(func.string_to_array(path, "/")),
+            )
+            .order_by(func.length(FolderTable.path))
+        )
+        if not folders:
+            raise DiagramNotFoundError(f"Folder {folder_id} not found.")
+        return folders
 
     def list(
-        self, parent_id: FolderID = None, offset: int = 0, limit: int = None
+        self,
+        parent_id: FolderID = None,
+        offset: int = 0,
+        limit: int = None,
+        after: tuple | None = None,
+        before: tuple | None = None,
     ) -> list[FolderListItem]:
+        """List folders by name.
+
+        Pages can be selected by ``offset`` or by the ``(name, id)`` key of the
+        last item of the previous page (``after``) or of the first item of the
+        next page (``before``), see :attr:`FolderListItem.key`.
+        """
         query = self.dbsession.query(
             FolderTable.id,
             FolderTable.name,
             FolderTable.parent_id,
             FolderTable.created_at,
             FolderTable.updated_at,
-        ).filter_by(organization_id=UUID(self.organization_id))
+        ).filter_by(organization_id=UUID(self.organization_id), deleted_at=None)
 
         if parent_id is not None:
             query = query.filter_by(parent_id=parent_id)
         else:
             query = query.filter(FolderTable.parent_id.is_(None))
 
-        query = query.order_by(FolderTable.name)
+        key = tuple_(FolderTable.name, FolderTable.id)
+        if after is not None:
+            query = query.filter(key > tuple_(*after))
+        if before is not None:
+            # walking backwards from the key, the page is reversed below
+            query = query.filter(key < tuple_(*before)).order_by(
+                FolderTable.name.desc(), FolderTable.id.desc()
+            )
+        else:
+            query = query.order_by(FolderTable.name, FolderTable.id)
 
+        if offset:
+            query = query.offset(offset)
         if limit is not None:
-            query = query.offset(offset).limit(limit)
+            query = query.limit(limit)
 
-        return tuple(FolderListItem(**folder._asdict()) for folder in query.all())
+        folders = [FolderListItem(**folder._asdict()) for folder in query.all()]
+        if before is not None:
+            folders.reverse()
+        return tuple(folders)
 
     def count(self, parent_id: FolderID = None) -> int:
-        query = self.dbsession.query(FolderTable).filter_by(
-            organization_id=UUID(self.organization_id)
+        folders, _ = folder_counters.get(
+            self.dbsession, UUID(self.organization_id), parent_id
         )
-
-        if parent_id is not None:
-            query = query.filter_by(parent_id=parent_id)
-        else:
-            query = query.filter(FolderTable.parent_id.is_(None))
-
-        return query.count()
+        return folders
 
     def edit(self, folder_id: FolderID, changes: FolderEdit) -> Folder:
         folder = self._get(folder_id)
         if changes.name is not None:
             folder.name = changes.name
-        if changes.parent_id is not None:
+        if changes.parent_id is not None and changes.parent_id != folder.parent_id:
+            # locked, so that concurrent moves can't create a cycle together
+            folders = self._lock(folder_id, changes.parent_id)
+            parent = folders[changes.parent_id]
+            if parent.id == folder.id or parent.path.startswith(folder.subtree_path):
+                raise FolderCycleError(
+                    f"Folder {folder_id} can't be moved into its own subtree."
+                )
+            new_path = parent.subtree_path
+            self._move_subtree(folder.subtree_path, new_path + folder.id + "/")
+            folder.path = new_path
+            organization_id = UUID(self.organization_id)
+            folder_counters.bump(
+                self.dbsession, organization_id, folder.parent_id, folders=-1
+            )
+            folder_counters.bump(
+                self.dbsession, organization_id, changes.parent_id, folders=1
+            )
             folder.parent_id = changes.parent_id
         return self.get(folder_id)
 
 
 def factory(context, request: Request):
-    organization_id = request.session.get("selected_organization_id")
+    organization_id = request.selected_organization_id
     if not organization_id:
         raise ValueError("organization_id is required")
     return FolderRepository(request.dbsession, organization_id)
@@ -0,0 +1,284 @@
+from dataclasses import dataclass
+from uuid import UUID
+
+from pyramid.request import Request
+from sqlalchemy import Boolean
+from sqlalchemy import DateTime
+from sqlalchemy import String
+from sqlalchemy import any_
+from sqlalchemy import case
+from sqlalchemy import cast
+from sqlalchemy import false
+from sqlalchemy import func
+from sqlalchemy import literal
+from sqlalchemy import null
+from sqlalchemy import select
+from sqlalchemy import true
+from sqlalchemy import tuple_
+from sqlalchemy import union_all
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.orm import aliased
+
+from easy_diagrams import interfaces
+from easy_diagrams.domain.diagram import DiagramID
+from easy_diagrams.domain.diagram import DiagramListItem
+from easy_diagrams.domain.folder import Folder
+from easy_diagrams.domain.folder import FolderID
+from easy_diagrams.domain.folder import FolderListItem
+from easy_diagrams.domain.listing import ListingPage
+from easy_diagrams.exceptions import DiagramNotFoundError
+from easy_diagrams.models.diagram import DiagramTable
+from easy_diagrams.models.folder import FolderCounterTable
+from easy_diagrams.models.folder import FolderTable
+from easy_diagrams.services import folder_counters
+
+FOLDER = 0
+DIAGRAM = 1
+
+
+@dataclass
+class ListingQuery:
+    """Builds a folder listing page, its total and the listed folder in one
+    statement, instead of counting and listing folders and diagrams apart.
+    The ancestors of the listed folder are loaded for the breadcrumbs from its
+    path. The total is read from the folder counters, see
+    :mod:`easy_diagrams.services.folder_counters`.
+
+    The page is a slice of the UNION ALL of subfolders, ordered by ``(name,
+    id)``, followed by diagrams, ordered by ``(updated_at, id)`` descending.
+    Pages are selected by the kind and the key of the item they follow
+    (``after``) or precede (``before``), see :attr:`ListingPage.last`. Both
+    kinds are sliced by their own keyset before the union, so that each slice
+    is read from the listing index of its kind.
+    """
+
+    dbsession: object
+    organization_id: str
+
+    def page(
+        self,
+        folder_id: FolderID = None,
+        limit: int = 10,
+        after: tuple | None = None,
+        before: tuple | None = None,
+    ) -> ListingPage:
+        organization_id = UUID(self.organization_id)
+        reverse = before is not None
+        folders_where, diagrams_where = self._keyset(after, before)
+        folders = select(
+            literal(FOLDER).label("kind"),
+            FolderTable.id,
+            FolderTable.name.label("title"),
+            cast(null(), Boolean).label("is_public"),
+            FolderTable.created_at,
+            FolderTable.updated_at,
+            FolderTable.name.label("sort_name"),
+            cast(null(), DateTime).label("sort_time"),
+        ).filter(
+            FolderTable.organization_id == organization_id,
+            FolderTable.deleted_at.is_(None),
+            (
+                FolderTable.parent_id.is_(None)
+                if folder_id is None
+                else FolderTable.parent_id == folder_id
+            ),
+            folders_where,
+        )
+        diagrams = select(
+            literal(DIAGRAM).label("kind"),
+            DiagramTable.id,
+            DiagramTable.title,
+            DiagramTable.is_public,
+            DiagramTable.created_at,
+            DiagramTable.updated_at,
+            cast(null(), String).label("sort_name"),
+            DiagramTable.updated_at.label("sort_time"),
+        ).filter(
+            DiagramTable.organization_id == organization_id,
+            DiagramTable.deleted_at.is_(None),
+            (
+                DiagramTable.folder_id.is_(None)
+                if folder_id is None
+                else DiagramTable.folder_id == folder_id
+            ),
+            diagrams_where,
+        )
+        # each kind is paged on its own listing index, so that only the two
+        # limited slices are sorted together
+        folders_order = (FolderTable.name, FolderTable.id)
+        diagrams_order = (DiagramTable.updated_at.desc(), DiagramTable.id.desc())
+        if reverse:
+            folders_order = (FolderTable.name.desc(), FolderTable.id.desc())
+            diagrams_order = (DiagramTable.updated_at, DiagramTable.id)
+        folders = folders.order_by(*folders_order).limit(limit).subquery("folders")
+        diagrams = diagrams.order_by(*diagrams_order).limit(limit).subquery("diagrams")
+        items = union_all(select(folders), select(diagrams)).subquery("items")
+
+        page = (
+            select(items)
+            .order_by(*self._ordering(items, reverse))
+            .limit(limit)
+            .subquery("page")
+        )
+        counters = (
+            select(
+                (FolderCounterTable.folders + FolderCounterTable.diagrams).label(
+                    "total"
+                )
+            )
+            .filter_by(
+                organization_id=organization_id,
+                folder_id=folder_counters.folder_key(folder_id),
+            )
+            .subquery("counters")
+        )
+
+        # a single row even when the page is empty, to carry the total and the
+        # current folder
+        one = select(literal(1).label("one")).subquery("one")
+        columns = [counters.c.total, *page.c]
+        query = select(one.c.one).select_from(one).outerjoin(counters, true())
+        if folder_id is not None:
+            ancestor = aliased(FolderTable)
+            ancestors = (
+                select(
+                    func.json_agg(
+                        aggregate_order_by(
+                            func.json_build_array(
+                                ancestor.id, ancestor.name, ancestor.parent_id
+                            ),
+                            func.length(ancestor.path),
+                        )
+                    )
+                )
+                .filter(
+                    ancestor.organization_id == organization_id,
+                    ancestor.id == any_(func.string_to_array(FolderTable.path, "/")),
+                )
+                .scalar_subquery()
+            )
+            current = (
+                select(
+                    FolderTable.id,
+                    FolderTable.name,
+                    FolderTable.parent_id,
+                    ancestors.label("ancestors"),
+                )
+                .filter(
+                    FolderTable.id == folder_id,
+                    FolderTable.organization_id == organization_id,
+                    FolderTable.deleted_at.is_(None),
+                )
+                .subquery("current")
+            )
+            query = query.outerjoin(current, true())
+            columns += [
+                current.c.id.label("current_id"),
+                current.c.name.label("current_name"),
+                current.c.parent_id.label("current_parent_id"),
+                current.c.ancestors,
+            ]
+        query = (
+            query.outerjoin(page, true())
+            .add_columns(*columns)
+            .order_by(*self._ordering(page, reverse))
+        )
+        rows = self.dbsession.execute(query).all()
+
+        current_folder = None
+        ancestors = ()
+        if folder_id is not None:
+            if rows[0].current_id is None:
+                raise DiagramNotFoundError(f"Folder {folder_id} not found.")
+            current_folder = Folder(
+                id=FolderID(rows[0].current_id),
+                organization_id=organization_id,
+                name=rows[0].current_name,
+                parent_id=rows[0].current_parent_id,
+            )
+            ancestors = tuple(
+                Folder(
+                    id=FolderID(id),
+                    organization_id=organization_id,
+                    name=name,
+                    parent_id=parent_id,
+                )
+                for id, name, parent_id in rows[0].ancestors or ()
+            )
+
+        total = rows[0].total or 0
+        rows = [row for row in rows if row.id is not None]
+        if reverse:
+            rows.reverse()
+        return ListingPage(
+            folders=tuple(
+                FolderListItem(
+                    id=FolderID(row.id),
+                    name=row.title,
+                    parent_id=folder_id,
+                    created_at=row.created_at,
+                    updated_at=row.updated_at,
+                )
+                for row in rows
+                if row.kind == FOLDER
+            ),
+            diagrams=tuple(
+                DiagramListItem(
+                    id=DiagramID(row.id),
+                    title=row.title,
+                    is_public=row.is_public,
+                    created_at=row.created_at,
+                    updated_at=row.updated_at,
+                    folder_id=folder_id,
+                )
+                for row in rows
+                if row.kind == DIAGRAM
+            ),
+            total=total,
+            current_folder=current_folder,
+            ancestors=ancestors,
+        )
+
+    @staticmethod
+    def _ordering(items, reverse):
+        ascending = (
+            (items.c.kind, True),
+            (items.c.sort_name, True),
+            (items.c.sort_time, False),
+            # ties are broken by id, ascending for folders, descending for diagrams
+            (case((items.c.kind == FOLDER, items.c.id)), True),
+            (case((items.c.kind == DIAGRAM, items.c.id)), False),
+        )
+        return [
+            column.asc() if asc != reverse else column.desc()
+            for column, asc in ascending
+        ]
+
+    @staticmethod
+    def _keyset(after, before):
+        """Conditions of the folders and of the diagrams of the page, folders
+        come before all diagrams."""
+        folder_key = tuple_(FolderTable.name, FolderTable.id)
+        diagram_key = tuple_(DiagramTable.updated_at, DiagramTable.id)
+        if after is not None:
+            kind, key = after
+            if kind == "folder":
+                return folder_key > tuple_(*key), true()
+            return false(), diagram_key < tuple_(*key)
+        if before is not None:
+            kind, key = before
+            if kind == "folder":
+                return folder_key < tuple_(*key), false()
+            return true(), diagram_key > tuple_(*key)
+        return true(), true()
+
+
+def factory(context, request: Request):
+    organization_id = request.selected_organization_id
+    if not organization_id:
+        raise ValueError("organization_id is required")
+    return ListingQuery(request.dbsession, organization_id)
+
+
+def includeme(config):
+    config.register_service_factory(factory, interfaces.IListingQuery)
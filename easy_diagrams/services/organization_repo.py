@@ -1,10 +1,21 @@
+import csv
+import io
+import re
+from collections.abc import Iterable
+from datetime import datetime
 from uuid import UUID
 
 from pyramid.request import Request
 from sqlalchemy import and_
+from sqlalchemy import event
+from sqlalchemy import literal
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 from zope.interface import implementer
 
+from easy_diagrams.caching import LRUCache
+from easy_diagrams.domain.organization import MemberImport
 from easy_diagrams.domain.organization import Organization
 from easy_diagrams.domain.organization import OrganizationEdit
 from easy_diagrams.domain.organization import OrganizationID
@@ -13,15 +24,59 @@ from easy_diagrams.interfaces import IOrganizationRepo
 from easy_diagrams.models.organization import OrganizationTable
 from easy_diagrams.models.organization import organization_user_association
 from easy_diagrams.models.user import User
+from easy_diagrams.services import deletions
+
+MEMBER = "member"
+OWNER = "owner"
+
+#: Number of emails added to an organization by a statement
+IMPORT_BATCH_SIZE = 500
+EMAIL = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+#: Key of the session info holding the roles to forget once committed
+INVALIDATED_ROLES = "invalidated_roles"
+
+
+class Memberships:
+    """Process-level cache of the roles of users in organizations.
+
+    Only memberships are cached, a user who isn't a member is looked up again.
+    The repository invalidates the roles it changes, right away and once its
+    transaction is committed, other processes see the changes once the cached
+    roles expire after ``ttl`` seconds.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 30):
+        self.roles = LRUCache(maxsize, ttl=ttl)
+
+    def get(self, user_id, organization_id) -> str | None:
+        return self.roles.get((str(user_id), str(organization_id)))
+
+    def set(self, user_id, organization_id, role: str):
+        self.roles.set((str(user_id), str(organization_id)), role)
+
+    def invalidate(self, organization_id, user_id=None):
+        """Forget the role of the user, or of all users of the organization."""
+        if user_id is not None:
+            self.roles.pop((str(user_id), str(organization_id)))
+        else:
+            self.roles.discard_where(lambda key: key[1] == str(organization_id))
 
 
 @implementer(IOrganizationRepo)
 class OrganizationRepo:
-    """Organization repository implementation."""
+    """Organization repository implementation.
 
-    def __init__(self, user_id: UUID, dbsession: Session):
+    The roles of the user are checked once per repository, which lives as long
+    as the request, and cached by the process in ``memberships``.
+    """
+
+    def __init__(
+        self, user_id: UUID, dbsession: Session, memberships: Memberships = None
+    ):
         self.user_id = user_id
         self.dbsession = dbsession
+        self.memberships = memberships
+        self._roles = {}
 
     def create(self, name: str) -> OrganizationID:
         """Create new organization and return its ID."""
@@ -35,6 +90,7 @@ class OrganizationRepo:
                 organization_id=org.id, user_id=self.user_id, is_owner=True
             )
         )
+        self._roles[str(org.id)] = OWNER
 
         return OrganizationID(org.id)
 
@@ -44,25 +100,49 @@ class OrganizationRepo:
         return Organization(id=OrganizationID(org.id), name=org.name)
 
     def delete(self, organization_id: OrganizationID) -> None:
-        """Delete organization by its ID and remove all user associations."""
+        """Delete organization by its ID with its folders, diagrams and user
+        associations. The organization is tombstoned at once, the rest is
+        purged in the background, see :mod:`easy_diagrams.services.deletions`."""
         org = self._get_user_organization(organization_id.value)
-
-        # Remove all user associations first
-        self.dbsession.execute(
-            organization_user_association.delete().where(
-                organization_user_association.c.organization_id == organization_id.value
-            )
-        )
-
-        # Delete the organization
-        self.dbsession.delete(org)
+        org.deleted_at = datetime.now()
+        deletions.schedule(self.dbsession, org.id)
+        self._invalidate(organization_id.value)
+
+    def get_role(self, organization_id: OrganizationID) -> str | None:
+        """Get the role of the user in the organization, None if not a member."""
+        key = str(organization_id.value)
+        if key in self._roles:
+            return self._roles[key]
+        role = None
+        if self.memberships is not None:
+            role = self.memberships.get(self.user_id, key)
+        if role is None:
+            is_owner = self.dbsession.execute(
+                select(organization_user_association.c.is_owner)
+                .join(OrganizationTable)
+                .where(
+                    organization_user_association.c.organization_id
+                    == organization_id.value,
+                    organization_user_association.c.user_id == self.user_id,
+                    OrganizationTable.deleted_at.is_(None),
+                )
+            ).scalar_one_or_none()
+            if is_owner is not None:
+                role = OWNER if is_owner else MEMBER
+                if self.memberships is not None:
+                    self.memberships.set(self.user_id, key, role)
+        self._roles[key] = role
+        return role
 
     def list(self, offset: int = 0, limit: int = 20) -> list[OrganizationListItem]:
         """List user's organizations with pagination."""
         orgs = (
             self.dbsession.query(OrganizationTable)
             .join(organization_user_association)
-            .filter(organization_user_association.c.user_id == self.user_id)
+            .filter(
+                organization_user_association.c.user_id == self.user_id,
+                OrganizationTable.deleted_at.is_(None),
+            )
             .offset(offset)
             .limit(limit)
             .all()
@@ -91,7 +171,7 @@ class OrganizationRepo:
     ) -> None:
         """Add user to organization by email. Creates user if doesn't exist."""
         # Verify organization exists and user has access
-        self._get_user_organization(organization_id.value)
+        self._check_access(organization_id.value)
 
         # Find or create user by email
         user = self.dbsession.query(User).filter(User.email == email).first()
@@ -124,11 +204,69 @@ class OrganizationRepo:
                 is_owner=is_owner,
             )
         )
+        self._invalidate(organization_id.value, user.id)
+
+    def add_users(
+        self,
+        organization_id: OrganizationID,
+        emails: Iterable[str],
+        is_owner: bool = False,
+    ) -> MemberImport:
+        """Add users to organization by emails in bulk. Creates users who
+        don't exist, users already in organization are left as they are."""
+        self._check_access(organization_id.value)
+
+        valid = []
+        invalid = []
+        for email in dict.fromkeys(email.strip() for email in emails):
+            if not email:
+                continue
+            if EMAIL.fullmatch(email) and len(email) <= User.email.type.length:
+                valid.append(email)
+            else:
+                invalid.append(email)
+
+        added = set()
+        for start in range(0, len(valid), IMPORT_BATCH_SIZE):
+            batch = valid[start : start + IMPORT_BATCH_SIZE]
+            self.dbsession.execute(
+                insert(User).on_conflict_do_nothing(index_elements=[User.email]),
+                [{"email": email} for email in batch],
+            )
+            associations = (
+                insert(organization_user_association)
+                .from_select(
+                    ["organization_id", "user_id", "is_owner"],
+                    select(
+                        literal(UUID(str(organization_id.value))),
+                        User.id,
+                        literal(is_owner),
+                    ).where(User.email.in_(batch)),
+                )
+                .on_conflict_do_nothing()
+                .returning(organization_user_association.c.user_id)
+                .cte("associations")
+            )
+            added.update(
+                self.dbsession.scalars(
+                    select(User.email).join(
+                        associations, associations.c.user_id == User.id
+                    )
+                )
+            )
+        if added:
+            self._invalidate(organization_id.value)
+
+        return MemberImport(
+            added=tuple(email for email in valid if email in added),
+            existing=tuple(email for email in valid if email not in added),
+            invalid=tuple(invalid),
+        )
 
     def remove_user(self, organization_id: OrganizationID, user_id: str) -> None:
         """Remove user from organization."""
         # Verify organization exists and user has access
-        self._get_user_organization(organization_id.value)
+        self._check_access(organization_id.value)
 
         self.dbsession.execute(
             organization_user_association.delete().where(
@@ -139,11 +277,12 @@ class OrganizationRepo:
                 )
             )
         )
+        self._invalidate(organization_id.value, user_id)
 
     def make_owner(self, organization_id: OrganizationID, user_id: str) -> None:
         """Make user an owner of the organization."""
         # Verify organization exists and user has access
-        self._get_user_organization(organization_id.value)
+        self._check_access(organization_id.value)
 
         self.dbsession.execute(
             organization_user_association.update()
@@ -156,6 +295,7 @@ class OrganizationRepo:
             )
             .values(is_owner=True)
         )
+        self._invalidate(organization_id.value, user_id)
 
     def remove_owner(self, organization_id: OrganizationID, user_id: str) -> None:
         """Remove user from owners. Fails if user is the only owner."""
@@ -179,13 +319,14 @@ class OrganizationRepo:
             )
             .values(is_owner=False)
         )
+        self._invalidate(organization_id.value, user_id)
 
     def get_owners(
         self, organization_id: OrganizationID, offset: int = 0, limit: int = 20
     ) -> "list[str]":
         """Get paginated list of owner user IDs for the organization."""
         # Verify organization exists and user has access
-        self._get_user_organization(organization_id.value)
+        self._check_access(organization_id.value)
 
         owners = self.dbsession.execute(
             organization_user_association.select()
@@ -207,7 +348,7 @@ class OrganizationRepo:
     ) -> "list[dict]":
         """List users in an organization with pagination."""
         # Verify organization exists and user has access
-        self._get_user_organization(organization_id.value)
+        self._check_access(organization_id.value)
 
         users = (
             self.dbsession.query(User, organization_user_association.c.is_owner)
@@ -234,29 +375,96 @@ class OrganizationRepo:
 
     def _get_user_organization(self, organization_id: UUID) -> OrganizationTable:
         """Get organization that user has access to."""
-        org = (
-            self.dbsession.query(OrganizationTable)
-            .join(organization_user_association)
-            .filter(
-                and_(
-                    OrganizationTable.id == organization_id,
-                    organization_user_association.c.user_id == self.user_id,
-                )
+        self._check_access(organization_id)
+        org = self.dbsession.get(OrganizationTable, organization_id)
+        if not org or org.deleted_at is not None:
+            raise ValueError(
+                f"Organization {organization_id} not found or access denied"
             )
-            .first()
-        )
+        return org
 
-        if not org:
+    def _check_access(self, organization_id: UUID) -> None:
+        """Check that the user is a member of the organization."""
+        if self.get_role(OrganizationID(organization_id)) is None:
             raise ValueError(
                 f"Organization {organization_id} not found or access denied"
             )
 
-        return org
+    def _invalidate(self, organization_id, user_id=None) -> None:
+        """Forget the changed roles, again after commit so that requests
+        reading them meanwhile don't keep the old ones."""
+        key = str(organization_id)
+        if user_id is None or str(user_id) == str(self.user_id):
+            self._roles.pop(key, None)
+        if self.memberships is not None:
+            self.memberships.invalidate(key, user_id)
+            invalidated = self.dbsession.info.setdefault(INVALIDATED_ROLES, set())
+            if not invalidated:
+                event.listen(self.dbsession, "after_commit", _forget_roles, once=True)
+            invalidated.add((self.memberships, key, user_id))
+
+
+def _forget_roles(session: Session) -> None:
+    """Forget the roles changed by the committed transaction."""
+    for memberships, organization_id, user_id in session.info.pop(
+        INVALIDATED_ROLES, ()
+    ):
+        memberships.invalidate(organization_id, user_id)
+
+
+def split_emails(text: str) -> list[str]:
+    """Split pasted or CSV text into the emails to add.
+
+    Emails may be separated by commas, semicolons, whitespace or lines, and
+    may be written as ``Name <email>``. The other cells of CSV rows, like
+    names, are skipped. A row without emails is returned as it is to be
+    reported, unless it's the first one, which is the header then.
+    """
+    entries = []
+    for number, row in enumerate(csv.reader(io.StringIO(text))):
+        tokens = [
+            token.strip("<>")
+            for cell in row
+            for token in re.split(r"[\s;]+", cell)
+            if token.strip("<>")
+        ]
+        emails = [token for token in tokens if "@" in token]
+        if emails:
+            entries.extend(emails)
+        elif tokens and number > 0:
+            entries.append(",".join(cell.strip() for cell in row))
+    return entries
+
+
+def selected_organization_id(request: Request) -> str | None:
+    """The organization selected by the user, as long as the user is its
+    member. It's forgotten once the user is not."""
+    organization_id = request.session.get("selected_organization_id")
+    if not organization_id or request.authenticated_userid is None:
+        return None
+    repo = request.find_service(IOrganizationRepo)
+    if repo.get_role(OrganizationID(organization_id)) is None:
+        request.session.pop("selected_organization_id", None)
+        request.session.pop("selected_organization_name", None)
+        return None
+    return organization_id
 
 
 def factory(context, request: Request):
-    return OrganizationRepo(request.authenticated_userid, request.dbsession)
+    return OrganizationRepo(
+        request.authenticated_userid,
+        request.dbsession,
+        request.registry.get("memberships"),
+    )
 
 
 def includeme(config):
+    settings = config.get_settings()
+    config.registry["memberships"] = Memberships(
+        maxsize=int(settings.get("organizations.membership_cache.size", 10_000)),
+        ttl=float(settings.get("organizations.membership_cache.ttl", 30)),
+    )
+    config.add_request_method(
+        selected_organization_id, "selected_organization_id", reify=True
+    )
     config.register_service_factory(factory, IOrganizationRepo)
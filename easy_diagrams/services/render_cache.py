@@ -0,0 +1,143 @@
+import os
+import tempfile
+import threading
+from logging import getLogger
+from typing import Callable
+
+from blake3 import blake3
+
+from easy_diagrams.caching import LRUCache
+
+logger = getLogger(__name__)
+
+
+def normalize_code(code: str) -> str:
+    """Normalize the code so that insignificant whitespace changes (line endings,
+    trailing spaces and surrounding blank lines) share the same render."""
+    lines = [line.rstrip() for line in code.replace("\r\n", "\n").split("\n")]
+    return "\n".join(lines).strip("\n")
+
+
+class RenderCache:
+    """Two-tier cache of rendered images keyed by the blake3 hash of the source.
+
+    The first tier is an in-process LRU cache bounded by the size of the stored
+    images. The optional second tier is a directory shared by all processes on
+    the same host. It survives restarts, and its oldest entries are evicted
+    once it grows beyond ``max_disk_bytes``.
+    """
+
+    def __init__(
+        self,
+        plantuml_version: str | Callable[[], str],
+        max_memory_bytes: int = 64 * 1024 * 1024,
+        directory: str | None = None,
+        max_disk_bytes: int = 1024 * 1024 * 1024,
+    ):
+        self._plantuml_version = plantuml_version
+        self.memory = LRUCache(max_memory_bytes, weigh=len)
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self._disk_bytes = None
+        self._lock = threading.Lock()
+
+    @property
+    def plantuml_version(self) -> str:
+        """The version is part of the key, so upgrading PlantUML invalidates the
+        cache. It can be given as a callable to postpone the detection."""
+        if callable(self._plantuml_version):
+            self._plantuml_version = self._plantuml_version()
+        return self._plantuml_version
+
+    def key(self, code: str, file_format: str = "png") -> str:
+        hasher = blake3()
+        for part in (self.plantuml_version, file_format, normalize_code(code)):
+            hasher.update(part.encode())
+            hasher.update(b"\0")
+        return hasher.hexdigest()
+
+    def get(self, key: str) -> bytes | None:
+        image = self.memory.get(key)
+        if image is None and self.directory is not None:
+            image = self._disk_get(key)
+            if image is not None:
+                self.memory.set(key, image)
+        return image
+
+    def set(self, key: str, image: bytes):
+        self.memory.set(key, image)
+        if self.directory is not None:
+            self._disk_set(key, image)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "memory_hits": self.memory.hits,
+            "memory_misses": self.memory.misses,
+            "memory_bytes": self.memory.weight,
+            "disk_hits": self.disk_hits,
+            "disk_misses": self.disk_misses,
+        }
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _disk_get(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                image = f.read()
+            # the modification time is used to evict least recently used entries
+            os.utime(path)
+        except OSError:
+            self.disk_misses += 1
+            return None
+        self.disk_hits += 1
+        return image
+
+    def _disk_set(self, key: str, image: bytes):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # writing to a temporary file first, so that concurrent readers from
+            # other processes never see partially written images
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(image)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Failed to store render %s in the cache: %s", key, e)
+            return
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += len(image)
+            if self._disk_bytes is None or self._disk_bytes > self.max_disk_bytes:
+                self._disk_evict()
+
+    def _disk_evict(self):
+        """Delete the least recently used entries to get under 90% of the limit."""
+        entries = []
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_disk_bytes:
+            entries.sort()
+            target = self.max_disk_bytes * 0.9
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+        self._disk_bytes = total
@@ -0,0 +1,88 @@
+from dataclasses import dataclass
+from datetime import datetime
+from datetime import timedelta
+
+from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy import update
+
+from easy_diagrams import interfaces
+from easy_diagrams.domain.diagram import RENDER_FORMATS
+from easy_diagrams.domain.diagram import DiagramID
+from easy_diagrams.domain.diagram import PendingRender
+from easy_diagrams.models.diagram import DiagramTable
+from easy_diagrams.services.diagram_repo import apply_render
+
+diagrams = DiagramTable.__table__
+
+
+@dataclass
+class RenderWorker:
+    """Renders diagrams which image is older than their code.
+
+    The edit request only stores the code, and the worker picks it up later.
+    Rendering happens outside of any database transaction, and the image is
+    stored with a compare-and-set on the code version, so a render of outdated
+    code never overwrites the image of newer code.
+
+    Workers claim the diagrams they render for the ``lease``, so that other
+    workers render different diagrams. A render which failed isn't stored, the
+    diagram is rendered again once its claim expires.
+    """
+
+    dbsession: object
+    diagram_renderer: interfaces.IDiagramRenderer
+    lease: timedelta = timedelta(seconds=60)
+
+    def claim(self, limit: int = 10) -> list[PendingRender]:
+        """Claim diagrams waiting for a render, the least recently updated
+        first, skipping the ones claimed by other workers."""
+        now = datetime.now()
+        # locked by a query of its own, a locking subquery of the update could
+        # be rescanned and claim more diagrams than the limit
+        diagram_ids = self.dbsession.scalars(
+            select(diagrams.c.id)
+            .where(
+                diagrams.c.code_version.is_not(None),
+                diagrams.c.image_version.is_distinct_from(diagrams.c.code_version),
+                diagrams.c.deleted_at.is_(None),
+                or_(
+                    diagrams.c.render_claimed_at.is_(None),
+                    diagrams.c.render_claimed_at < now - self.lease,
+                ),
+            )
+            .order_by(diagrams.c.updated_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not diagram_ids:
+            return []
+        rows = self.dbsession.execute(
+            update(diagrams)
+            .where(diagrams.c.id.in_(diagram_ids))
+            # claiming is not a change of the diagram
+            .values(render_claimed_at=now, updated_at=diagrams.c.updated_at)
+            .returning(diagrams.c.id, diagrams.c.code, diagrams.c.code_version)
+        )
+        jobs = [
+            PendingRender(
+                id=DiagramID(row.id), code=row.code or "", code_version=row.code_version
+            )
+            for row in rows
+        ]
+        return sorted(jobs, key=lambda job: diagram_ids.index(job.id))
+
+    def render(self, job: PendingRender) -> dict[str, bytes]:
+        """Render the code in all the formats, so that requests of images
+        never render. An empty image is a failed render."""
+        return {
+            file_format: self.diagram_renderer.render(job, file_format)
+            for file_format in RENDER_FORMATS
+        }
+
+    def apply(self, job: PendingRender, images: dict[str, bytes]) -> bool:
+        """Store the images if the code wasn't changed since the job was taken.
+
+        Returns `False` if the render is stale and was discarded.
+        """
+        return apply_render(self.dbsession, job.id, job.code_version, images)
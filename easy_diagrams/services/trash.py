@@ -0,0 +1,52 @@
+"""Purge of the diagrams in the trash, see :meth:`DiagramRepository.delete
+<easy_diagrams.services.diagram_repo.DiagramRepository.delete>`.
+
+Deleting a diagram only tombstones it, so that it can be restored and the
+request doesn't delete its images. Once the retention is over, :func:`purge`
+deletes the trashed diagrams in bounded batches, their images and symbols are
+deleted by cascade. Their folder counters were updated when they were trashed.
+"""
+
+from datetime import datetime
+from datetime import timedelta
+from logging import getLogger
+
+from sqlalchemy import delete
+from sqlalchemy import select
+
+from easy_diagrams.models.diagram import DiagramTable
+
+logger = getLogger(__name__)
+
+#: Days the diagrams stay in the trash by default
+DEFAULT_RETENTION_DAYS = 30
+
+
+def expires_at(deleted_at: datetime, retention_days: int) -> datetime:
+    """When the diagram trashed at ``deleted_at`` is purged."""
+    return deleted_at + timedelta(days=retention_days)
+
+
+def purge(dbsession, retention_days: int, batch_size: int = 500) -> int:
+    """Delete a batch of the diagrams trashed before the retention, the oldest
+    first. Returns the number of deleted diagrams. Rows are locked, so that
+    concurrent purges delete different diagrams."""
+    # locked by a query of its own, a locking subquery of the delete could be
+    # rescanned and skip the rows deleted already, going past the batch size
+    batch = dbsession.scalars(
+        select(DiagramTable.id)
+        .filter(
+            DiagramTable.deleted_at.is_not(None),
+            DiagramTable.deleted_at < datetime.now() - timedelta(days=retention_days),
+        )
+        .order_by(DiagramTable.deleted_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not batch:
+        return 0
+    purged = dbsession.execute(
+        delete(DiagramTable).filter(DiagramTable.id.in_(batch))
+    ).rowcount
+    logger.info("Purged %d diagrams from the trash", purged)
+    return purged
@@ -32,7 +32,7 @@ def social_login_view(request):
         user.last_login_at = datetime.now()
 
     # Check user's organizations
-    org_repo = OrganizationRepo(user.id, dbsession)
+    org_repo = OrganizationRepo(user.id, dbsession, request.registry.get("memberships"))
     organizations = org_repo.list()
 
     new_csrf_token(request)
@@ -90,7 +90,7 @@ def logout_view(request):
 )
 def select_organization_view(request):
     next_url = request.params.get("next", request.route_url("home"))
-    org_repo = OrganizationRepo(request.authenticated_userid, request.dbsession)
+    org_repo = request.find_service(interfaces.IOrganizationRepo)
     organizations = org_repo.list()
     return {
         "organizations": organizations,
@@ -107,7 +107,7 @@ def select_organization_post(request):
     organization_id = request.POST.get("organization_id")
 
     if organization_id:
-        org_repo = OrganizationRepo(request.authenticated_userid, request.dbsession)
+        org_repo = request.find_service(interfaces.IOrganizationRepo)
         try:
             from easy_diagrams.domain.organization import OrganizationID
 
@@ -1,5 +1,8 @@
+import base64
 import functools
+import json
 from dataclasses import dataclass
+from datetime import datetime
 
 from pydantic import ValidationError
 from pyramid.httpexceptions import HTTPBadRequest
@@ -11,8 +14,10 @@ from pyramid.view import view_config
 from pyramid.view import view_defaults
 
 from easy_diagrams import interfaces
+from easy_diagrams.domain.diagram import RENDER_FORMATS
 from easy_diagrams.domain.diagram import Diagram
 from easy_diagrams.domain.diagram import DiagramEdit
+from easy_diagrams.services import trash
 
 
 @dataclass
@@ -23,26 +28,51 @@ class PageListing:
     offset: int
     current_page: int
     num_pages: int
+    next_cursor: str | None = None
+    previous_cursor: str | None = None
 
     @property
     def has_next(self) -> bool:
-        return self.current_page < self.num_pages
-
-    @property
-    def next_page(self) -> int | None:
-        if self.has_next:
-            return self.current_page + 1
-        return None
+        return self.next_cursor is not None
 
     @property
     def has_previous(self) -> bool:
-        return self.current_page > 1
+        return self.previous_cursor is not None
 
-    @property
-    def previous_page(self) -> int | None:
-        if self.has_previous:
-            return self.current_page - 1
-        return None
+
+#: Kinds of the items cursors point to, folders and diagrams of listings,
+#: diagrams matching a search and diagrams in the trash
+CURSOR_KINDS = ("folder", "diagram", "match", "trash")
+
+
+def encode_cursor(page: int, direction: str, kind: str, key: tuple) -> str:
+    """Opaque cursor pointing to the page before or after the ``key`` of a
+    listed folder or diagram or of a search match."""
+    key = [part.isoformat() if isinstance(part, datetime) else part for part in key]
+    data = json.dumps({"page": page, "dir": direction, "kind": kind, "key": key})
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        page, direction, kind, key = (
+            int(data["page"]),
+            data["dir"],
+            data["kind"],
+            data["key"],
+        )
+        if direction not in ("next", "prev") or kind not in CURSOR_KINDS:
+            raise ValueError(f"Invalid cursor {data}")
+        if kind in ("diagram", "trash"):
+            key = (datetime.fromisoformat(key[0]), key[1])
+        elif kind == "match":
+            key = (float(key[0]), datetime.fromisoformat(key[1]), key[2])
+        else:
+            key = (key[0], key[1])
+    except (ValueError, TypeError, KeyError, IndexError) as e:
+        raise HTTPBadRequest(f"Invalid cursor: {e}")
+    return {"page": max(page, 1), "dir": direction, "kind": kind, "key": key}
 
 
 @dataclass
@@ -58,6 +88,10 @@ class DiagramsRepoViewMixin:
     def folder_repo(self):
         return self.request.find_service(interfaces.IFolderRepo)
 
+    @functools.cached_property
+    def listing_query(self):
+        return self.request.find_service(interfaces.IListingQuery)
+
 
 @view_defaults(route_name="diagrams")
 class Diagrams(DiagramsRepoViewMixin):
@@ -101,70 +135,161 @@ class Diagrams(DiagramsRepoViewMixin):
         renderer="easy_diagrams:templates/diagrams.pt",
     )
     def list_diagrams(self):
+        """Folders followed by diagrams, paginated by keyset cursors so that
+        deep pages are as cheap to load as the first one. The page, the totals
+        and the current folder are loaded by a single query."""
         folder_id = self.request.params.get("folder_id") or None
-        page = int(self.request.params.get("page", 1))
+        cursor = self.request.params.get("cursor")
+        cursor = decode_cursor(cursor) if cursor else None
         limit = int(self.request.registry.settings.get("diagrams.page_size", 10))
-        offset = (page - 1) * limit
 
-        # Get folder and diagram counts
-        folder_count = self.folder_repo.count(parent_id=folder_id)
-        diagram_count = self.diagram_repo.count(folder_id=folder_id)
-        total_items = folder_count + diagram_count
-
-        # Calculate pagination for combined items
+        position = (cursor["kind"], cursor["key"]) if cursor else None
+        listing = self.listing_query.page(
+            folder_id=folder_id,
+            limit=limit,
+            after=position if cursor and cursor["dir"] == "next" else None,
+            before=position if cursor and cursor["dir"] == "prev" else None,
+        )
+        total_items = listing.total
         num_pages = (total_items + limit - 1) // limit if total_items > 0 else 1
+        page = cursor["page"] if cursor else 1
 
-        # Determine what to show on current page
-        folders = []
-        diagrams = []
-
-        if offset < folder_count:
-            # Show folders (and possibly diagrams)
-            folder_limit = min(limit, folder_count - offset)
-            folders = self.folder_repo.list(
-                parent_id=folder_id, offset=offset, limit=folder_limit
-            )
-
-            remaining_slots = limit - len(folders)
-            if remaining_slots > 0:
-                # Fill remaining slots with diagrams
-                diagrams = self.diagram_repo.list(
-                    offset=0, limit=remaining_slots, folder_id=folder_id
-                )
-        else:
-            # Show only diagrams
-            diagram_offset = offset - folder_count
-            diagrams = self.diagram_repo.list(
-                offset=diagram_offset, limit=limit, folder_id=folder_id
-            )
+        next_cursor = previous_cursor = None
+        if page < num_pages and listing.last:
+            next_cursor = encode_cursor(page + 1, "next", *listing.last)
+        if page > 1 and listing.first:
+            previous_cursor = encode_cursor(page - 1, "prev", *listing.first)
 
         page_listing = PageListing(
-            items=diagrams,
+            items=listing.diagrams,
             total=total_items,
             limit=limit,
-            offset=offset,
+            offset=(page - 1) * limit,
             current_page=page,
             num_pages=num_pages,
+            next_cursor=next_cursor,
+            previous_cursor=previous_cursor,
         )
-
-        current_folder = None
-        if folder_id:
-            current_folder = self.folder_repo.get(folder_id)
-
         return {
             "page_listing": page_listing,
-            "folders": folders,
-            "current_folder": current_folder,
+            "folders": listing.folders,
+            "current_folder": listing.current_folder,
+            "ancestors": listing.ancestors,
             "folder_id": folder_id,
         }
 
 
+@view_defaults(route_name="diagrams_search")
+class DiagramSearch(DiagramsRepoViewMixin):
+
+    @view_config(
+        request_method="GET",
+        renderer="easy_diagrams:templates/search.pt",
+    )
+    def search(self):
+        """Diagrams matching the ``q`` text, continued by ``cursor``."""
+        text = self.request.params.get("q", "").strip()
+        cursor = self.request.params.get("cursor")
+        cursor = decode_cursor(cursor) if cursor else None
+        if cursor is not None and (cursor["kind"], cursor["dir"]) != ("match", "next"):
+            raise HTTPBadRequest("Invalid cursor")
+        limit = int(self.request.registry.settings.get("diagrams.page_size", 10))
+        page = cursor["page"] if cursor else 1
+        # one more to know whether there is a next page
+        results = self.diagram_repo.search(
+            text, limit=limit + 1, after=cursor["key"] if cursor else None
+        )
+        next_cursor = None
+        if len(results) > limit:
+            results = results[:limit]
+            next_cursor = encode_cursor(page + 1, "next", "match", results[-1].key)
+        return {
+            "q": text,
+            "results": results,
+            "current_page": page,
+            "next_cursor": next_cursor,
+        }
+
+
+@view_defaults(route_name="diagrams_trash")
+class DiagramTrash(DiagramsRepoViewMixin):
+
+    @view_config(
+        request_method="GET",
+        renderer="easy_diagrams:templates/trash.pt",
+    )
+    def list_trash(self):
+        """Diagrams in the trash, continued by ``cursor``, with when they are
+        purged."""
+        cursor = self.request.params.get("cursor")
+        cursor = decode_cursor(cursor) if cursor else None
+        if cursor is not None and (cursor["kind"], cursor["dir"]) != ("trash", "next"):
+            raise HTTPBadRequest("Invalid cursor")
+        settings = self.request.registry.settings
+        limit = int(settings.get("diagrams.page_size", 10))
+        retention_days = int(
+            settings.get("diagrams.trash.retention_days", trash.DEFAULT_RETENTION_DAYS)
+        )
+        page = cursor["page"] if cursor else 1
+        # one more to know whether there is a next page
+        diagrams = self.diagram_repo.list_deleted(
+            limit=limit + 1, after=cursor["key"] if cursor else None
+        )
+        next_cursor = None
+        if len(diagrams) > limit:
+            diagrams = diagrams[:limit]
+            next_cursor = encode_cursor(page + 1, "next", "trash", diagrams[-1].key)
+        return {
+            "diagrams": diagrams,
+            "expires_at": functools.partial(
+                trash.expires_at, retention_days=retention_days
+            ),
+            "next_cursor": next_cursor,
+        }
+
+    @view_config(request_method="POST")
+    def restore(self):
+        diagram_id = self.request.params.get("diagram_id")
+        if not diagram_id:
+            raise HTTPBadRequest("Diagram ID is required")
+        self.diagram_repo.restore(diagram_id)
+        return HTTPSeeOther(location=self.request.route_url("diagrams_trash"))
+
+
+#: Max age of responses for URLs which content never changes
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
 class DiagramResourceMixin(DiagramsRepoViewMixin):
 
     @property
     def requested_diagram_id(self):
         return self.request.matchdict.get("diagram_id")
 
+    def _cache_control(self, is_public: bool, immutable: bool = False) -> str:
+        """Public diagrams can be cached longer and by shared caches. Lifetimes
+        are configured by the ``diagrams.cache.max_age`` and
+        ``diagrams.cache.public_max_age`` settings."""
+        settings = self.request.registry.settings
+        if immutable:
+            max_age = IMMUTABLE_MAX_AGE
+        elif is_public:
+            max_age = int(settings.get("diagrams.cache.public_max_age", 300))
+        else:
+            max_age = int(settings.get("diagrams.cache.max_age", 0))
+        value = f"{'public' if is_public else 'private'}, max-age={max_age}"
+        return f"{value}, immutable" if immutable else value
+
+    def _not_modified(self, response: Response) -> bool:
+        """Whether the client has the response cached already, based on the
+        ``ETag`` and ``Last-Modified`` headers of the response."""
+        request = self.request
+        if request.if_none_match:
+            return response.etag in request.if_none_match
+        if response.last_modified and request.if_modified_since:
+            return response.last_modified <= request.if_modified_since
+        return False
+
     @property
     def diagram(self):
         return self.diagram_repo.get(self.requested_diagram_id)
@@ -192,13 +317,35 @@ class DiagramViews(DiagramResourceMixin):
         renderer="json",
     )
     def json_view(self):
+        diagram = self.diagram
+        response = self.request.response
+        response.etag = (
+            f"{diagram.code_version or 0}-{diagram.updated_at.timestamp() * 1e6:.0f}"
+        )
+        response.last_modified = diagram.updated_at
+        response.headers["Cache-Control"] = self._cache_control(is_public=False)
+        if self._not_modified(response):
+            response.status_int = 304
+            return response
         return {
-            "id": self.diagram.id,
-            "title": self.diagram.title,
-            "is_public": self.diagram.is_public,
-            "code": self.diagram.code,
+            "id": diagram.id,
+            "title": diagram.title,
+            "is_public": diagram.is_public,
+            "code": diagram.code,
         }
 
+    @view_config(
+        route_name="diagram_view_preview",
+        renderer="easy_diagrams:templates/image.pt",
+    )
+    def preview(self):
+        """Polled by the editor until the render worker renders the diagram."""
+        try:
+            attempt = int(self.request.params.get("attempt", 0))
+        except ValueError:
+            raise HTTPBadRequest("Invalid attempt")
+        return {"diagram": self.diagram, "attempt": attempt}
+
     @view_config(
         route_name="diagram_view_image_png",
         permission=NO_PERMISSION_REQUIRED,
@@ -214,12 +361,33 @@ class DiagramViews(DiagramResourceMixin):
         return self._rendered_image("svg")
 
     def _rendered_image(self, file_format: str):
-        image = self.diagram_repo.get_image_render(self.requested_diagram_id)
-        response = Response(body=image)
-        response.content_type = f"image/{file_format}"
+        info = self.diagram_repo.get_image_info(self.requested_diagram_id, file_format)
+        response = Response()
+        response.content_type = RENDER_FORMATS[file_format]
+        response.etag = f"{file_format}-{info.version}"
+        if info.rendered_at is not None:
+            response.last_modified = info.rendered_at
+        # the editor references images by version, so a new render always
+        # gets a new URL; other versions are revalidated, so that a wrong one
+        # doesn't cache the current image for good
+        response.headers["Cache-Control"] = self._cache_control(
+            info.is_public,
+            immutable=self.request.params.get("v") == str(info.version),
+        )
         # name = slugify(self.diagram.title or "image")
         name = "image"
-        response.headers["Content-Disposition"] = f"filename={name}.{file_format}"
+        response.headers["Content-Disposition"] = (
+            f"inline; filename={name}.{file_format}"
+        )
+        # SVG of user code is served from the origin of the app, opening it
+        # must not run its scripts
+        response.headers["Content-Security-Policy"] = "sandbox"
+        if self._not_modified(response):
+            response.status_int = 304
+            return response
+        response.body = self.diagram_repo.get_image_render(
+            self.requested_diagram_id, file_format
+        )
         return response
 
 
@@ -236,6 +404,10 @@ class DiagramEntity(DiagramResourceMixin):
         except ValidationError as e:
             raise HTTPBadRequest(e)
         diagram: Diagram = self.diagram_repo.edit(self.requested_diagram_id, changes)
+        if changes.code is None:
+            # title and visibility changes don't affect the preview
+            return Response(status=204)
+        # the render worker renders the new code, the preview polls for it
         return {"diagram": diagram}
 
     @view_config(request_method="DELETE")
@@ -7,6 +7,7 @@ from pyramid.view import view_config
 from easy_diagrams import interfaces
 from easy_diagrams.domain.organization import OrganizationEdit
 from easy_diagrams.domain.organization import OrganizationID
+from easy_diagrams.services.organization_repo import split_emails
 
 
 class OrganizationRepoViewMixin:
@@ -116,6 +117,29 @@ class OrganizationUsersView(OrganizationRepoViewMixin):
             )
         )
 
+    @view_config(
+        route_name="organization_users",
+        request_method="POST",
+        request_param="emails",
+        renderer="../templates/organization_users_import.pt",
+    )
+    def organization_import_users(self):
+        """Add users to organization in bulk from pasted or CSV emails."""
+        org_id = OrganizationID(self.request.matchdict["organization_id"])
+
+        text = self.request.POST.get("emails", "")
+        upload = self.request.POST.get("file")
+        if hasattr(upload, "file"):
+            text += "\n" + upload.file.read().decode("utf-8-sig", errors="replace")
+        is_owner = self.request.POST.get("is_owner") == "on"
+
+        report = self.organization_repo.add_users(org_id, split_emails(text), is_owner)
+
+        return {
+            "organization": self.organization_repo.get(org_id),
+            "report": report,
+        }
+
 
 class OrganizationUserView(OrganizationRepoViewMixin):
     def __init__(self, request: Request):
@@ -11,6 +11,7 @@ from webob.cookies import Cookie
 from easy_diagrams import interfaces
 from easy_diagrams import main
 from easy_diagrams import models
+from easy_diagrams.services.render_worker import RenderWorker
 
 
 @pytest.fixture(scope="session")
@@ -116,10 +117,22 @@ class DummyRenderer:
         self.context = context
         self.request = request
 
-    def render(self, diagram):
+    def render(self, diagram, file_format="png"):
         return b"dummy_image"
 
 
+@pytest.fixture(name="render_pending")
+def render_pending_fixture(dbsession):
+    """Renders the edited diagrams, as the render worker does."""
+    worker = RenderWorker(dbsession, DummyRenderer(None, None))
+
+    def render_pending():
+        for job in worker.claim(limit=100):
+            worker.apply(job, worker.render(job))
+
+    return render_pending
+
+
 @pytest.fixture
 def testapp(app, tm, dbsession, request_host) -> TestApp:
     # override request.dbsession and request.tm with our own
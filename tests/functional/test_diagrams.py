@@ -24,7 +24,7 @@ def create_diagram(testapp, csrf_headers):
 
 
 @pytest.fixture(name="diagram")
-def diagram_fixture(testapp, csrf_headers):
+def diagram_fixture(testapp, csrf_headers, render_pending):
     testapp.login()
     diagram_id = create_diagram(testapp, csrf_headers)
     testapp.put(
@@ -36,6 +36,7 @@ def diagram_fixture(testapp, csrf_headers):
         status=200,
         **csrf_headers,
     )
+    render_pending()
     diagram = testapp.get(f"/diagrams/{diagram_id}/json", status=200).json
     return diagram
 
@@ -150,6 +151,91 @@ class TestDiagramList:
         # Next link should not be present
         assert not pagination.xpath("ul/li/a[text()='Next']")
 
+        # 3. Go back to the first page
+        res = testapp.get(previous_link.get("href"), status=200)
+        listed_diagrams = res.lxml.xpath(
+            "//table[@id='diagrams']/tbody/tr[td[1][text()='📄']]"
+        )
+        assert len(listed_diagrams) == 10
+        pagination = res.lxml.xpath("//nav[@aria-label='Diagrams pagination']")[0]
+        assert "Page 1 of 2" in " ".join(pagination.text_content().split())
+
+    def test_pagination_with_folders(self, testapp, csrf_headers):
+        testapp.login()
+        for i in range(12):
+            testapp.post(
+                "/diagrams",
+                params={"action": "create_folder", "name": f"Folder {i:02}"},
+                status=303,
+                **csrf_headers,
+            )
+        for _ in range(3):
+            testapp.post(
+                "/diagrams",
+                params={"action": "create_diagram"},
+                status=303,
+                **csrf_headers,
+            )
+
+        def rows(res):
+            return [
+                row.xpath("td[1]/text()")[0]
+                for row in res.lxml.xpath("//table[@id='diagrams']/tbody/tr")
+            ]
+
+        def link(res, text):
+            return res.lxml.xpath(
+                f"//nav[@aria-label='Diagrams pagination']//a[text()='{text}']/@href"
+            )[0]
+
+        first = testapp.get("/diagrams", status=200)
+        second = testapp.get(link(first, "Next"), status=200)
+        assert rows(second).count("📄") == 3
+        assert len(rows(second)) == 5
+
+        back = testapp.get(link(second, "Previous"), status=200)
+        assert rows(back) == rows(first)
+
+    def test_invalid_cursor(self, testapp):
+        testapp.login()
+        testapp.get("/diagrams", params={"cursor": "garbage"}, status=400)
+
+
+class TestDiagramSearch:
+    """Tests for the diagram search view."""
+
+    def test_search(self, testapp, csrf_headers):
+        testapp.login()
+        for title in ("Payment flow", "Payment errors", "Login"):
+            diagram_id = create_diagram(testapp, csrf_headers)
+            testapp.put(
+                f"/diagrams/{diagram_id}",
+                params={"title": title},
+                **csrf_headers,
+            )
+
+        res = testapp.get("/diagrams/search", params={"q": "payment"}, status=200)
+        titles = res.lxml.xpath("//table[@id='results']/tbody/tr/td[1]/a/text()")
+        assert sorted(titles) == ["Payment errors", "Payment flow"]
+
+        res = testapp.get("/diagrams/search", params={"q": "nothing"}, status=200)
+        assert "No diagrams found." in res.text
+
+    def test_search_pagination(self, testapp, csrf_headers):
+        testapp.login()
+        for _ in range(11):
+            diagram_id = create_diagram(testapp, csrf_headers)
+            testapp.put(
+                f"/diagrams/{diagram_id}", params={"title": "Same"}, **csrf_headers
+            )
+
+        res = testapp.get("/diagrams/search", params={"q": "same"}, status=200)
+        assert len(res.lxml.xpath("//table[@id='results']/tbody/tr")) == 10
+        more = res.lxml.xpath("//a[text()='More results']/@href")[0]
+        res = testapp.get(more, status=200)
+        assert len(res.lxml.xpath("//table[@id='results']/tbody/tr")) == 1
+        assert not res.lxml.xpath("//a[text()='More results']")
+
 
 class TestDiagramResourceDelete:
     """Tests for the diagram resource delete view."""
@@ -180,6 +266,55 @@ class TestDiagramResourceDelete:
         assert res.status_code == 404
 
 
+class TestDiagramTrash:
+    """Tests for the trash view."""
+
+    def test_restore(self, testapp, csrf_headers, diagram):
+        testapp.delete(f"/diagrams/{diagram['id']}", status=204, **csrf_headers)
+        res = testapp.get("/diagrams/trash", status=200)
+        titles = res.lxml.xpath("//table[@id='trash']/tbody/tr/td[1]/text()")
+        assert titles == [diagram["title"]]
+
+        testapp.post(
+            "/diagrams/trash",
+            params={"diagram_id": diagram["id"]},
+            status=303,
+            **csrf_headers,
+        )
+        testapp.get(f"/diagrams/{diagram['id']}/editor", status=200)
+        res = testapp.get("/diagrams/trash", status=200)
+        assert "The trash is empty." in res.text
+
+    def test_pagination(self, testapp, csrf_headers):
+        testapp.login()
+        for _ in range(11):
+            diagram_id = create_diagram(testapp, csrf_headers)
+            testapp.delete(f"/diagrams/{diagram_id}", status=204, **csrf_headers)
+
+        res = testapp.get("/diagrams/trash", status=200)
+        assert len(res.lxml.xpath("//table[@id='trash']/tbody/tr")) == 10
+        more = res.lxml.xpath("//a[text()='More diagrams']/@href")[0]
+        res = testapp.get(more, status=200)
+        assert len(res.lxml.xpath("//table[@id='trash']/tbody/tr")) == 1
+
+    def test_user_can_restore_only_own_diagrams(
+        self, testapp, csrf_headers, user_factory, diagram
+    ):
+        testapp.delete(f"/diagrams/{diagram['id']}", status=204, **csrf_headers)
+        testapp.login(user_factory().email)
+        testapp.post(
+            "/diagrams/trash",
+            params={"diagram_id": diagram["id"]},
+            status=404,
+            **csrf_headers,
+        )
+
+    def test_csrf_token_is_required(self, testapp, diagram):
+        testapp.post(
+            "/diagrams/trash", params={"diagram_id": diagram["id"]}, status=400
+        )
+
+
 class TestDiagramResourceUpdate:
     """Tests for the diagram resource update view."""
 
@@ -201,10 +336,55 @@ class TestDiagramResourceUpdate:
             "code": "hi code",
         }
 
+    def test_code_update_leaves_render_to_worker(self, testapp, csrf_headers, diagram):
+        resp = testapp.put(
+            f"/diagrams/{diagram['id']}",
+            params={"code": "new code"},
+            status=200,
+            **csrf_headers,
+        )
+        # the outdated image is shown until the new code is rendered
+        assert "diagram_render_pending" in resp.text
+        assert resp.html.img is not None
+
+    def test_code_update_references_image_by_version(
+        self, testapp, csrf_headers, render_pending, diagram
+    ):
+        testapp.put(
+            f"/diagrams/{diagram['id']}",
+            params={"code": "new code"},
+            status=200,
+            **csrf_headers,
+        )
+        render_pending()
+        resp = testapp.get(f"/diagrams/{diagram['id']}/preview", status=200)
+        assert "diagram_render_pending" not in resp.text
+        src = resp.html.img["src"]
+        assert f"/diagrams/{diagram['id']}/image.png?v=" in src
+        assert "base64" not in resp.text
+
+        resp = testapp.get(src, status=200)
+        assert "immutable" in resp.headers["Cache-Control"]
+
+        # a version other than the current one is revalidated
+        resp = testapp.get(
+            f"/diagrams/{diagram['id']}/image.png", params={"v": "1"}, status=200
+        )
+        assert "immutable" not in resp.headers["Cache-Control"]
+
+    def test_title_update_returns_no_content(self, testapp, csrf_headers, diagram):
+        resp = testapp.put(
+            f"/diagrams/{diagram['id']}",
+            params={"title": "new title"},
+            status=204,
+            **csrf_headers,
+        )
+        assert resp.body == b""
+
     def test_diagram_update_validation(self, testapp, csrf_headers, diagram):
 
         # empty values are fine
-        testapp.put(f"/diagrams/{diagram['id']}", params={}, status=200, **csrf_headers)
+        testapp.put(f"/diagrams/{diagram['id']}", params={}, status=204, **csrf_headers)
 
         # extra values
         resp = testapp.put(
@@ -317,6 +497,28 @@ class TestDiagramEditorView:
         testapp.get("/diagrams/abcd/editor", status=404)
 
 
+class TestDiagramPreview:
+    """Preview is polled by the editor while the image is being rendered."""
+
+    def test_preview(self, testapp, diagram):
+        res = testapp.get(f"/diagrams/{diagram['id']}/preview", status=200)
+        assert 'id="diagram_image"' in res.text
+        assert "diagram_render_pending" not in res.text
+
+    def test_invalid_attempt(self, testapp, diagram):
+        testapp.get(f"/diagrams/{diagram['id']}/preview?attempt=x", status=400)
+
+    def test_user_must_be_logged_in(self, testapp, request_host):
+        res = testapp.get("/diagrams/abcd/preview", status=303)
+        assert res.location.startswith(f"http://{request_host}/login?next=")
+
+    def test_preview_can_be_invoked_only_own_diagrams(
+        self, testapp, user_factory, diagram
+    ):
+        testapp.login(user_factory().email)
+        testapp.get(f"/diagrams/{diagram['id']}/preview", status=404)
+
+
 class TestDiagramBuiltinEditor:
     """Tests for the diagram builtin editor view.
 
@@ -351,6 +553,11 @@ class TestDiagramImage:
         resp = testapp.get(f"/diagrams/{diagram['id']}/image.png", status=200)
         assert resp.body == b"dummy_image"
 
+    def test_svg_image_view(self, testapp, diagram):
+        resp = testapp.get(f"/diagrams/{diagram['id']}/image.svg", status=200)
+        assert resp.content_type == "image/svg+xml"
+        assert resp.body == b"dummy_image"
+
     def test_not_public_images_accessible_only_to_owner(
         self, testapp, user_factory, diagram
     ):
@@ -380,7 +587,7 @@ class TestDiagramImage:
         testapp.put(
             f"/diagrams/{diagram['id']}",
             params={"is_public": True},
-            status=200,
+            status=204,
             **csrf_headers,
         )
 
@@ -394,3 +601,74 @@ class TestDiagramImage:
         # checking not logged in user can access the image
         testapp.logout()
         testapp.get(f"/diagrams/{diagram['id']}/image.png", status=200)
+
+
+class TestQueryCount:
+    """Guards against views running redundant queries."""
+
+    def test_json_view_loads_diagram_once(self, testapp, diagram, caplog):
+        with caplog.at_level("DEBUG", logger="easy_diagrams.models"):
+            testapp.get(f"/diagrams/{diagram['id']}/json", status=200)
+        # the authenticated user is cached, one query for the diagram
+        assert caplog.messages == [
+            f"GET /diagrams/{diagram['id']}/json executed 1 queries"
+        ]
+
+
+class TestConditionalRequests:
+    """Images and JSON are revalidated by ETag and Last-Modified."""
+
+    def test_image_not_modified(self, testapp, diagram):
+        url = f"/diagrams/{diagram['id']}/image.png"
+        resp = testapp.get(url, status=200)
+        assert resp.etag
+        assert resp.last_modified
+        assert resp.headers["Cache-Control"] == "private, max-age=0"
+
+        resp = testapp.get(url, headers={"If-None-Match": f'"{resp.etag}"'}, status=304)
+        assert resp.body == b""
+
+        resp = testapp.get(
+            url,
+            headers={"If-Modified-Since": resp.headers["Last-Modified"]},
+            status=304,
+        )
+
+    def test_image_modified(self, testapp, csrf_headers, render_pending, diagram):
+        url = f"/diagrams/{diagram['id']}/image.png"
+        etag = testapp.get(url, status=200).etag
+        testapp.put(
+            f"/diagrams/{diagram['id']}",
+            params={"code": "new code"},
+            status=200,
+            **csrf_headers,
+        )
+        render_pending()
+        resp = testapp.get(url, headers={"If-None-Match": f'"{etag}"'}, status=200)
+        assert resp.etag != etag
+        assert resp.body == b"dummy_image"
+
+    def test_public_image_is_cached_longer(self, testapp, csrf_headers, diagram):
+        testapp.put(
+            f"/diagrams/{diagram['id']}",
+            params={"is_public": True},
+            status=204,
+            **csrf_headers,
+        )
+        resp = testapp.get(f"/diagrams/{diagram['id']}/image.svg", status=200)
+        assert resp.headers["Cache-Control"] == "public, max-age=300"
+        assert "Set-Cookie" not in resp.headers
+
+    def test_json_not_modified(self, testapp, csrf_headers, diagram):
+        url = f"/diagrams/{diagram['id']}/json"
+        etag = testapp.get(url, status=200).etag
+        testapp.get(url, headers={"If-None-Match": f'"{etag}"'}, status=304)
+
+        testapp.put(
+            f"/diagrams/{diagram['id']}",
+            params={"title": "new title"},
+            status=204,
+            **csrf_headers,
+        )
+        resp = testapp.get(url, headers={"If-None-Match": f'"{etag}"'}, status=200)
+        assert resp.json["title"] == "new title"
@@ -87,6 +87,37 @@ class TestFolderOperations:
         assert "Navigation Test" in res.text
         assert "breadcrumb" in res.text
 
+    def test_breadcrumb_shows_ancestors(self, testapp, csrf_headers):
+        testapp.login()
+        testapp.post(
+            "/diagrams",
+            params={"action": "create_folder", "name": "Outer"},
+            status=303,
+            **csrf_headers,
+        )
+        res = testapp.get("/diagrams", status=200)
+        outer_url = res.lxml.xpath("//a[contains(@href, 'folder_id=')]/@href")[0]
+        outer_id = outer_url.split("folder_id=")[1]
+        testapp.post(
+            "/diagrams",
+            params={"action": "create_folder", "name": "Inner", "parent_id": outer_id},
+            status=303,
+            **csrf_headers,
+        )
+        res = testapp.get(outer_url, status=200)
+        inner_url = res.lxml.xpath(
+            "//table[@id='diagrams']//a[contains(@href, 'folder_id=')]/@href"
+        )[0]
+
+        res = testapp.get(inner_url, status=200)
+        breadcrumb = res.lxml.xpath("//ol[@class='breadcrumb']/li")
+        assert [" ".join(li.text_content().split()) for li in breadcrumb] == [
+            "Root",
+            "Outer",
+            "Inner",
+        ]
+        assert breadcrumb[1].xpath("a/@href")[0] == outer_url
+
     def test_create_diagram_in_folder(self, testapp, csrf_headers):
         testapp.login()
 
@@ -144,7 +175,7 @@ class TestFolderOperations:
             "//nav[@aria-label='Diagrams pagination']//a/@href"
         )
         for link in pagination_links:
-            if "page=" in link:
+            if "cursor=" in link:
                 assert f"folder_id={folder_id}" in link
 
     def test_user_isolation_folders(self, testapp, csrf_headers, user_factory):
@@ -0,0 +1,34 @@
+import pytest
+from webtest import Upload
+
+
+@pytest.fixture(name="csrf_headers")
+def csrf_headers_fixture(testapp):
+    return dict(headers={"X-CSRF-Token": testapp.get_csrf_token()})
+
+
+class TestImportUsers:
+
+    def test_import_users(self, testapp, csrf_headers):
+        testapp.login()
+        res = testapp.get("/organizations", status=200)
+        detail_url = res.lxml.xpath("//a[contains(@href, '/organizations/')]/@href")[0]
+
+        res = testapp.post(
+            detail_url + "/users",
+            params={
+                "emails": "one@example.com\ninvalid",
+                "file": Upload(
+                    "members.csv", b"name,email\nTwo,two@example.com\n", "text/csv"
+                ),
+            },
+            status=200,
+            **csrf_headers,
+        )
+        assert "one@example.com" in res.text
+        assert "two@example.com" in res.text
+        assert "invalid" in res.text
+
+        res = testapp.get(detail_url, status=200)
+        assert "one@example.com" in res.text
+        assert "two@example.com" in res.text
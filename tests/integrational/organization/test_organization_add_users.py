@@ -0,0 +1,72 @@
+import pytest
+
+from easy_diagrams import models
+from easy_diagrams.models.metrics import query_count
+from easy_diagrams.services import organization_repo as organization_repo_module
+from easy_diagrams.services.organization_repo import OrganizationRepo
+
+
+@pytest.fixture
+def organization_repo(dbsession, user):
+    """Create organization repository for testing."""
+    return OrganizationRepo(str(user.id), dbsession)
+
+
+def test_add_users(organization_repo, dbsession, user_factory):
+    org_id = organization_repo.create("Test Org")
+    member = user_factory()
+    organization_repo.add_user(org_id, member.email)
+    outsider = user_factory()
+
+    report = organization_repo.add_users(
+        org_id,
+        [
+            "new@example.com",
+            member.email,
+            outsider.email,
+            "not-an-email",
+            "new@example.com",
+            "",
+        ],
+    )
+
+    assert report.added == ("new@example.com", outsider.email)
+    assert report.existing == (member.email,)
+    assert report.invalid == ("not-an-email",)
+
+    users = organization_repo.list_users(org_id)
+    assert {u["email"] for u in users} >= {"new@example.com", outsider.email}
+    assert not any(u["is_owner"] for u in users if u["email"] == "new@example.com")
+    created = dbsession.query(models.User).filter_by(email="new@example.com").one()
+    assert created.id is not None
+    assert created.created_at is not None
+
+
+def test_add_users_as_owners(organization_repo):
+    org_id = organization_repo.create("Test Org")
+
+    organization_repo.add_users(org_id, ["a@example.com", "b@example.com"], True)
+
+    assert len(organization_repo.get_owners(org_id)) == 3
+
+
+def test_add_users_in_batches(organization_repo, dbsession, monkeypatch):
+    monkeypatch.setattr(organization_repo_module, "IMPORT_BATCH_SIZE", 2)
+    org_id = organization_repo.create("Test Org")
+    emails = [f"user{i}@example.com" for i in range(5)]
+
+    queries = query_count(dbsession)
+    report = organization_repo.add_users(org_id, emails)
+
+    assert report.added == tuple(emails)
+    # the users and their associations by batch of two
+    assert query_count(dbsession) == queries + 3 * 2
+
+
+def test_add_users_requires_access(dbsession, user_factory):
+    other_repo = OrganizationRepo(str(user_factory().id), dbsession)
+    org_id = other_repo.create("Other Org")
+    repo = OrganizationRepo(str(user_factory().id), dbsession)
+
+    with pytest.raises(ValueError):
+        repo.add_users(org_id, ["a@example.com"])
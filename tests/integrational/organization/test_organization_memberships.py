@@ -0,0 +1,133 @@
+import pytest
+from pyramid import testing
+
+from easy_diagrams.domain.organization import OrganizationID
+from easy_diagrams.models.metrics import query_count
+from easy_diagrams.services.organization_repo import INVALIDATED_ROLES
+from easy_diagrams.services.organization_repo import MEMBER
+from easy_diagrams.services.organization_repo import OWNER
+from easy_diagrams.services.organization_repo import Memberships
+from easy_diagrams.services.organization_repo import OrganizationRepo
+from easy_diagrams.services.organization_repo import selected_organization_id
+
+
+@pytest.fixture(name="memberships")
+def memberships_fixture():
+    return Memberships()
+
+
+@pytest.fixture(name="organization_id")
+def organization_id_fixture(dbsession, user, user_factory, memberships):
+    repo = OrganizationRepo(user.id, dbsession, memberships)
+    organization_id = repo.create("Test Org")
+    repo.add_user(organization_id, user_factory().email)
+    return organization_id
+
+
+def test_role_is_checked_once_per_repository(dbsession, user, organization_id):
+    repo = OrganizationRepo(user.id, dbsession)
+    assert repo.get_role(organization_id) == OWNER
+    queries = query_count(dbsession)
+    repo.get_owners(organization_id)
+    repo.list_users(organization_id)
+    # only the owners and the users are queried
+    assert query_count(dbsession) == queries + 2
+
+
+def test_role_is_cached_by_process(dbsession, user, organization_id, memberships):
+    assert OrganizationRepo(user.id, dbsession, memberships).get_role(organization_id)
+    queries = query_count(dbsession)
+    repo = OrganizationRepo(user.id, dbsession, memberships)
+    assert repo.get_role(organization_id) == OWNER
+    assert query_count(dbsession) == queries
+
+
+def test_changed_roles_are_invalidated(
+    dbsession, user, user_factory, organization_id, memberships
+):
+    member = user_factory()
+    repo = OrganizationRepo(user.id, dbsession, memberships)
+    repo.add_user(organization_id, member.email)
+
+    member_repo = OrganizationRepo(member.id, dbsession, memberships)
+    assert member_repo.get_role(organization_id) == MEMBER
+
+    repo.make_owner(organization_id, str(member.id))
+    member_repo = OrganizationRepo(member.id, dbsession, memberships)
+    assert member_repo.get_role(organization_id) == OWNER
+
+    repo.remove_owner(organization_id, str(member.id))
+    member_repo = OrganizationRepo(member.id, dbsession, memberships)
+    assert member_repo.get_role(organization_id) == MEMBER
+
+    repo.remove_user(organization_id, str(member.id))
+    member_repo = OrganizationRepo(member.id, dbsession, memberships)
+    assert member_repo.get_role(organization_id) is None
+    with pytest.raises(ValueError):
+        member_repo.list_users(organization_id)
+
+
+def test_deleted_organization_is_invalidated(
+    dbsession, user, organization_id, memberships
+):
+    OrganizationRepo(user.id, dbsession, memberships).delete(organization_id)
+    repo = OrganizationRepo(user.id, dbsession, memberships)
+    assert repo.get_role(organization_id) is None
+    assert len(memberships.roles) == 0
+
+
+def test_roles_are_forgotten_once_committed(
+    dbsession, user, user_factory, organization_id, memberships
+):
+    member = user_factory()
+    repo = OrganizationRepo(user.id, dbsession, memberships)
+    repo.add_user(organization_id, member.email)
+    listeners = len(list(dbsession.dispatch.after_commit))
+    repo.make_owner(organization_id, str(member.id))
+    repo.remove_owner(organization_id, str(member.id))
+    # one listener forgets every role changed by the transaction
+    assert len(list(dbsession.dispatch.after_commit)) == listeners
+
+    memberships.set(member.id, organization_id.value, OWNER)
+    dbsession.dispatch.after_commit(dbsession)
+    assert memberships.get(member.id, organization_id.value) is None
+    assert INVALIDATED_ROLES not in dbsession.info
+
+
+def test_selected_organization_is_revalidated(
+    dbsession, user, user_factory, organization_id, memberships
+):
+    member = user_factory()
+    OrganizationRepo(user.id, dbsession, memberships).add_user(
+        organization_id, member.email
+    )
+
+    def member_request():
+        request = testing.DummyRequest()
+        request.find_service = lambda iface: OrganizationRepo(
+            member.id, dbsession, memberships
+        )
+        request.session["selected_organization_id"] = str(organization_id.value)
+        request.session["selected_organization_name"] = "Test Org"
+        return request
+
+    with testing.testConfig() as config:
+        config.testing_securitypolicy(userid=member.id)
+        request = member_request()
+        assert selected_organization_id(request) == str(organization_id.value)
+
+        OrganizationRepo(user.id, dbsession, memberships).remove_user(
+            organization_id, str(member.id)
+        )
+        request = member_request()
+        assert selected_organization_id(request) is None
+    assert "selected_organization_id" not in request.session
+    assert "selected_organization_name" not in request.session
+
+
+def test_unknown_organization(dbsession, user):
+    repo = OrganizationRepo(user.id, dbsession)
+    unknown = OrganizationID("00000000-0000-0000-0000-000000000000")
+    assert repo.get_role(unknown) is None
+    with pytest.raises(ValueError):
+        repo.get(unknown)
@@ -1,6 +1,7 @@
 import pytest
 
 from easy_diagrams import models
+from easy_diagrams.services import deletions
 from easy_diagrams.services.organization_repo import OrganizationRepo
 
 
@@ -102,8 +103,10 @@ def test_delete_removes_all_associations(organization_repo, dbsession, other_use
     ).fetchall()
     assert len(associations) == 2  # Creator + added user
 
-    # Delete organization
+    # Delete organization, the associations are purged in the background
     organization_repo.delete(org_id)
+    while not deletions.purge(dbsession).finished:
+        pass
 
     # Verify all associations are gone
     associations = dbsession.execute(
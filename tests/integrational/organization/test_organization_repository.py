@@ -5,6 +5,7 @@ import pytest
 from easy_diagrams import models
 from easy_diagrams.domain.organization import OrganizationEdit
 from easy_diagrams.domain.organization import OrganizationID
+from easy_diagrams.services import deletions
 from easy_diagrams.services.organization_repo import OrganizationRepo
 
 
@@ -91,7 +92,14 @@ def test_delete_organization(organization_repo, dbsession):
 
     organization_repo.delete(org_id)
 
-    # Verify organization is deleted
+    # Verify organization is hidden at once
+    assert org_id not in [org.id for org in organization_repo.list()]
+    with pytest.raises(ValueError):
+        organization_repo.get(org_id)
+
+    # Verify organization is deleted once purged
+    while not deletions.purge(dbsession).finished:
+        pass
     org = (
         dbsession.query(models.OrganizationTable)
         .filter(models.OrganizationTable.id == org_id.value)
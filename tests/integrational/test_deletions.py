@@ -0,0 +1,180 @@
+import pytest
+from sqlalchemy import func
+from sqlalchemy import select
+
+from easy_diagrams.domain.diagram import DiagramEdit
+from easy_diagrams.domain.organization import OrganizationID
+from easy_diagrams.exceptions import DiagramNotFoundError
+from easy_diagrams.models.deletion import DeletionJobTable
+from easy_diagrams.models.diagram import DiagramRenderTable
+from easy_diagrams.models.diagram import DiagramSymbolTable
+from easy_diagrams.models.diagram import DiagramTable
+from easy_diagrams.models.folder import FolderCounterTable
+from easy_diagrams.models.folder import FolderTable
+from easy_diagrams.models.organization import OrganizationTable
+from easy_diagrams.models.organization import organization_user_association
+from easy_diagrams.services import deletions
+from easy_diagrams.services import folder_counters
+from easy_diagrams.services.diagram_repo import DiagramRepository
+from easy_diagrams.services.diagram_repo import store_render
+from easy_diagrams.services.folder_repo import FolderRepository
+from easy_diagrams.services.listing_query import ListingQuery
+from easy_diagrams.services.organization_repo import OrganizationRepo
+
+
+def count(dbsession, table, *conditions):
+    return dbsession.scalar(select(func.count()).select_from(table).filter(*conditions))
+
+
+def purge_all(dbsession, batch_size):
+    jobs = []
+    while (job := deletions.purge(dbsession, batch_size)) is not None:
+        jobs.append(job)
+    return jobs
+
+
+@pytest.fixture(name="tree")
+def tree_fixture(dbsession, organization):
+    """Folders ``parent/child/grandchild`` and ``other``, with two diagrams in
+    each and their renders."""
+    folder_repo = FolderRepository(dbsession, str(organization.id))
+    parent = folder_repo.create("parent")
+    child = folder_repo.create("child", parent_id=parent)
+    grandchild = folder_repo.create("grandchild", parent_id=child)
+    other = folder_repo.create("other")
+    diagram_repo = DiagramRepository(dbsession, None, str(organization.id))
+    for folder_id in (parent, child, grandchild, other):
+        for _ in range(2):
+            diagram_id = diagram_repo.create(folder_id=folder_id)
+            diagram_repo.edit(
+                diagram_id, DiagramEdit(code="@startuml\nA -> B\n@enduml")
+            )
+            store_render(dbsession, diagram_id, "png", 1, b"image")
+    return parent, child, grandchild, other
+
+
+def test_delete_folder(dbsession, organization, tree):
+    parent, child, grandchild, other = tree
+    FolderRepository(dbsession, str(organization.id)).delete(parent)
+
+    # hidden at once
+    listing = ListingQuery(dbsession, str(organization.id))
+    assert [f.name for f in listing.page().folders] == ["other"]
+    assert listing.page().total == 1
+    diagram_repo = DiagramRepository(dbsession, None, str(organization.id))
+    assert diagram_repo.count(folder_id=parent, recursive=True) == 0
+
+    jobs = purge_all(dbsession, batch_size=4)
+    # two batches of diagrams, one of folders and the last finishing the job
+    assert [(job.diagrams, job.folders, job.finished) for job in jobs] == [
+        (4, 0, False),
+        (6, 0, False),
+        (6, 3, False),
+        (6, 3, True),
+    ]
+
+    folder_ids = (parent, child, grandchild)
+    assert count(dbsession, FolderTable, FolderTable.id.in_(folder_ids)) == 0
+    assert count(dbsession, DiagramTable) == 2
+    assert count(dbsession, DiagramRenderTable) == 2
+    assert count(dbsession, DiagramSymbolTable) == 4
+    assert (
+        count(
+            dbsession, FolderCounterTable, FolderCounterTable.folder_id.in_(folder_ids)
+        )
+        == 0
+    )
+    assert folder_counters.get(dbsession, organization.id, None) == (1, 0)
+    assert folder_counters.get(dbsession, organization.id, other) == (0, 2)
+    assert folder_counters.reconcile(dbsession, organization.id) == 0
+
+
+def test_diagrams_of_deleted_folder_are_hidden(dbsession, organization, tree):
+    parent, child, grandchild, other = tree
+    diagram_repo = DiagramRepository(dbsession, None, str(organization.id))
+    hidden = diagram_repo.list(folder_id=grandchild)[0].id
+    diagram_repo.edit(hidden, DiagramEdit(is_public=True))
+    FolderRepository(dbsession, str(organization.id)).delete(parent)
+
+    # until the purge deletes them
+    diagram_repo = DiagramRepository(dbsession, None, str(organization.id))
+    with pytest.raises(DiagramNotFoundError):
+        diagram_repo.get(hidden)
+    with pytest.raises(DiagramNotFoundError):
+        diagram_repo.edit(hidden, DiagramEdit(title="Changed"))
+    with pytest.raises(DiagramNotFoundError):
+        DiagramRepository(dbsession, None, None).get_image_render(hidden)
+    assert diagram_repo.list(folder_id=grandchild) == ()
+    assert diagram_repo.count(recursive=True) == 2
+    assert len(diagram_repo.list(recursive=True)) == 2
+    assert len(diagram_repo.search("A")) == 2
+    assert len(diagram_repo.list_referencing("A")) == 2
+    assert len(diagram_repo.list_by_kind("uml")) == 2
+
+
+def test_diagrams_of_deleted_organization_are_hidden(
+    dbsession, user, organization, tree
+):
+    parent, *_ = tree
+    diagram_repo = DiagramRepository(dbsession, None, str(organization.id))
+    public = diagram_repo.list(folder_id=parent)[0].id
+    diagram_repo.edit(public, DiagramEdit(is_public=True))
+    assert DiagramRepository(dbsession, None, None).get_image_render(public)
+    OrganizationRepo(user.id, dbsession).delete(OrganizationID(organization.id))
+
+    with pytest.raises(DiagramNotFoundError):
+        DiagramRepository(dbsession, None, None).get_image_render(public)
+    assert diagram_repo.search("A") == ()
+
+
+def test_delete_organization(dbsession, user, organization, user_factory, tree):
+    repo = OrganizationRepo(user.id, dbsession)
+    repo.add_user(OrganizationID(organization.id), user_factory().email)
+    repo.delete(OrganizationID(organization.id))
+
+    # hidden at once
+    assert repo.list() == []
+    assert (
+        OrganizationRepo(user.id, dbsession).get_role(OrganizationID(organization.id))
+        is None
+    )
+
+    jobs = purge_all(dbsession, batch_size=5)
+    last = jobs[-1]
+    assert (last.diagrams, last.folders, last.members, last.finished) == (8, 4, 2, True)
+
+    assert dbsession.get(OrganizationTable, organization.id) is None
+    for table in (
+        DiagramTable,
+        FolderTable,
+        FolderCounterTable,
+        DiagramSymbolTable,
+    ):
+        assert count(dbsession, table, table.organization_id == organization.id) == 0
+    assert count(dbsession, DiagramRenderTable) == 0
+    assert (
+        count(
+            dbsession,
+            organization_user_association,
+            organization_user_association.c.organization_id == organization.id,
+        )
+        == 0
+    )
+
+
+def test_purge_resumes(dbsession, organization, tree):
+    parent, *_ = tree
+    FolderRepository(dbsession, str(organization.id)).delete(parent)
+
+    # a purge which crashed within its transaction leaves the job as it was
+    savepoint = dbsession.begin_nested()
+    deletions.purge(dbsession, batch_size=4)
+    savepoint.rollback()
+    job = dbsession.scalars(select(DeletionJobTable)).one()
+    assert (job.diagrams, job.finished_at) == (0, None)
+
+    assert purge_all(dbsession, batch_size=100)[-1].diagrams == 6
+
+
+def test_nothing_to_purge(dbsession):
+    assert deletions.purge(dbsession) is None
@@ -96,3 +96,16 @@ def test_update_image(dbsession, diagram):
     dbsession.flush()
     assert diagram.image == b"2"
     assert diagram.image_version == 222222222222222222
+
+
+def test_image_is_stored_in_renders_table(dbsession, diagram):
+    assert "image" not in models.DiagramTable.__table__.c
+    render = dbsession.get(models.DiagramRenderTable, (diagram.id, "png"))
+    assert render.image == b"1"
+    assert render.version == diagram.image_version
+
+    diagram.set_image(b"2", 222222222222222222)
+    dbsession.flush()
+    dbsession.refresh(render)
+    assert render.image == b"2"
+    assert render.version == 222222222222222222
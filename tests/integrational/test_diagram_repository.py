@@ -2,13 +2,38 @@ from uuid import uuid4
 
 import pytest
 from sqlalchemy import exc as sqlalchemy_exc
+from sqlalchemy import func
+from sqlalchemy import select
 
 from easy_diagrams.domain.diagram import Diagram
 from easy_diagrams.domain.diagram import DiagramEdit
 from easy_diagrams.domain.diagram import DiagramListItem
 from easy_diagrams.domain.diagram import DiagramRender
 from easy_diagrams.exceptions import DiagramNotFoundError
+from easy_diagrams.models.diagram import DiagramRenderTable
+from easy_diagrams.models.metrics import query_count
+from easy_diagrams.services import trash
 from easy_diagrams.services.diagram_repo import DiagramRepository
+from easy_diagrams.services.diagram_repo import apply_render
+from easy_diagrams.services.folder_repo import FolderRepository
+from easy_diagrams.services.render_worker import RenderWorker
+
+
+def render_pending(repository, diagram_id):
+    """Render the edited diagrams, as the render worker does."""
+    worker = RenderWorker(repository.dbsession, repository.diagram_renderer)
+    for job in worker.claim():
+        assert worker.apply(job, worker.render(job)) is True
+    # the worker runs separately from the request the repository belongs to
+    return DiagramRepository(
+        repository.dbsession, repository.diagram_renderer, repository.organization_id
+    ).get(diagram_id)
+
+
+def edit_and_render(repository, diagram_id, changes):
+    """Edit the diagram and render it."""
+    repository.edit(diagram_id, changes)
+    return render_pending(repository, diagram_id)
 
 
 def test_create_diagram(dbsession, organization):
@@ -52,43 +77,40 @@ def test_edit_diagram(dbsession, organization):
         title="test_title", is_public=True, code="test_code"  # , image=b"test_image"
     )
     diagram = repository.edit(diagram_id, changes)
+    # the code is rendered by the render worker, outside of the transaction
+    assert diagram.render is None
+    assert diagram.render_pending is True
+    diagram = render_pending(repository, diagram_id)
     assert diagram.title == "test_title"
     assert diagram.is_public is True
     assert diagram.code == "test_code"
-    assert diagram.render == DiagramRender(
-        image=b"test_image", version=diagram.code_version
-    )
+    assert diagram.render == DiagramRender(version=diagram.code_version)
 
     changes_2 = DiagramEdit(title="test_title_2")
     diagram = repository.edit(diagram_id, changes_2)
     assert diagram.title == "test_title_2"
     assert diagram.is_public is True
     assert diagram.code == "test_code"
-    assert diagram.render == DiagramRender(
-        image=b"test_image", version=diagram.code_version
-    )
+    assert diagram.render == DiagramRender(version=diagram.code_version)
 
     changes_3 = DiagramEdit(is_public=False)
     diagram = repository.edit(diagram_id, changes_3)
     assert diagram.title == "test_title_2"
     assert diagram.is_public is False
     assert diagram.code == "test_code"
-    assert diagram.render == DiagramRender(
-        image=b"test_image", version=diagram.code_version
-    )
+    assert diagram.render == DiagramRender(version=diagram.code_version)
 
     changes_4 = DiagramEdit(code="test_code_2")
-    diagram = repository.edit(diagram_id, changes_4)
+    diagram = edit_and_render(repository, diagram_id, changes_4)
+    assert repository.get_image_render(diagram_id) == b"test_image"
     assert diagram.title == "test_title_2"
     assert diagram.is_public is False
     assert diagram.code == "test_code_2"
-    assert diagram.render == DiagramRender(
-        image=b"test_image", version=diagram.code_version
-    )
+    assert diagram.render == DiagramRender(version=diagram.code_version)
 
 
 class FakeDiagramRenderer:
-    def render(self, diagram):
+    def render(self, diagram, file_format="png"):
         return b"test_image"
 
 
@@ -218,3 +240,258 @@ def test_list_diagrams(dbsession, organization, organization_factory):
     # listing diagrams with pagination
     diagrams = repository.list(offset=9, limit=3)
     assert len(diagrams) == 1
+
+
+def test_list_diagrams_by_keyset(dbsession, organization):
+    repository = DiagramRepository(
+        dbsession=dbsession,
+        diagram_renderer=FakeDiagramRenderer(),
+        organization_id=str(organization.id),
+    )
+    for _ in range(7):
+        repository.create()
+    everything = repository.list()
+
+    first = repository.list(limit=3)
+    second = repository.list(limit=3, after=first[-1].key)
+    third = repository.list(limit=3, after=second[-1].key)
+    assert first + second + third == everything
+
+    assert repository.list(limit=3, before=third[0].key) == second
+    assert repository.list(limit=3, before=second[0].key) == first
+    assert repository.list(limit=3, before=first[0].key) == ()
+
+
+def test_list_diagrams_recursive(dbsession, organization):
+    repository = DiagramRepository(
+        dbsession=dbsession,
+        diagram_renderer=FakeDiagramRenderer(),
+        organization_id=str(organization.id),
+    )
+    folder_repo = FolderRepository(dbsession, str(organization.id))
+    parent = folder_repo.create("parent")
+    child = folder_repo.create("child", parent_id=parent)
+    other = folder_repo.create("other")
+    in_parent = repository.create(folder_id=parent)
+    in_child = repository.create(folder_id=child)
+    repository.create(folder_id=other)
+    repository.create()
+
+    diagrams = repository.list(folder_id=parent, recursive=True)
+    assert {diagram.id for diagram in diagrams} == {in_parent, in_child}
+    assert repository.count(folder_id=parent, recursive=True) == 2
+    assert repository.count(folder_id=child, recursive=True) == 1
+    assert repository.count(recursive=True) == 4
+
+
+def test_search_diagrams(dbsession, organization, organization_factory):
+    repository = DiagramRepository(
+        dbsession=dbsession,
+        diagram_renderer=FakeDiagramRenderer(),
+        organization_id=str(organization.id),
+    )
+    other = DiagramRepository(
+        dbsession=dbsession,
+        diagram_renderer=FakeDiagramRenderer(),
+        organization_id=str(organization_factory().id),
+    )
+    in_title = repository.create()
+    repository.edit(in_title, DiagramEdit(title="Checkout flow"))
+    in_code = repository.create()
+    repository.edit(in_code, DiagramEdit(code="@startuml\ncheckout -> bank\n@enduml"))
+    substring = repository.create()
+    repository.edit(substring, DiagramEdit(code="OrderCheckoutService -> db"))
+    repository.create()
+    other.edit(other.create(), DiagramEdit(title="Checkout"))
+
+    results = repository.search("checkout")
+    # title words rank above code words and substrings rank last
+    assert [diagram.id for diagram in results] == [in_title, in_code, substring]
+    assert repository.search("checkout", limit=1, after=results[0].key) == results[1:2]
+    assert repository.search("checkout", after=results[-1].key) == ()
+
+    assert [diagram.id for diagram in repository.search("bank")] == [in_code]
+    assert repository.search("100%") == ()
+    assert repository.search("  ") == ()
+
+
+def test_list_diagrams_by_symbol_and_kind(
+    dbsession, organization, organization_factory
+):
+    repository = DiagramRepository(
+        dbsession=dbsession,
+        diagram_renderer=FakeDiagramRenderer(),
+        organization_id=str(organization.id),
+    )
+    other = DiagramRepository(
+        dbsession=dbsession,
+        diagram_renderer=FakeDiagramRenderer(),
+        organization_id=str(organization_factory().id),
+    )
+    sequence = repository.create()
+    repository.edit(
+        sequence,
+        DiagramEdit(
+            code='@startuml\nparticipant "Order Service" as OS\nOS -> Bank\n@enduml'
+        ),
+    )
+    classes = repository.create()
+    repository.edit(classes, DiagramEdit(code="@startuml\nclass Bank\n@enduml"))
+    mindmap = repository.create()
+    repository.edit(mindmap, DiagramEdit(code="@startmindmap\n* Bank\n@endmindmap"))
+    other.edit(other.create(), DiagramEdit(code="@startuml\nclass Bank\n@enduml"))
+
+    referencing = repository.list_referencing("bank")
+    assert [diagram.id for diagram in referencing] == [classes, sequence]
+    assert repository.list_referencing("bank", after=referencing[0].key) == (
+        referencing[1],
+    )
+    assert [d.id for d in repository.list_referencing("order service")] == [sequence]
+    assert [d.id for d in repository.list_referencing("OS")] == [sequence]
+    assert [d.id for d in repository.list_by_kind("uml")] == [classes, sequence]
+    assert [d.id for d in repository.list_by_kind("mindmap")] == [mindmap]
+
+    # the symbols follow the code
+    repository.edit(sequence, DiagramEdit(code="@startgantt\n[Task]\n@endgantt"))
+    assert [d.id for d in repository.list_referencing("bank")] == [classes]
+    assert [d.id for d in repository.list_by_kind("gantt")] == [sequence]
+
+    repository.delete(classes)
+    assert repository.list_referencing("bank") == ()
+
+
+def test_edit_diagram_with_unchanged_code_is_not_rendered(dbsession, organization):
+    repository = DiagramRepository(
+        dbsession=dbsession,
+        diagram_renderer=FakeDiagramRenderer(),
+        organization_id=str(organization.id),
+    )
+    diagram_id = repository.create()
+    diagram = edit_and_render(repository, diagram_id, DiagramEdit(code="test_code"))
+
+    same = repository.edit(diagram_id, DiagramEdit(code="test_code"))
+    assert same.code_version == diagram.code_version
+    assert same.render == diagram.render
+    assert same.render_pending is False
+
+    changed = repository.edit(diagram_id, DiagramEdit(code="test_code_2"))
+    assert changed.render_pending is True
+
+
+def test_stale_render_is_discarded(dbsession, organization):
+    repository = DiagramRepository(
+        dbsession=dbsession,
+        diagram_renderer=FakeDiagramRenderer(),
+        organization_id=str(organization.id),
+    )
+    diagram_id = repository.create()
+    diagram = repository.edit(diagram_id, DiagramEdit(code="test_code"))
+    images = {"png": b"test_image"}
+    # the code was changed while rendering
+    repository.edit(diagram_id, DiagramEdit(code="test_code_2"))
+
+    assert apply_render(dbsession, diagram.id, diagram.code_version, images) is False
+    diagram = repository.get(diagram_id)
+    assert diagram.render is None
+    assert diagram.render_pending is True
+
+
+def test_every_format_is_rendered(dbsession, organization):
+    renderer = FormatDiagramRenderer()
+    repository = DiagramRepository(
+        dbsession=dbsession,
+        diagram_renderer=renderer,
+        organization_id=str(organization.id),
+    )
+    diagram_id = repository.create()
+    edit_and_render(repository, diagram_id, DiagramEdit(code="test_code"))
+    assert renderer.calls == [("test_code", "png"), ("test_code", "svg")]
+    assert repository.get_image_render(diagram_id, "svg") == b"svg of test_code"
+    assert repository.get_image_render(diagram_id) == b"png of test_code"
+
+    diagram = edit_and_render(repository, diagram_id, DiagramEdit(code="test_code_2"))
+    assert repository.get_image_render(diagram_id, "svg") == b"svg of test_code_2"
+    assert repository.get_image_info(diagram_id, "svg").version == diagram.code_version
+    # renders of outdated versions are replaced
+    assert dbsession.execute(
+        select(DiagramRenderTable.format, DiagramRenderTable.version).order_by(
+            DiagramRenderTable.format
+        )
+    ).all() == [("png", diagram.code_version), ("svg", diagram.code_version)]
+
+    # renders are kept in the trash and deleted with the diagram by the purge
+    repository.delete(diagram_id)
+    assert dbsession.scalar(select(func.count()).select_from(DiagramRenderTable)) == 2
+    assert trash.purge(dbsession, retention_days=0) == 1
+    assert dbsession.scalar(select(func.count()).select_from(DiagramRenderTable)) == 0
+
+
+def test_svg_of_diagram_without_code(dbsession, organization):
+    repository = DiagramRepository(
+        dbsession=dbsession,
+        diagram_renderer=FormatDiagramRenderer(),
+        organization_id=str(organization.id),
+    )
+    diagram_id = repository.create()
+    with pytest.raises(DiagramNotFoundError):
+        repository.get_image_info(diagram_id, "svg")
+    with pytest.raises(DiagramNotFoundError):
+        repository.get_image_render(diagram_id, "svg")
+
+
+class FormatDiagramRenderer:
+    def __init__(self):
+        self.calls = []
+
+    def render(self, diagram, file_format="png"):
+        self.calls.append((diagram.code, file_format))
+        return f"{file_format} of {diagram.code}".encode()
+
+
+def test_image_is_loaded_only_on_request(dbsession, organization):
+    repository = DiagramRepository(
+        dbsession=dbsession,
+        diagram_renderer=FakeDiagramRenderer(),
+        organization_id=str(organization.id),
+    )
+    diagram_id = repository.create()
+    edit_and_render(repository, diagram_id, DiagramEdit(code="test_code"))
+    # a new request
+    repository = DiagramRepository(
+        dbsession=dbsession,
+        diagram_renderer=FakeDiagramRenderer(),
+        organization_id=str(organization.id),
+    )
+
+    diagram = repository.get(diagram_id)
+    assert diagram.code == "test_code"
+    assert diagram.render == DiagramRender(version=diagram.code_version)
+    assert diagram.render_pending is False
+
+    diagram = repository.get(diagram_id, with_image=True)
+    assert diagram.render == DiagramRender(
+        image=b"test_image", version=diagram.code_version
+    )
+
+
+def test_diagrams_are_cached_during_request(dbsession, organization):
+    repository = DiagramRepository(
+        dbsession=dbsession,
+        diagram_renderer=FakeDiagramRenderer(),
+        organization_id=str(organization.id),
+    )
+    diagram_id = repository.create()
+    dbsession.flush()
+
+    queries = query_count(dbsession)
+    diagram = repository.get(diagram_id)
+    assert repository.get(diagram_id) is diagram
+    assert query_count(dbsession) == queries + 1
+
+    diagram = repository.edit(diagram_id, DiagramEdit(title="new title"))
+    assert diagram.title == "new title"
+    assert repository.get(diagram_id) is diagram
+
+    repository.delete(diagram_id)
+    with pytest.raises(DiagramNotFoundError):
+        repository.get(diagram_id)
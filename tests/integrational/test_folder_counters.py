@@ -0,0 +1,62 @@
+from sqlalchemy import update
+
+from easy_diagrams.domain.folder import FolderEdit
+from easy_diagrams.models.diagram import DiagramTable
+from easy_diagrams.services import deletions
+from easy_diagrams.services import folder_counters
+from easy_diagrams.services.diagram_repo import DiagramRepository
+from easy_diagrams.services.folder_repo import FolderRepository
+
+
+def counts(dbsession, organization, folder_id=None):
+    return folder_counters.get(dbsession, organization.id, folder_id)
+
+
+def test_counters_follow_changes(dbsession, organization):
+    folder_repo = FolderRepository(dbsession, str(organization.id))
+    diagram_repo = DiagramRepository(dbsession, None, str(organization.id))
+    first = folder_repo.create("first")
+    second = folder_repo.create("second")
+    child = folder_repo.create("child", parent_id=first)
+    diagram_repo.create()
+    diagram_id = diagram_repo.create(folder_id=first)
+    diagram_repo.create(folder_id=child)
+
+    assert counts(dbsession, organization) == (2, 1)
+    assert counts(dbsession, organization, first) == (1, 1)
+    assert folder_repo.count() == 2
+    assert diagram_repo.count(folder_id=first) == 1
+
+    diagram_repo.delete(diagram_id)
+    assert counts(dbsession, organization, first) == (1, 0)
+
+    folder_repo.edit(child, FolderEdit(parent_id=second))
+    assert counts(dbsession, organization, first) == (0, 0)
+    assert counts(dbsession, organization, second) == (1, 0)
+
+    # a deleted folder is uncounted at once, its content once purged
+    folder_repo.delete(second)
+    assert counts(dbsession, organization) == (1, 1)
+    assert folder_counters.reconcile(dbsession, organization.id) == 0
+    while not deletions.purge(dbsession).finished:
+        pass
+    assert counts(dbsession, organization, second) == (0, 0)
+    assert counts(dbsession, organization, child) == (0, 0)
+    assert folder_counters.reconcile(dbsession, organization.id) == 0
+
+
+def test_reconcile(dbsession, organization, organization_factory):
+    diagram_repo = DiagramRepository(dbsession, None, str(organization.id))
+    other_repo = DiagramRepository(dbsession, None, str(organization_factory().id))
+    folder_id = FolderRepository(dbsession, str(organization.id)).create("folder")
+    diagram_id = diagram_repo.create()
+    other_repo.create()
+    # moving the diagram behind the repository's back
+    dbsession.execute(
+        update(DiagramTable).filter_by(id=diagram_id).values(folder_id=folder_id)
+    )
+
+    assert folder_counters.reconcile(dbsession, organization.id) == 2
+    assert counts(dbsession, organization) == (1, 0)
+    assert counts(dbsession, organization, folder_id) == (0, 1)
+    assert folder_counters.reconcile(dbsession, organization.id) == 0
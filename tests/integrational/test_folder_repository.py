@@ -2,6 +2,7 @@ import pytest
 
 from easy_diagrams.domain.folder import FolderEdit
 from easy_diagrams.exceptions import DiagramNotFoundError
+from easy_diagrams.exceptions import FolderCycleError
 from easy_diagrams.services.folder_repo import FolderRepository
 
 
@@ -37,6 +38,20 @@ class TestFolderRepository:
         assert "Folder 1" in folder_names
         assert "Folder 2" in folder_names
 
+    def test_list_folders_by_keyset(self, dbsession, organization):
+        repo = FolderRepository(dbsession, str(organization.id))
+        for name in ("b", "a", "c", "b", "d"):
+            repo.create(name)
+
+        first = repo.list(limit=2)
+        second = repo.list(limit=2, after=first[-1].key)
+        third = repo.list(limit=2, after=second[-1].key)
+        assert [f.name for f in first + second + third] == ["a", "b", "b", "c", "d"]
+        assert first[1].id != second[0].id
+
+        assert repo.list(limit=2, before=third[0].key) == second
+        assert repo.list(limit=2, before=second[0].key) == first
+
     def test_list_nested_folders(self, dbsession, organization):
         repo = FolderRepository(dbsession, str(organization.id))
         parent_id = repo.create("Parent")
@@ -73,6 +88,64 @@ class TestFolderRepository:
         with pytest.raises(DiagramNotFoundError):
             repo.get(folder_id)
 
+    def test_ancestors(self, dbsession, organization):
+        repo = FolderRepository(dbsession, str(organization.id))
+        root = repo.create("root")
+        child = repo.create("child", parent_id=root)
+        grandchild = repo.create("grandchild", parent_id=child)
+
+        assert [f.name for f in repo.ancestors(grandchild)] == [
+            "root",
+            "child",
+            "grandchild",
+        ]
+        assert [f.name for f in repo.ancestors(root)] == ["root"]
+        with pytest.raises(DiagramNotFoundError):
+            repo.ancestors("nonexistent")
+
+    def test_move_subtree(self, dbsession, organization):
+        repo = FolderRepository(dbsession, str(organization.id))
+        first = repo.create("first")
+        second = repo.create("second")
+        child = repo.create("child", parent_id=first)
+        grandchild = repo.create("grandchild", parent_id=child)
+
+        repo.edit(child, FolderEdit(parent_id=second))
+
+        assert [f.name for f in repo.ancestors(grandchild)] == [
+            "second",
+            "child",
+            "grandchild",
+        ]
+
+    def test_move_into_own_subtree(self, dbsession, organization):
+        repo = FolderRepository(dbsession, str(organization.id))
+        parent = repo.create("parent")
+        child = repo.create("child", parent_id=parent)
+
+        with pytest.raises(FolderCycleError):
+            repo.edit(parent, FolderEdit(parent_id=child))
+        with pytest.raises(FolderCycleError):
+            repo.edit(parent, FolderEdit(parent_id=parent))
+
+    def test_delete_folder_deletes_subtree(self, dbsession, organization):
+        repo = FolderRepository(dbsession, str(organization.id))
+        parent = repo.create("parent")
+        child = repo.create("child", parent_id=parent)
+        grandchild = repo.create("grandchild", parent_id=child)
+        sibling = repo.create("sibling")
+
+        repo.delete(parent)
+
+        assert [f.name for f in repo.list()] == ["sibling"]
+        assert repo.count() == 1
+        for folder_id in (parent, child, grandchild):
+            with pytest.raises(DiagramNotFoundError):
+                repo.get(folder_id)
+        with pytest.raises(DiagramNotFoundError):
+            repo.create("new", parent_id=child)
+        assert repo.get(sibling).name == "sibling"
+
     def test_get_nonexistent_folder(self, dbsession, organization):
         repo = FolderRepository(dbsession, str(organization.id))
 
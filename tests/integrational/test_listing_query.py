@@ -0,0 +1,90 @@
+import pytest
+
+from easy_diagrams.domain.diagram import DiagramEdit
+from easy_diagrams.exceptions import DiagramNotFoundError
+from easy_diagrams.models.metrics import query_count
+from easy_diagrams.services.diagram_repo import DiagramRepository
+from easy_diagrams.services.folder_repo import FolderRepository
+from easy_diagrams.services.listing_query import ListingQuery
+
+
+@pytest.fixture(name="listing")
+def listing_fixture(dbsession, organization):
+    folder_repo = FolderRepository(dbsession, str(organization.id))
+    parent_id = folder_repo.create("Parent")
+    for name in ("c", "a", "b"):
+        folder_repo.create(name, parent_id=parent_id)
+    diagram_repo = DiagramRepository(dbsession, None, str(organization.id))
+    for i in range(4):
+        diagram_id = diagram_repo.create(folder_id=parent_id)
+        diagram_repo.edit(diagram_id, DiagramEdit(title=f"d{i}"))
+    return ListingQuery(dbsession, str(organization.id)), parent_id
+
+
+def names(page):
+    return [f.name for f in page.folders] + [d.title for d in page.diagrams]
+
+
+def test_page(dbsession, listing):
+    query, parent_id = listing
+    queries = query_count(dbsession)
+    page = query.page(folder_id=parent_id, limit=5)
+    assert query_count(dbsession) == queries + 1
+
+    assert names(page) == ["a", "b", "c", "d3", "d2"]
+    assert page.total == 7
+    assert page.current_folder.id == parent_id
+    assert page.current_folder.name == "Parent"
+    assert page.ancestors == ()
+
+
+def test_page_ancestors(dbsession, organization, listing):
+    query, parent_id = listing
+    folder_repo = FolderRepository(dbsession, str(organization.id))
+    child_id = folder_repo.create("child", parent_id=parent_id)
+    grandchild_id = folder_repo.create("grandchild", parent_id=child_id)
+
+    page = query.page(folder_id=grandchild_id)
+    assert [f.name for f in page.ancestors] == ["Parent", "child"]
+    assert page.current_folder.name == "grandchild"
+
+
+def test_page_by_keyset(listing):
+    query, parent_id = listing
+    first = query.page(folder_id=parent_id, limit=2)
+    second = query.page(folder_id=parent_id, limit=2, after=first.last)
+    third = query.page(folder_id=parent_id, limit=2, after=second.last)
+    fourth = query.page(folder_id=parent_id, limit=2, after=third.last)
+    assert [names(p) for p in (first, second, third, fourth)] == [
+        ["a", "b"],
+        ["c", "d3"],
+        ["d2", "d1"],
+        ["d0"],
+    ]
+    assert fourth.total == 7
+
+    assert query.page(folder_id=parent_id, limit=2, before=fourth.first) == third
+    assert query.page(folder_id=parent_id, limit=2, before=third.first) == second
+    assert query.page(folder_id=parent_id, limit=2, before=second.first) == first
+
+
+def test_empty_page(listing):
+    query, parent_id = listing
+    page = query.page(limit=5, after=("folder", ("Parent", parent_id)))
+    assert page.folders == page.diagrams == ()
+    # the total covers the folder even past its last page
+    assert page.total == 1
+    assert page.current_folder is None
+
+
+def test_page_of_unknown_folder(listing):
+    query, _ = listing
+    with pytest.raises(DiagramNotFoundError):
+        query.page(folder_id="unknown")
+
+
+def test_page_of_other_organization_folder(dbsession, listing, organization_factory):
+    _, parent_id = listing
+    query = ListingQuery(dbsession, str(organization_factory().id))
+    with pytest.raises(DiagramNotFoundError):
+        query.page(folder_id=parent_id)
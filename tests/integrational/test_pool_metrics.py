@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import exc as sqlalchemy_exc
+
+from easy_diagrams.models import get_engine
+
+
+@pytest.fixture(name="engine_factory")
+def engine_factory_fixture(app_settings):
+    engines = []
+
+    def create_engine(**settings):
+        engine = get_engine(
+            {
+                "sqlalchemy.url": app_settings["sqlalchemy.url"],
+                **{f"sqlalchemy.{key}": value for key, value in settings.items()},
+            }
+        )
+        engines.append(engine)
+        return engine
+
+    yield create_engine
+
+    for engine in engines:
+        engine.dispose()
+
+
+def test_pool_settings(engine_factory):
+    engine = engine_factory(
+        pool_size="3", max_overflow="1", pool_recycle="60", pool_pre_ping="false"
+    )
+    assert engine.pool.size() == 3
+    assert engine.pool.capacity == 4
+    assert engine.pool._recycle == 60
+    assert engine.pool._pre_ping is False
+
+
+def test_prepare_threshold(engine_factory):
+    with engine_factory(prepare_threshold="2").connect() as connection:
+        assert connection.connection.dbapi_connection.prepare_threshold == 2
+    # PgBouncer in transaction pooling mode doesn't support prepared statements
+    engine = engine_factory(prepare_threshold="2", pgbouncer="true")
+    with engine.connect() as connection:
+        assert connection.connection.dbapi_connection.prepare_threshold is None
+
+
+def test_pool_metrics(engine_factory):
+    engine = engine_factory(pool_size="1", max_overflow="0", pool_timeout="5")
+    metrics = engine.pool.metrics
+
+    first = engine.connect()
+    waited = threading.Event()
+
+    def checkout():
+        with engine.connect():
+            waited.set()
+
+    thread = threading.Thread(target=checkout)
+    thread.start()
+    time.sleep(0.2)
+    assert not waited.is_set()
+    first.close()
+    thread.join(5)
+
+    stats = metrics.stats
+    assert stats["connects"] == 1
+    assert stats["checkouts"] == 2
+    assert stats["checked_out"] == 0
+    assert stats["max_checked_out"] == 1
+    assert stats["saturated"] == 1
+    assert stats["max_wait_seconds"] >= 0.2
+    assert stats["timeouts"] == 0
+
+
+def test_pool_timeout_is_counted(engine_factory):
+    engine = engine_factory(pool_size="1", max_overflow="0", pool_timeout="0.1")
+    with engine.connect():
+        with pytest.raises(sqlalchemy_exc.TimeoutError):
+            engine.connect()
+    assert engine.pool.metrics.stats["timeouts"] == 1
+    assert engine.pool.metrics.stats["saturated"] == 1
+
+
+def test_pool_metrics_survive_dispose(engine_factory):
+    engine = engine_factory()
+    metrics = engine.pool.metrics
+    with engine.connect():
+        pass
+    engine.dispose()
+    with engine.connect():
+        pass
+    assert engine.pool.metrics is metrics
+    assert metrics.stats["checkouts"] == 2
+    assert metrics.stats["connects"] == 2
@@ -0,0 +1,87 @@
+from datetime import timedelta
+
+from easy_diagrams.domain.diagram import DiagramEdit
+from easy_diagrams.domain.diagram import DiagramRender
+from easy_diagrams.domain.diagram import PendingRender
+from easy_diagrams.services.diagram_repo import DiagramRepository
+from easy_diagrams.services.render_worker import RenderWorker
+
+
+class FakeDiagramRenderer:
+    def render(self, diagram, file_format="png"):
+        return f"image of {diagram.code}".encode()
+
+
+def test_async_edit_leaves_render_to_worker(dbsession, organization):
+    renderer = FakeDiagramRenderer()
+    repository = DiagramRepository(
+        dbsession=dbsession,
+        diagram_renderer=renderer,
+        organization_id=str(organization.id),
+    )
+    worker = RenderWorker(dbsession, renderer)
+    diagram_id = repository.create()
+    assert worker.claim() == []
+
+    diagram = repository.edit(diagram_id, DiagramEdit(code="A -> B"))
+    assert diagram.render is None
+    assert diagram.render_pending is True
+    dbsession.flush()
+
+    jobs = worker.claim()
+    assert jobs == [
+        PendingRender(id=diagram_id, code="A -> B", code_version=diagram.code_version)
+    ]
+    assert worker.apply(jobs[0], worker.render(jobs[0])) is True
+
+    # the worker runs separately from the request the repository belongs to
+    repository = DiagramRepository(dbsession, renderer, str(organization.id))
+    diagram = repository.get(diagram_id, with_image=True)
+    assert diagram.render == DiagramRender(
+        image=b"image of A -> B", version=diagram.code_version
+    )
+    assert diagram.render_pending is False
+    assert worker.claim() == []
+
+
+def test_stale_render_is_discarded(dbsession, organization):
+    renderer = FakeDiagramRenderer()
+    repository = DiagramRepository(
+        dbsession=dbsession,
+        diagram_renderer=renderer,
+        organization_id=str(organization.id),
+    )
+    worker = RenderWorker(dbsession, renderer)
+    diagram_id = repository.create()
+    diagram = repository.edit(diagram_id, DiagramEdit(code="A -> B"))
+    dbsession.flush()
+
+    # the code was changed while the worker was rendering an older version
+    stale = PendingRender(
+        id=diagram_id, code="A -> C", code_version=diagram.code_version - 1
+    )
+    assert worker.apply(stale, {"png": b"stale image"}) is False
+
+    diagram = repository.get(diagram_id, with_image=True)
+    assert diagram.render is None
+    assert diagram.render_pending is True
+
+
+def test_claimed_diagram_is_skipped(dbsession, organization):
+    renderer = FakeDiagramRenderer()
+    repository = DiagramRepository(dbsession, renderer, str(organization.id))
+    diagram_id = repository.create()
+    repository.edit(diagram_id, DiagramEdit(code="A -> B"))
+    dbsession.flush()
+
+    (job,) = RenderWorker(dbsession, renderer).claim()
+    # other workers render other diagrams until the claim expires
+    assert RenderWorker(dbsession, renderer).claim() == []
+    assert RenderWorker(dbsession, renderer, lease=timedelta(0)).claim() == [job]
+
+    # new code is rendered without waiting for the claim of the old one
+    diagram = repository.edit(diagram_id, DiagramEdit(code="A -> C"))
+    dbsession.flush()
+    assert RenderWorker(dbsession, renderer).claim() == [
+        PendingRender(id=diagram_id, code="A -> C", code_version=diagram.code_version)
+    ]
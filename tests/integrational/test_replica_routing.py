@@ -0,0 +1,103 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select
+
+from easy_diagrams import models
+from easy_diagrams.models import get_engine
+from easy_diagrams.models import get_session_factory
+from easy_diagrams.models.routing import PRIMARY_UNTIL_KEY
+from easy_diagrams.models.routing import is_read_only
+
+
+@pytest.fixture(name="engines")
+def engines_fixture(app_settings, dbengine):
+    # a second engine of the same database stands in for the replica
+    primary = get_engine(app_settings)
+    replica = get_engine(app_settings)
+    yield primary, replica
+    primary.dispose()
+    replica.dispose()
+
+
+def make_request(route="diagrams", method="GET", session=None):
+    return SimpleNamespace(
+        method=method,
+        matched_route=SimpleNamespace(name=route) if route else None,
+        session={} if session is None else session,
+    )
+
+
+def checkouts(engine):
+    return engine.pool.metrics.stats["checkouts"]
+
+
+def test_read_only_session_reads_from_replica(engines):
+    primary, replica = engines
+    factory = get_session_factory(primary, [replica])
+    with factory(info={"read_only": True}) as session:
+        session.execute(select(models.User)).all()
+        session.execute(select(models.User)).all()
+    assert checkouts(replica) == 1
+    assert checkouts(primary) == 0
+
+
+def test_session_sticks_to_primary_after_write(engines):
+    primary, replica = engines
+    factory = get_session_factory(primary, [replica], stickiness=5)
+    request = make_request("diagram_entity", "PUT")
+    with factory(info={"read_only": True, "request": request}) as session:
+        session.execute(select(models.User)).all()
+        session.add(models.User(email="replica@example.com"))
+        session.flush()
+        # reads its own write
+        assert session.scalars(
+            select(models.User).filter_by(email="replica@example.com")
+        ).one()
+        session.rollback()
+    assert checkouts(replica) == 1
+    assert checkouts(primary) == 1
+    # the following requests of the user read from the primary for a while
+    assert request.session[PRIMARY_UNTIL_KEY] > time.time()
+    assert is_read_only(make_request(session=request.session)) is False
+
+
+@pytest.mark.parametrize(
+    "replicas, method", [(False, "PUT"), (True, "GET")], ids=["primary", "get"]
+)
+def test_write_does_not_stick(engines, replicas, method):
+    primary, replica = engines
+    factory = get_session_factory(primary, [replica] if replicas else [], 5)
+    request = make_request("diagram_view_image_png", method)
+    with factory(info={"request": request}) as session:
+        session.add(models.User(email="replica@example.com"))
+        session.flush()
+        session.rollback()
+    # without replicas, or for a request which only reads, there is nothing
+    # to stick to and the response doesn't set the session cookie
+    assert request.session == {}
+
+
+def test_session_reads_from_primary(engines):
+    primary, replica = engines
+    factory = get_session_factory(primary, [replica])
+    with factory(info={"read_only": False}) as session:
+        session.execute(select(models.User)).all()
+    assert checkouts(replica) == 0
+    assert checkouts(primary) == 1
+
+
+def test_is_read_only():
+    assert is_read_only(make_request()) is True
+    assert is_read_only(make_request("diagram_view_image_png", "HEAD")) is True
+    assert is_read_only(make_request(method="POST")) is False
+    assert is_read_only(make_request("diagram_entity")) is False
+    assert is_read_only(make_request(route=None)) is False
+    assert is_read_only(None) is False
+    expired = {PRIMARY_UNTIL_KEY: time.time() - 1}
+    assert is_read_only(make_request(session=expired)) is True
+    # cacheable images don't read the web session
+    sticky = {PRIMARY_UNTIL_KEY: time.time() + 5}
+    assert is_read_only(make_request(session=sticky)) is False
+    assert is_read_only(make_request("diagram_view_image_svg", session=sticky)) is True
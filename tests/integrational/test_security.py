@@ -0,0 +1,94 @@
+import time
+
+import pytest
+from pyramid.interfaces import ISecurityPolicy
+from pyramid.testing import DummyRequest
+from sqlalchemy import inspect
+
+from easy_diagrams import main
+from easy_diagrams import models
+from easy_diagrams.domain.user import Identity
+from easy_diagrams.models.metrics import query_count
+from easy_diagrams.security import SecurityPolicy
+
+
+def ticket_request(policy, dbsession, userid):
+    headers = policy.remember(DummyRequest(), str(userid))
+    name, value = headers[0][1].split(";")[0].split("=", 1)
+    return DummyRequest(cookies={name: value.strip('"')}, dbsession=dbsession)
+
+
+@pytest.fixture(name="policy")
+def policy_fixture(app):
+    """The policy of the app, it invalidates identities of disabled users."""
+    policy = app.registry.getUtility(ISecurityPolicy)
+    yield policy
+    policy.identities.clear()
+
+
+def test_identity_is_cached(dbsession, user, policy):
+    queries = query_count(dbsession)
+    identity = policy.load_identity(ticket_request(policy, dbsession, user.id))
+    assert identity.id == user.id
+    assert identity.enabled is True
+    assert query_count(dbsession) == queries + 1
+
+    again = policy.load_identity(ticket_request(policy, dbsession, user.id))
+    assert again == identity
+    assert query_count(dbsession) == queries + 1
+
+
+def test_disabled_user_is_forgotten(dbsession, user, policy):
+    assert policy.load_identity(ticket_request(policy, dbsession, user.id))
+
+    user.enabled = False
+    dbsession.flush()
+    assert policy.load_identity(ticket_request(policy, dbsession, user.id)) is None
+
+
+def test_apps_share_invalidation_listener(app, app_settings, dbengine, user):
+    listeners = len(list(inspect(models.User).dispatch.after_update))
+    other = main({}, dbengine=dbengine, **app_settings)
+    assert len(list(inspect(models.User).dispatch.after_update)) == listeners
+
+    # the policy of every app of the process forgets the disabled user
+    policies = [
+        registry.getUtility(ISecurityPolicy)
+        for registry in (app.registry, other.registry)
+    ]
+    for policy in policies:
+        policy.identities.set(str(user.id), Identity(id=user.id))
+    dbsession = inspect(user).session
+    user.enabled = False
+    dbsession.flush()
+    assert [policy.identities.get(str(user.id)) for policy in policies] == [None, None]
+
+
+def test_unknown_user(dbsession, policy):
+    userid = "00000000-0000-0000-0000-000000000000"
+    assert policy.load_identity(ticket_request(policy, dbsession, userid)) is None
+
+
+def test_trusted_ticket(dbsession, user):
+    policy = SecurityPolicy("secret", ttl=60, trust_ticket=True)
+    queries = query_count(dbsession)
+    identity = policy.load_identity(ticket_request(policy, dbsession, user.id))
+    assert identity.id == user.id
+    assert query_count(dbsession) == queries
+
+    # users disabled by the process are rejected and their tickets forgotten
+    policy.identities.set(str(user.id), Identity(id=user.id, enabled=False))
+    request = ticket_request(policy, dbsession, user.id)
+    assert policy.load_identity(request) is None
+    assert request.response_callbacks
+
+
+def test_expired_trusted_ticket_is_verified(dbsession, user, monkeypatch):
+    policy = SecurityPolicy("secret", ttl=60, trust_ticket=True)
+    request = ticket_request(policy, dbsession, user.id)
+    issued_at = time.time()
+    monkeypatch.setattr(time, "time", lambda: issued_at + 120)
+
+    queries = query_count(dbsession)
+    assert policy.load_identity(request).id == user.id
+    assert query_count(dbsession) == queries + 1
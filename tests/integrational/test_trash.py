@@ -0,0 +1,169 @@
+from datetime import datetime
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy import update
+
+from easy_diagrams.domain.diagram import DiagramEdit
+from easy_diagrams.exceptions import DiagramNotFoundError
+from easy_diagrams.models.diagram import DiagramRenderTable
+from easy_diagrams.models.diagram import DiagramSymbolTable
+from easy_diagrams.models.diagram import DiagramTable
+from easy_diagrams.services import deletions
+from easy_diagrams.services import folder_counters
+from easy_diagrams.services import trash
+from easy_diagrams.services.diagram_repo import DiagramRepository
+from easy_diagrams.services.diagram_repo import store_render
+from easy_diagrams.services.folder_repo import FolderRepository
+from easy_diagrams.services.listing_query import ListingQuery
+from easy_diagrams.services.render_worker import RenderWorker
+
+
+def count(dbsession, table):
+    return dbsession.scalar(select(func.count()).select_from(table))
+
+
+def trashed_days_ago(dbsession, diagram_id, days):
+    dbsession.execute(
+        update(DiagramTable)
+        .filter_by(id=diagram_id)
+        .values(deleted_at=datetime.now() - timedelta(days=days))
+    )
+
+
+@pytest.fixture(name="repository")
+def repository_fixture(dbsession, organization):
+    return DiagramRepository(dbsession, None, str(organization.id))
+
+
+@pytest.fixture(name="folder_id")
+def folder_id_fixture(dbsession, organization):
+    return FolderRepository(dbsession, str(organization.id)).create("folder")
+
+
+@pytest.fixture(name="diagram_id")
+def diagram_id_fixture(dbsession, repository, folder_id):
+    diagram_id = repository.create(folder_id=folder_id)
+    repository.edit(
+        diagram_id, DiagramEdit(title="Payment", code="@startuml\nA -> B\n@enduml")
+    )
+    store_render(dbsession, diagram_id, "png", 1, b"image")
+    return diagram_id
+
+
+def test_trashed_diagram_is_hidden(
+    dbsession, organization, repository, folder_id, diagram_id
+):
+    updated_at = repository.get(diagram_id).updated_at
+    repository.delete(diagram_id)
+
+    with pytest.raises(DiagramNotFoundError):
+        repository.get(diagram_id)
+    with pytest.raises(DiagramNotFoundError):
+        repository.get_image_render(diagram_id)
+    with pytest.raises(DiagramNotFoundError):
+        repository.edit(diagram_id, DiagramEdit(title="Changed"))
+    with pytest.raises(DiagramNotFoundError):
+        repository.delete(diagram_id)
+    assert repository.list(folder_id=folder_id) == ()
+    assert repository.count(folder_id=folder_id) == 0
+    assert repository.count(recursive=True) == 0
+    assert repository.search("payment") == ()
+    assert repository.list_by_kind("uml") == ()
+    assert repository.list_referencing("A") == ()
+    assert ListingQuery(dbsession, str(organization.id)).page(folder_id).total == 0
+    assert RenderWorker(dbsession, None).claim() == []
+
+    # the images are kept until the purge
+    assert count(dbsession, DiagramRenderTable) == 1
+    (item,) = repository.list_deleted()
+    assert (item.id, item.title, item.folder_id) == (diagram_id, "Payment", folder_id)
+    assert item.updated_at == updated_at
+    assert folder_counters.reconcile(dbsession, organization.id) == 0
+
+
+def test_restore(dbsession, organization, repository, folder_id, diagram_id):
+    repository.delete(diagram_id)
+    repository.restore(diagram_id)
+
+    assert repository.get(diagram_id).folder_id == folder_id
+    assert repository.count(folder_id=folder_id) == 1
+    assert repository.list_deleted() == ()
+    assert folder_counters.reconcile(dbsession, organization.id) == 0
+    with pytest.raises(DiagramNotFoundError, match="not found in trash"):
+        repository.restore(diagram_id)
+
+
+def test_restore_from_deleted_folder(
+    dbsession, organization, repository, folder_id, diagram_id
+):
+    repository.delete(diagram_id)
+    FolderRepository(dbsession, str(organization.id)).delete(folder_id)
+    repository.restore(diagram_id)
+
+    assert repository.get(diagram_id).folder_id is None
+    assert repository.count() == 1
+    assert folder_counters.reconcile(dbsession, organization.id) == 0
+
+
+def test_restore_different_organization(
+    dbsession, organization_factory, repository, diagram_id
+):
+    repository.delete(diagram_id)
+    other = DiagramRepository(dbsession, None, str(organization_factory().id))
+    assert other.list_deleted() == ()
+    with pytest.raises(DiagramNotFoundError):
+        other.restore(diagram_id)
+
+
+def test_list_deleted_by_keyset(repository):
+    diagram_ids = [repository.create() for _ in range(5)]
+    for diagram_id in diagram_ids:
+        repository.delete(diagram_id)
+    everything = repository.list_deleted()
+    assert [item.id for item in everything] == diagram_ids[::-1]
+
+    first = repository.list_deleted(limit=3)
+    second = repository.list_deleted(limit=3, after=first[-1].key)
+    assert first + second == everything
+
+
+def test_purge_expired(dbsession, repository, diagram_id):
+    recent = repository.create()
+    repository.delete(diagram_id)
+    repository.delete(recent)
+    trashed_days_ago(dbsession, diagram_id, 31)
+
+    assert trash.purge(dbsession, retention_days=30) == 1
+    assert trash.purge(dbsession, retention_days=30) == 0
+    assert [item.id for item in repository.list_deleted()] == [recent]
+    assert count(dbsession, DiagramRenderTable) == 0
+    assert count(dbsession, DiagramSymbolTable) == 0
+
+
+def test_purge_in_batches(dbsession, repository):
+    for _ in range(5):
+        diagram_id = repository.create()
+        repository.delete(diagram_id)
+        trashed_days_ago(dbsession, diagram_id, 31)
+
+    assert trash.purge(dbsession, retention_days=30, batch_size=2) == 2
+    assert trash.purge(dbsession, retention_days=30, batch_size=2) == 2
+    assert trash.purge(dbsession, retention_days=30, batch_size=2) == 1
+    assert repository.list_deleted() == ()
+
+
+def test_deleted_folder_purges_trash(
+    dbsession, organization, repository, folder_id, diagram_id
+):
+    # the trashed diagram was uncounted already, the counters stay consistent
+    repository.create(folder_id=folder_id)
+    repository.delete(diagram_id)
+    FolderRepository(dbsession, str(organization.id)).delete(folder_id)
+    while not deletions.purge(dbsession).finished:
+        pass
+
+    assert count(dbsession, DiagramTable) == 0
+    assert folder_counters.reconcile(dbsession, organization.id) == 0
@@ -0,0 +1,244 @@
+import shutil
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+
+from easy_diagrams.exceptions import RenderSupersededError
+from easy_diagrams.services.diagram_renderer import PlantUMLPool
+from easy_diagrams.services.diagram_renderer import RenderSlots
+from easy_diagrams.services.diagram_renderer import pipe_source
+
+# Imitates `plantuml -pipe -pipedelimitor ...`: every diagram read from stdin
+# is answered with a fake image followed by the delimiter line.
+FAKE_PLANTUML = textwrap.dedent(
+    """
+    import os
+    import sys
+    import time
+
+    delimiter = sys.argv[sys.argv.index("-pipedelimitor") + 1]
+    source = []
+    for line in sys.stdin:
+        source.append(line)
+        if line.strip().startswith("@end"):
+            text = "".join(source)
+            source = []
+            if "@hang" in text:
+                continue
+            if "@crash" in text:
+                sys.exit(1)
+            if "@slow" in text:
+                time.sleep(0.5)
+            if "@error" in text:
+                # like PlantUML, an error image and the error on stderr, or on
+                # stdout with -pipeNoStderr
+                error = sys.stdout if "-pipeNoStderr" in sys.argv else sys.stderr
+                error.write("ERROR\\n2\\nSyntax Error?\\n")
+                error.flush()
+            image = f"IMG[{os.getpid()}]{text}".encode()
+            sys.stdout.buffer.write(image + delimiter.encode() + b"\\n")
+            sys.stdout.buffer.flush()
+    """
+)
+
+
+@pytest.fixture(name="pool_factory")
+def pool_factory_fixture(tmp_path):
+    script = tmp_path / "fake_plantuml.py"
+    script.write_text(FAKE_PLANTUML)
+    pools = []
+
+    def create_pool(**kwargs):
+        pool = PlantUMLPool([sys.executable, str(script)], env={}, **kwargs)
+        pools.append(pool)
+        return pool
+
+    yield create_pool
+
+    for pool in pools:
+        pool.close()
+
+
+def test_pipe_source_is_terminated():
+    assert pipe_source("@startuml\nA -> B\n") == "@startuml\nA -> B\n@enduml\n"
+    assert pipe_source("@startuml\nA -> B\n@enduml") == "@startuml\nA -> B\n@enduml\n"
+    assert (
+        pipe_source("@startuml\n@enduml\n@startuml\nC\n@enduml\n")
+        == "@startuml\n@enduml\n"
+    )
+
+
+def test_render(pool_factory):
+    pool = pool_factory(size=1)
+    image = pool.render("@startuml\nA -> B\n@enduml")
+    assert image.endswith(b"@startuml\nA -> B\n@enduml\n")
+
+
+def test_render_format(pool_factory):
+    pool = pool_factory(size=1)
+    png = pool.render("@startuml\nA -> B\n@enduml")
+    svg = pool.render("@startuml\nA -> B\n@enduml", "svg")
+    assert b"@@@format png\n@startuml" in png
+    assert b"@@@format svg\n@startuml" in svg
+
+
+def test_render_error_is_not_in_image(pool_factory):
+    pool = pool_factory(size=1)
+    image = pool.render("@startuml\n@error\n@enduml")
+    assert image.startswith(b"IMG[")
+    assert b"Syntax Error" not in image
+
+
+@pytest.mark.skipif(shutil.which("plantuml") is None, reason="needs PlantUML")
+def test_render_invalid_code_with_plantuml():
+    pool = PlantUMLPool(["plantuml"], size=1)
+    try:
+        png = pool.render("@startuml\nA -> \n@enduml")
+        svg = pool.render("@startuml\nA -> \n@enduml", "svg")
+        valid = pool.render("@startuml\nA -> B\n@enduml")
+    finally:
+        pool.close()
+    # the error images are complete images, without the error text around them
+    assert png.startswith(b"\x89PNG") and png.endswith(b"IEND\xaeB`\x82")
+    assert svg.rstrip().endswith(b"</svg>")
+    assert valid.startswith(b"\x89PNG") and valid.endswith(b"IEND\xaeB`\x82")
+
+
+def test_process_is_reused(pool_factory):
+    pool = pool_factory(size=1)
+    first = pool.render("@startuml\nA\n@enduml")
+    second = pool.render("@startuml\nB\n@enduml")
+    assert first.split(b"]")[0] == second.split(b"]")[0]
+    assert len(pool._processes) == 1
+
+
+def test_process_is_recycled_after_max_renders(pool_factory):
+    pool = pool_factory(size=1, max_renders=2)
+    images = [pool.render(f"@startuml\n{i}\n@enduml") for i in range(3)]
+    pids = [image.split(b"]")[0] for image in images]
+    assert pids[0] == pids[1]
+    assert pids[1] != pids[2]
+    assert len(pool._processes) == 1
+
+
+def test_process_is_recycled_over_memory_threshold(pool_factory):
+    pool = pool_factory(size=1, max_memory=1)
+    first = pool.render("@startuml\nA\n@enduml")
+    second = pool.render("@startuml\nB\n@enduml")
+    assert first.split(b"]")[0] != second.split(b"]")[0]
+
+
+def test_crashed_process_is_respawned(pool_factory):
+    pool = pool_factory(size=1)
+    assert pool.render("@startuml\n@crash\n@enduml") == b""
+    assert pool.render("@startuml\nA\n@enduml").endswith(b"A\n@enduml\n")
+    assert len(pool._processes) == 1
+
+
+def test_timeout(pool_factory):
+    pool = pool_factory(size=1, timeout=0.5)
+    assert pool.render("@startuml\n@hang\n@enduml") == b""
+    assert pool.render("@startuml\nA\n@enduml").endswith(b"A\n@enduml\n")
+    assert len(pool._processes) == 1
+
+
+def test_superseded_render_keeps_process(pool_factory):
+    pool = pool_factory(size=1)
+    slots = RenderSlots()
+    results = {}
+
+    def render(version, code):
+        try:
+            results[version] = slots.render(
+                "diagram", version, lambda slot: pool.render(code, slot=slot)
+            )
+        except RenderSupersededError as e:
+            results[version] = e
+
+    old = threading.Thread(target=render, args=(1, "@startuml\n@slow\n@enduml"))
+    old.start()
+    time.sleep(0.2)
+    process = pool._processes[0]
+    render(2, "@startuml\nA\n@enduml")
+    old.join(5)
+
+    # the in-flight render finished in the warm process, its result is dropped
+    assert isinstance(results[1], RenderSupersededError)
+    assert results[2].endswith(b"A\n@enduml\n")
+    assert pool._processes == [process]
+    assert process.renders == 2
+
+
+def test_queued_superseded_render_is_dropped(pool_factory):
+    pool = pool_factory(size=1)
+    slots = RenderSlots()
+    process = pool._acquire()
+    results = {}
+
+    def render():
+        try:
+            slots.render("diagram", 1, lambda slot: pool.render("A", slot=slot))
+        except RenderSupersededError as e:
+            results[1] = e
+
+    queued = threading.Thread(target=render)
+    queued.start()
+    time.sleep(0.2)
+    slots._slots["diagram"].cancel()
+    queued.join(5)
+    pool._release(process)
+
+    assert isinstance(results[1], RenderSupersededError)
+    assert process.renders == 0
+
+
+def test_renders_of_same_version_are_coalesced():
+    slots = RenderSlots()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def render(slot):
+        calls.append(slot.version)
+        started.set()
+        release.wait(5)
+        return b"image"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(slots.render("d", 1, render)))
+        for _ in range(3)
+    ]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == [b"image"] * 3
+
+
+def test_render_of_older_version_is_rejected():
+    slots = RenderSlots()
+    started = threading.Event()
+    release = threading.Event()
+
+    def render(slot):
+        started.set()
+        release.wait(5)
+        return b"image"
+
+    newer = threading.Thread(target=slots.render, args=("d", 2, render))
+    newer.start()
+    started.wait(5)
+    with pytest.raises(RenderSupersededError):
+        slots.render("d", 1, render)
+    release.set()
+    newer.join(5)
@@ -0,0 +1,79 @@
+from easy_diagrams.services.diagram_symbols import scan
+
+
+def test_scan_kind():
+    assert scan("@startuml\nA -> B\n@enduml").kind == "uml"
+    assert scan("@startmindmap\n* root\n@endmindmap").kind == "mindmap"
+    assert scan("A -> B").kind is None
+    assert scan(None).kind is None
+
+
+def test_scan_declarations():
+    symbols = scan(
+        "@startuml\n"
+        'participant "Order Service" as OS #99FF99\n'
+        "actor :User:\n"
+        "abstract class Shape<T> {\n"
+        "}\n"
+        "class com.acme.Order\n"
+        "component [Web App] as web\n"
+        "@enduml"
+    ).symbols
+    assert symbols == {
+        ("participant", "Order Service"),
+        ("alias", "OS"),
+        ("participant", "User"),
+        ("class", "Shape"),
+        ("class", "com.acme.Order"),
+        ("component", "Web App"),
+        ("alias", "web"),
+    }
+
+
+def test_scan_arrows():
+    symbols = scan(
+        "@startuml\n"
+        "participant Alice\n"
+        "Alice -> Bob : hello\n"
+        "Bob -[#red]->o Carol ++\n"
+        'Order "1" *-- "many" LineItem : contains\n'
+        "Shape <|-- Circle\n"
+        "[Web App] ..> [DB]\n"
+        "Dave -up-> Eve\n"
+        "@enduml"
+    ).symbols
+    assert symbols == {
+        ("participant", "Alice"),
+        *(
+            ("reference", name)
+            for name in (
+                "Bob",
+                "Carol",
+                "Order",
+                "LineItem",
+                "Shape",
+                "Circle",
+                "Web App",
+                "DB",
+                "Dave",
+                "Eve",
+            )
+        ),
+    }
+
+
+def test_scan_skips_comments_and_notes():
+    symbols = scan(
+        "@startuml\n"
+        "' A -> B\n"
+        "/' C -> D\n"
+        "E -> F '/\n"
+        "note left of G\n"
+        "  H -> I\n"
+        "end note\n"
+        "note right: J -> K\n"
+        "== L ==\n"
+        "... 5 minutes later ...\n"
+        "@enduml"
+    ).symbols
+    assert symbols == frozenset()
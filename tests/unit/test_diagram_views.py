@@ -0,0 +1,77 @@
+from unittest.mock import Mock
+
+import transaction
+
+from easy_diagrams.domain.diagram import Diagram
+from easy_diagrams.domain.diagram import RenderInfo
+from easy_diagrams.views.diagrams import DiagramEntity
+from easy_diagrams.views.diagrams import DiagramViews
+
+
+def make_diagram(**kwargs):
+    return Diagram(
+        **{
+            "id": "diagram123",
+            "organization_id": "00000000-0000-0000-0000-000000000001",
+            "title": None,
+            "is_public": False,
+            "code": "A -> B",
+            "code_version": 1,
+            "render_pending": True,
+            **kwargs,
+        }
+    )
+
+
+class TestDiagramUpdate:
+
+    def test_render_is_left_to_worker(self):
+        tm = transaction.TransactionManager(explicit=True)
+        first = tm.begin()
+        request = Mock()
+        request.params = {"code": "A -> B"}
+        request.matchdict = {"diagram_id": "diagram123"}
+        request.tm = tm
+        diagram_repo = Mock()
+        diagram_repo.edit = Mock(return_value=make_diagram())
+        request.find_service = Mock(return_value=diagram_repo)
+
+        result = DiagramEntity(request).diagram_update()
+
+        # the edit stays in the transaction of the request, the preview waits
+        # for the render worker
+        assert tm.get() is first
+        diagram_repo.render.assert_not_called()
+        assert result == {"diagram": make_diagram()}
+        tm.abort()
+
+
+class TestRenderedImage:
+
+    def test_image_is_only_read(self):
+        tm = transaction.TransactionManager(explicit=True)
+        first = tm.begin()
+        request = Mock()
+        request.params = {}
+        request.matchdict = {"diagram_id": "diagram123"}
+        request.registry.settings = {}
+        request.if_none_match = None
+        request.if_modified_since = None
+        request.tm = tm
+        diagram_repo = Mock()
+        diagram_repo.get_image_info = Mock(
+            return_value=RenderInfo(version=1, is_public=True, rendered_at=None)
+        )
+        diagram_repo.get_image_render = Mock(return_value=b"<svg/>")
+        request.find_service = Mock(return_value=diagram_repo)
+
+        response = DiagramViews(request).rendered_image_svg()
+
+        # anonymous requests never render, the transaction is left as it is
+        assert tm.get() is first
+        diagram_repo.get_image_render.assert_called_once_with("diagram123", "svg")
+        assert response.body == b"<svg/>"
+        # scripts of the SVG don't run when it is opened
+        assert response.headers["Content-Security-Policy"] == "sandbox"
+        assert response.headers["Content-Disposition"] == "inline; filename=image.svg"
+        tm.abort()
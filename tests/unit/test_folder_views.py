@@ -1,11 +1,14 @@
 from datetime import datetime
 from unittest.mock import Mock
+from uuid import uuid4
 
 import pytest
 from pyramid.httpexceptions import HTTPBadRequest
 from pyramid.httpexceptions import HTTPSeeOther
 
+from easy_diagrams.domain.folder import Folder
 from easy_diagrams.domain.folder import FolderListItem
+from easy_diagrams.domain.listing import ListingPage
 from easy_diagrams.views.diagrams import Diagrams
 
 
@@ -45,33 +48,27 @@ class TestFolderViews:
         request.params = {"folder_id": "folder123"}
         request.registry.settings = {"diagrams.page_size": "10"}
 
-        # Mock diagram repo
-        diagram_repo = Mock()
-        diagram_repo.list = Mock(return_value=[])
-        diagram_repo.count = Mock(return_value=0)
-
-        # Mock folder repo
-        folder_repo = Mock()
-        folders = [
+        folders = (
             FolderListItem(
                 id="subfolder1",
                 name="Subfolder",
                 parent_id="folder123",
                 created_at=datetime.now(),
                 updated_at=datetime.now(),
+            ),
+        )
+        listing_query = Mock()
+        listing_query.page = Mock(
+            return_value=ListingPage(
+                folders=folders,
+                diagrams=(),
+                total=1,
+                current_folder=Folder(
+                    id="folder123", organization_id=uuid4(), name="Parent Folder"
+                ),
             )
-        ]
-        folder_repo.list = Mock(return_value=folders)
-        folder_repo.count = Mock(return_value=1)
-        folder_repo.get = Mock(return_value=Mock(name="Parent Folder"))
-
-        def mock_find_service(interface):
-            if "IDiagramRepo" in str(interface):
-                return diagram_repo
-            elif "IFolderRepo" in str(interface):
-                return folder_repo
-
-        request.find_service = mock_find_service
+        )
+        request.find_service = Mock(return_value=listing_query)
 
         view = Diagrams(request)
 
@@ -80,10 +77,9 @@ class TestFolderViews:
         assert "folders" in result
         assert len(result["folders"]) == 1
         assert result["folders"][0].name == "Subfolder"
-        assert result["current_folder"] is not None
-        diagram_repo.list.assert_called_once_with(
-            offset=0, limit=9, folder_id="folder123"
-        )
-        folder_repo.list.assert_called_once_with(
-            parent_id="folder123", offset=0, limit=1
+        assert result["current_folder"].name == "Parent Folder"
+        assert result["page_listing"].num_pages == 1
+        assert not result["page_listing"].has_next
+        listing_query.page.assert_called_once_with(
+            folder_id="folder123", limit=10, after=None, before=None
         )
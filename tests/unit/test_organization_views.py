@@ -1,7 +1,9 @@
 from pyramid.httpexceptions import HTTPFound
 from pyramid.testing import DummyRequest
 
+from easy_diagrams.domain.organization import MemberImport
 from easy_diagrams.domain.organization import OrganizationID
+from easy_diagrams.services.organization_repo import split_emails
 from easy_diagrams.views.organizations import OrganizationDetailView
 from easy_diagrams.views.organizations import OrganizationsView
 from easy_diagrams.views.organizations import OrganizationUsersView
@@ -114,6 +116,46 @@ class TestOrganizationUsersView:
         mock_organization_repo.add_user.assert_not_called()
         assert isinstance(result, HTTPFound)
 
+    def test_organization_import_users(self, mock_organization_repo):
+        request = DummyRequest(
+            matchdict={"organization_id": "test-id"},
+            POST={"emails": "a@example.com, b@example.com\nbob"},
+        )
+        view = OrganizationUsersView(request)
+        view.organization_repo = mock_organization_repo
+        mock_organization_repo.add_users.return_value = MemberImport()
+
+        result = view.organization_import_users()
+
+        mock_organization_repo.add_users.assert_called_once_with(
+            OrganizationID("test-id"), ["a@example.com", "b@example.com", "bob"], False
+        )
+        assert result["report"] == MemberImport()
+
+
+class TestSplitEmails:
+    def test_pasted_emails(self):
+        text = (
+            "a@example.com, b@example.com;c@example.com\n d@example.com e@example.com"
+        )
+        assert split_emails(text) == [
+            "a@example.com",
+            "b@example.com",
+            "c@example.com",
+            "d@example.com",
+            "e@example.com",
+        ]
+
+    def test_csv(self):
+        text = 'Name,Email\n"Doe, John",john@example.com\nJane,\nAnn <ann@example.com>,'
+        assert split_emails(text) == ["john@example.com", "Jane,", "ann@example.com"]
+
+    def test_first_row_with_emails_is_not_a_header(self):
+        assert split_emails("a@example.com\nnot-an-email") == [
+            "a@example.com",
+            "not-an-email",
+        ]
+
 
 class TestOrganizationUserView:
     def test_organization_user_actions_delete(self, mock_organization_repo):
@@ -0,0 +1,128 @@
+from uuid import uuid4
+
+import pytest
+
+from easy_diagrams.caching import LRUCache
+from easy_diagrams.domain.diagram import Diagram
+from easy_diagrams.services.diagram_renderer import PlantUMLRendererService
+from easy_diagrams.services.render_cache import RenderCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_lru_cache_is_bounded_by_weight():
+    cache = LRUCache(10, weigh=len)
+    cache.set("a", b"12345")
+    cache.set("b", b"12345")
+    cache.set("c", b"1")
+    assert "a" not in cache
+    assert cache.weight == 6
+    cache.set("d", b"12345678901")  # larger than the cache itself
+    assert "d" not in cache
+
+
+def test_lru_cache_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr("easy_diagrams.caching.time.monotonic", clock)
+    cache = LRUCache(10, ttl=5)
+    cache.set("a", 1)
+    clock.now = 4
+    assert cache.get("a") == 1
+    clock.now = 6
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_lru_cache_counters():
+    cache = LRUCache(10)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("b")
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_render_cache_key():
+    cache = RenderCache("1.2025.3")
+    key = cache.key("@startuml\nA -> B\n@enduml")
+    # insignificant whitespace doesn't change the key
+    assert key == cache.key("\r\n@startuml  \r\nA -> B\r\n@enduml\r\n\r\n")
+    assert key != cache.key("@startuml\nA -> C\n@enduml")
+    assert key != cache.key("@startuml\nA -> B\n@enduml", file_format="svg")
+    assert key != RenderCache("1.2025.4").key("@startuml\nA -> B\n@enduml")
+
+
+def test_render_cache_version_is_resolved_lazily():
+    calls = []
+    cache = RenderCache(lambda: calls.append(1) or "1.2025.3")
+    assert not calls
+    cache.key("A")
+    cache.key("B")
+    assert cache.plantuml_version == "1.2025.3"
+    assert len(calls) == 1
+
+
+def test_render_cache_disk_tier_is_shared(tmp_path):
+    cache = RenderCache("1", directory=str(tmp_path))
+    key = cache.key("A")
+    cache.set(key, b"image")
+
+    other_process = RenderCache("1", directory=str(tmp_path))
+    assert other_process.get(key) == b"image"
+    assert other_process.stats["disk_hits"] == 1
+    # promoted to the memory tier
+    assert other_process.get(key) == b"image"
+    assert other_process.stats["memory_hits"] == 1
+    assert other_process.stats["disk_hits"] == 1
+
+
+def test_render_cache_disk_tier_eviction(tmp_path):
+    cache = RenderCache("1", directory=str(tmp_path), max_disk_bytes=25)
+    keys = [cache.key(str(i)) for i in range(4)]
+    for key in keys:
+        cache.set(key, b"0123456789")
+    disk = RenderCache("1", directory=str(tmp_path))
+    assert disk.get(keys[0]) is None
+    assert disk.get(keys[3]) == b"0123456789"
+
+
+class FakePool:
+    def __init__(self, image=b"image"):
+        self.image = image
+        self.calls = 0
+
+    def render(self, code, file_format="png", slot=None):
+        self.calls += 1
+        return self.image
+
+
+def diagram(code):
+    return Diagram(
+        id="1", organization_id=uuid4(), title=None, is_public=False, code=code
+    )
+
+
+@pytest.mark.parametrize("image, calls", [(b"image", 1), (b"", 2)])
+def test_renderer_uses_cache(image, calls):
+    pool = FakePool(image)
+    renderer = PlantUMLRendererService({}, pool=pool, cache=RenderCache("1"))
+    assert renderer.render(diagram("A")) == image
+    assert renderer.render(diagram("A ")) == image
+    # failed renders are not cached
+    assert pool.calls == calls
@@ -0,0 +1,61 @@
+from unittest.mock import Mock
+
+import pytest
+import transaction
+
+from easy_diagrams.domain.diagram import PendingRender
+from easy_diagrams.scripts import render_worker
+
+
+def test_failed_render_does_not_stop_worker(monkeypatch):
+    jobs = [
+        PendingRender(id="broken", code="A ->", code_version=1),
+        PendingRender(id="failed", code="A -> C", code_version=1),
+        PendingRender(id="unstored", code="A -> D", code_version=1),
+        PendingRender(id="diagram", code="A -> B", code_version=1),
+    ]
+    worker = Mock()
+    worker.claim = Mock(return_value=jobs)
+
+    def render(job):
+        if job.id == "broken":
+            raise TimeoutError("PlantUML did not respond")
+        return {"png": b"image", "svg": b"" if job.id == "failed" else b"image"}
+
+    worker.render = Mock(side_effect=render)
+    worker.apply = Mock(side_effect=[RuntimeError("database is gone"), True])
+    monkeypatch.setattr(render_worker, "RenderWorker", Mock(return_value=worker))
+    request = Mock()
+    request.registry.settings = {}
+    request.tm = transaction.TransactionManager(explicit=True)
+
+    # a single pass, the failed renders stay claimed until their claim expires
+    render_worker.run(request, once=True)
+
+    worker.claim.assert_called_once_with(10)
+    images = {"png": b"image", "svg": b"image"}
+    assert [call.args for call in worker.apply.call_args_list] == [
+        (jobs[2], images),
+        (jobs[3], images),
+    ]
+
+
+def test_worker_sleeps_without_progress(monkeypatch):
+    worker = Mock()
+    worker.claim = Mock(
+        side_effect=[[PendingRender(id="stale", code="A", code_version=1)], []]
+    )
+    worker.render = Mock(return_value={"png": b"image", "svg": b"image"})
+    worker.apply = Mock(return_value=False)
+    monkeypatch.setattr(render_worker, "RenderWorker", Mock(return_value=worker))
+    sleep = Mock(side_effect=[None, StopIteration])
+    monkeypatch.setattr(render_worker.time, "sleep", sleep)
+    request = Mock()
+    request.registry.settings = {"render_worker.poll_interval": "2"}
+    request.tm = transaction.TransactionManager(explicit=True)
+
+    with pytest.raises(StopIteration):
+        render_worker.run(request)
+
+    # a batch of stale renders is no progress, the worker pauses after it
+    assert [call.args for call in sleep.call_args_list] == [(2.0,), (2.0,)]